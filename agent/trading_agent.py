@@ -3,27 +3,36 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 import json
-from anthropic import Anthropic
 from typing import Dict, Any, Optional
 
 from config.settings import settings
 from services.context_builder import ContextBuilder
+from services.metrics import metrics
+from services.cassette import cassette
+from services.container import container
 
 
 class TradingAgent:
-    def __init__(self):
-        self.client = Anthropic(api_key=settings.llm.anthropic_api_key)
-        self.context_builder = ContextBuilder()
+    def __init__(self, context_builder: Optional[ContextBuilder] = None):
+        self.client = container.anthropic()
+        self.context_builder = context_builder or ContextBuilder()
         self.model = "claude-sonnet-4-20250514"
     
-    def get_trading_decision(self, coins: list = None) -> Dict[str, Any]:
-        """Chiede all'LLM una decisione di trading"""
+    def get_trading_decision(self, coins: list = None, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Chiede all'LLM una decisione di trading (context: già costruito nel ciclo)"""
         
         # Costruisci context
-        context_prompt = self.context_builder.build_prompt_context(coins)
+        if context is None:
+            context = self.context_builder.build_context(coins)
+        context_prompt = self.context_builder.build_prompt_context(coins, context=context)
+        
+        # Coin ammesse: quelle analizzate (es. scelte dallo scanner) più quelle in posizione
+        positions = [p["coin"] for p in context.get("portfolio", {}).get("positions", [])]
+        allowed = list(dict.fromkeys(list(coins or settings.trading.trading_coins) + positions))
+        coin_choices = " | ".join(f'"{coin}"' for coin in allowed)
         
         # System prompt
-        system_prompt = """You are an expert cryptocurrency trading agent. Your job is to analyze market data and make trading decisions.
+        system_prompt = f"""You are an expert cryptocurrency trading agent. Your job is to analyze market data and make trading decisions.
 
 RULES:
 1. Be conservative - only trade when there's high confluence
@@ -33,16 +42,16 @@ RULES:
 5. Explain your reasoning clearly
 
 OUTPUT FORMAT (respond ONLY with this JSON):
-{
+{{
     "decision": "OPEN_LONG" | "OPEN_SHORT" | "CLOSE" | "HOLD",
-    "coin": "BTC" | "ETH" | null,
+    "coin": {coin_choices} | null,
     "confidence": 0.0-1.0,
     "size_pct": 0-20,
     "leverage": 1-10,
     "stop_loss_pct": 1-5,
     "take_profit_pct": 2-10,
     "reasoning": "Brief explanation of why"
-}
+}}
 
 If no good opportunity exists, return decision: "HOLD" with reasoning."""
 
@@ -53,17 +62,19 @@ Based on the above market context, what is your trading decision?
 Respond ONLY with the JSON format specified."""
 
         try:
-            response = self.client.messages.create(
-                model=self.model,
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": user_prompt}
-                ],
-                system=system_prompt
-            )
-            
-            # Parse response
-            response_text = response.content[0].text
+            # Il prompt contiene timestamp: in replay le risposte sono servite in ordine per modello
+            with metrics.span("llm.messages_create", upstream="anthropic", histogram="llm_latency_seconds"):
+                response_text = cassette.call(
+                    "anthropic", "messages.create", self.model,
+                    lambda: self.client.messages.create(
+                        model=self.model,
+                        max_tokens=1000,
+                        messages=[
+                            {"role": "user", "content": user_prompt}
+                        ],
+                        system=system_prompt
+                    ).content[0].text
+                )
             
             # Estrai JSON dalla risposta
             decision = self._parse_decision(response_text)
@@ -13,9 +13,15 @@ class DatabaseSettings(BaseModel):
     driver: str = os.getenv("DB_DRIVER", "ODBC Driver 17 for SQL Server")
     user: Optional[str] = os.getenv("DB_USER") or None
     password: Optional[str] = os.getenv("DB_PASSWORD") or None
+    # URL SQLAlchemy completo (es. sqlite:///trading.db, duckdb:///trading.duckdb): ha la precedenza
+    url: Optional[str] = os.getenv("DB_URL") or None
+    # Righe per batch nelle scritture massive delle candele
+    bulk_batch_rows: int = int(os.getenv("DB_BULK_BATCH_ROWS", "50000"))
 
     @property
     def connection_string(self) -> str:
+        if self.url:
+            return self.url
         if self.user and self.password:
             return (
                 f"mssql+pyodbc://{self.user}:{self.password}@{self.server}/{self.name}"
@@ -50,17 +56,139 @@ class TradingSettings(BaseModel):
     max_position_size_pct: float = float(os.getenv("MAX_POSITION_SIZE_PCT", "20"))
     max_total_exposure_pct: float = float(os.getenv("MAX_TOTAL_EXPOSURE_PCT", "50"))
     max_daily_loss_pct: float = float(os.getenv("MAX_DAILY_LOSS_PCT", "5"))
+    max_account_leverage: float = float(os.getenv("MAX_ACCOUNT_LEVERAGE", "5"))
     default_leverage: int = int(os.getenv("DEFAULT_LEVERAGE", "3"))
     default_slippage: float = float(os.getenv("DEFAULT_SLIPPAGE", "0.01"))
+    max_slippage: float = float(os.getenv("MAX_SLIPPAGE", "0.03"))
+    slippage_buffer: float = float(os.getenv("SLIPPAGE_BUFFER", "0.002"))
+    split_interval_seconds: float = float(os.getenv("SPLIT_INTERVAL_SECONDS", "2"))
+    flatten_slippage: float = float(os.getenv("FLATTEN_SLIPPAGE", "0.02"))
+    flatten_retries: int = int(os.getenv("FLATTEN_RETRIES", "2"))
+    algo_threshold_usd: float = float(os.getenv("ALGO_THRESHOLD_USD", "25000"))
+    algo_type: str = os.getenv("ALGO_TYPE", "twap").lower()
+    algo_timeout_seconds: float = float(os.getenv("ALGO_TIMEOUT_SECONDS", "900"))
+    twap_slices: int = int(os.getenv("TWAP_SLICES", "5"))
+    twap_duration_seconds: float = float(os.getenv("TWAP_DURATION_SECONDS", "300"))
+    iceberg_depth_fraction: float = float(os.getenv("ICEBERG_DEPTH_FRACTION", "0.5"))
+    iceberg_refresh_seconds: float = float(os.getenv("ICEBERG_REFRESH_SECONDS", "10"))
+    meta_ttl_seconds: float = float(os.getenv("META_TTL_SECONDS", "3600"))
+    account_state_ttl_seconds: float = float(os.getenv("ACCOUNT_STATE_TTL_SECONDS", "30"))
+    candle_cache_ttl_seconds: float = float(os.getenv("CANDLE_CACHE_TTL_SECONDS", "60"))
+    indicator_workers: int = int(os.getenv("INDICATOR_WORKERS", "0"))
+    indicator_timeout_seconds: float = float(os.getenv("INDICATOR_TIMEOUT_SECONDS", "20"))
+    mtf_timeframes: List[str] = [tf.strip() for tf in os.getenv("MTF_TIMEFRAMES", "").split(",") if tf.strip()]
+    strategies_file: str = os.getenv("STRATEGIES_FILE", str(ROOT_DIR / "strategies.json"))
     trading_coins: List[str] = os.getenv("TRADING_COINS", "BTC,ETH,SOL").split(",")
 
 
+class MetricsSettings(BaseModel):
+    enabled: bool = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+    port: int = int(os.getenv("METRICS_PORT", "9108"))
+    trace_file: str = os.getenv("METRICS_TRACE_FILE", "")
+
+
+class MonitorSettings(BaseModel):
+    enabled: bool = os.getenv("MONITOR_ENABLED", "true").lower() == "true"
+    use_ws: bool = os.getenv("MONITOR_USE_WS", "true").lower() == "true"
+    poll_seconds: float = float(os.getenv("MONITOR_POLL_SECONDS", "5"))
+    # Senza messaggi WS (allMids arriva di continuo) per più di così si passa al polling
+    ws_stale_seconds: float = float(os.getenv("MONITOR_WS_STALE_SECONDS", "30"))
+
+
+class CassetteSettings(BaseModel):
+    mode: str = os.getenv("CASSETTE_MODE", "off").lower()
+    path: str = os.getenv("CASSETTE_PATH", str(ROOT_DIR / "cassettes" / "session.jsonl.gz"))
+    speed: float = float(os.getenv("CASSETTE_SPEED", "0"))
+
+
+class UniverseSettings(BaseModel):
+    enabled: bool = os.getenv("UNIVERSE_SCAN_ENABLED", "false").lower() == "true"
+    top_k: int = int(os.getenv("UNIVERSE_TOP_K", "5"))
+    min_volume_usd: float = float(os.getenv("UNIVERSE_MIN_VOLUME_USD", "5000000"))
+    min_open_interest_usd: float = float(os.getenv("UNIVERSE_MIN_OPEN_INTEREST_USD", "2000000"))
+    max_impact_spread_pct: float = float(os.getenv("UNIVERSE_MAX_IMPACT_SPREAD_PCT", "0.5"))
+    history_size: int = int(os.getenv("UNIVERSE_HISTORY_SIZE", "24"))
+
+
+class DerivativesSettings(BaseModel):
+    enabled: bool = os.getenv("DERIVATIVES_ENABLED", "true").lower() == "true"
+    window: int = int(os.getenv("DERIVATIVES_WINDOW", "48"))
+    sample_seconds: float = float(os.getenv("DERIVATIVES_SAMPLE_SECONDS", "300"))
+    persist: bool = os.getenv("DERIVATIVES_PERSIST", "true").lower() == "true"
+    warm_start_hours: float = float(os.getenv("DERIVATIVES_WARM_START_HOURS", "72"))
+
+
+class NewsSettings(BaseModel):
+    store_enabled: bool = os.getenv("NEWS_STORE_ENABLED", "true").lower() == "true"
+    poll_seconds: float = float(os.getenv("NEWS_POLL_SECONDS", "900"))
+    max_pages: int = int(os.getenv("NEWS_MAX_PAGES", "3"))
+    window_hours: float = float(os.getenv("NEWS_WINDOW_HOURS", "24"))
+
+
+class SentimentSettings(BaseModel):
+    store_enabled: bool = os.getenv("SENTIMENT_STORE_ENABLED", "true").lower() == "true"
+    poll_seconds: float = float(os.getenv("SENTIMENT_POLL_SECONDS", "3600"))
+
+
+class GatewaySettings(BaseModel):
+    weight_per_minute: float = float(os.getenv("GATEWAY_WEIGHT_PER_MINUTE", "1000"))
+    cache_seconds: float = float(os.getenv("GATEWAY_CACHE_SECONDS", "1"))
+    max_retries: int = int(os.getenv("GATEWAY_MAX_RETRIES", "2"))
+
+
+class BreakerSettings(BaseModel):
+    enabled: bool = os.getenv("BREAKER_ENABLED", "true").lower() == "true"
+    failure_threshold: int = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "3"))
+    reset_seconds: float = float(os.getenv("BREAKER_RESET_SECONDS", "60"))
+
+
+class CheckpointSettings(BaseModel):
+    enabled: bool = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+    path: str = os.getenv("CHECKPOINT_PATH", str(ROOT_DIR / "checkpoints" / "state.bin"))
+    interval_seconds: float = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", "300"))
+    max_age_hours: float = float(os.getenv("CHECKPOINT_MAX_AGE_HOURS", "24"))
+
+
+class ApprovalSettings(BaseModel):
+    ttl_seconds: float = float(os.getenv("APPROVAL_TTL_SECONDS", "300"))
+    max_drift_pct: float = float(os.getenv("APPROVAL_MAX_DRIFT_PCT", "0.5"))
+    port: int = int(os.getenv("APPROVAL_PORT", "9109"))
+    directory: str = os.getenv("APPROVAL_DIR", str(ROOT_DIR / "approvals"))
+
+
+class RetentionSettings(BaseModel):
+    # Candele CANDLE_SOURCE più vecchie di CANDLE_DAYS: aggregate nei CANDLE_TARGETS e cancellate
+    candle_source: str = os.getenv("RETENTION_CANDLE_SOURCE", "1m")
+    candle_days: float = float(os.getenv("RETENTION_CANDLE_DAYS", "30"))
+    candle_targets: List[str] = [tf.strip() for tf in os.getenv("RETENTION_CANDLE_TARGETS", "5m,1h").split(",") if tf.strip()]
+    # Decisioni e snapshot più vecchi: archiviati in Parquet e cancellati
+    decision_days: float = float(os.getenv("RETENTION_DECISION_DAYS", "90"))
+    snapshot_days: float = float(os.getenv("RETENTION_SNAPSHOT_DAYS", "30"))
+    # Mai meno di DERIVATIVES_WARM_START_HOURS, che servono al warm start
+    derivatives_days: float = float(os.getenv("RETENTION_DERIVATIVES_DAYS", "7"))
+    archive_dir: str = os.getenv("RETENTION_ARCHIVE_DIR", str(ROOT_DIR / "archive"))
+    compression: str = os.getenv("RETENTION_COMPRESSION", "zstd")
+    batch_rows: int = int(os.getenv("RETENTION_BATCH_ROWS", "10000"))
+
+
 class Settings:
     def __init__(self):
         self.database = DatabaseSettings()
         self.hyperliquid = HyperliquidSettings()
         self.llm = LLMSettings()
         self.trading = TradingSettings()
+        self.metrics = MetricsSettings()
+        self.cassette = CassetteSettings()
+        self.monitor = MonitorSettings()
+        self.universe = UniverseSettings()
+        self.derivatives = DerivativesSettings()
+        self.news = NewsSettings()
+        self.sentiment = SentimentSettings()
+        self.approval = ApprovalSettings()
+        self.gateway = GatewaySettings()
+        self.breaker = BreakerSettings()
+        self.checkpoint = CheckpointSettings()
+        self.retention = RetentionSettings()
         self.root_dir = ROOT_DIR
         self.cryptopanic_api_key = os.getenv("CRYPTOPANIC_API_KEY", "")
 
@@ -1,2 +1,2 @@
-from .connection import engine, SessionLocal, get_db, init_db, test_connection
-from .models import Base, Trade, Decision, Candle, MarketSnapshot, DailyStats
\ No newline at end of file
+from .connection import engine, SessionLocal, get_db, init_db, ensure_schema, upgrade_db, test_connection
+from .models import Base, Trade, Decision, Candle, DerivativesSnapshot, NewsPost, NewsTag, SentimentPoint, MarketSnapshot, DailyStats
\ No newline at end of file
@@ -0,0 +1,219 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import time
+from typing import Dict, Any, List
+
+import numpy as np
+
+from config.settings import settings
+from services.candle_buffer import CandleBuffer
+from services.metrics import metrics
+
+
+# SQL Server: OPEN, CLOSE e TIMESTAMP sono parole chiave, vanno tra parentesi quadre
+MSSQL_STAGE = """
+IF OBJECT_ID('tempdb..#candles_stage') IS NOT NULL DROP TABLE #candles_stage;
+CREATE TABLE #candles_stage (
+    coin VARCHAR(10) NOT NULL,
+    timeframe VARCHAR(5) NOT NULL,
+    [timestamp] DATETIME NOT NULL,
+    [open] FLOAT NOT NULL,
+    high FLOAT NOT NULL,
+    low FLOAT NOT NULL,
+    [close] FLOAT NOT NULL,
+    volume FLOAT NOT NULL
+);
+"""
+
+MSSQL_MERGE = """
+MERGE candles WITH (HOLDLOCK) AS target
+USING #candles_stage AS source
+ON target.coin = source.coin AND target.timeframe = source.timeframe AND target.[timestamp] = source.[timestamp]
+WHEN MATCHED THEN UPDATE SET
+    [open] = source.[open], high = source.high, low = source.low, [close] = source.[close], volume = source.volume
+WHEN NOT MATCHED THEN
+    INSERT (coin, timeframe, [timestamp], [open], high, low, [close], volume)
+    VALUES (source.coin, source.timeframe, source.[timestamp], source.[open], source.high, source.low, source.[close], source.volume);
+TRUNCATE TABLE #candles_stage;
+"""
+
+SQLITE_UPSERT = """
+INSERT INTO candles (coin, timeframe, timestamp, open, high, low, close, volume)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (coin, timeframe, timestamp) DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close, volume = excluded.volume
+"""
+
+# DuckDB non ha autoincrement senza sequenza: l'id si calcola dal massimo corrente
+DUCKDB_UPSERT = """
+INSERT INTO candles (id, coin, timeframe, "timestamp", open, high, low, close, volume)
+SELECT (SELECT COALESCE(MAX(id), 0) FROM candles) + row_number() OVER (), ?, ?, t, o, h, l, c, v
+FROM candles_stage
+ON CONFLICT (coin, timeframe, "timestamp") DO UPDATE SET
+    open = excluded.open, high = excluded.high, low = excluded.low, close = excluded.close, volume = excluded.volume
+"""
+
+
+class CandleStore:
+    """
+    Scrittura massiva e idempotente nella tabella candles.
+
+    La chiave è (coin, timeframe, timestamp), con l'indice unico
+    ix_candles_coin_tf_ts: ripetere un backfill aggiorna le candele già
+    presenti invece di duplicarle. Niente ORM, un percorso per dialetto:
+    - SQL Server: pyodbc fast_executemany in una tabella temporanea, poi MERGE
+    - SQLite: executemany con INSERT ... ON CONFLICT DO UPDATE
+    - DuckDB: tabella Arrow registrata e INSERT ... SELECT ... ON CONFLICT
+    Le righe arrivano come array (t int64 in ms, ohlcv (5, n)), gli stessi
+    del CandleBuffer, e vengono scritte a batch di DB_BULK_BATCH_ROWS.
+    """
+
+    def __init__(self, engine=None, batch_rows: int = None):
+        if engine is None:
+            from database.connection import engine
+        self.engine = engine
+        self.batch_rows = batch_rows or settings.database.bulk_batch_rows
+        self.dialect = engine.dialect.name
+
+        writers = {"mssql": self._write_mssql, "sqlite": self._write_sqlite, "duckdb": self._write_duckdb}
+        if self.dialect not in writers:
+            raise ValueError(f"Bulk candle upsert not supported on {self.dialect}")
+        self._write = writers[self.dialect]
+
+    def upsert(self, coin: str, timeframe: str, t: np.ndarray, ohlcv: np.ndarray) -> int:
+        """Inserisce o aggiorna le candele (t unici, come in un CandleBuffer); ritorna le righe scritte"""
+        if not len(t):
+            return 0
+        with metrics.span("db.candles_upsert", dialect=self.dialect):
+            self._write(coin, timeframe, t, ohlcv)
+        metrics.inc("candles_upserted_total", value=len(t), timeframe=timeframe)
+        return len(t)
+
+    def upsert_candles(self, coin: str, timeframe: str, candles: List[Dict[str, Any]]) -> int:
+        """Come upsert(), da candele in formato Hyperliquid (ordinate e senza duplicati dal buffer)"""
+        buffer = CandleBuffer(max(len(candles), 1))
+        buffer.extend(candles)
+        return self.upsert(coin, timeframe, *buffer.arrays())
+
+    def _batches(self, n: int):
+        for start in range(0, n, self.batch_rows):
+            yield slice(start, min(start + self.batch_rows, n))
+
+    def _rows(self, coin: str, timeframe: str, timestamps: list, ohlcv: np.ndarray) -> list:
+        columns = [timestamps] + [row.tolist() for row in ohlcv]
+        return [(coin, timeframe) + values for values in zip(*columns)]
+
+    # ---------- dialetti ----------
+
+    def _write_mssql(self, coin: str, timeframe: str, t: np.ndarray, ohlcv: np.ndarray):
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            cursor.execute(MSSQL_STAGE)
+            cursor.fast_executemany = True
+            for batch in self._batches(len(t)):
+                timestamps = t[batch].astype("datetime64[ms]").tolist()
+                cursor.executemany(
+                    "INSERT INTO #candles_stage VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._rows(coin, timeframe, timestamps, ohlcv[:, batch])
+                )
+                cursor.execute(MSSQL_MERGE)
+                raw.commit()
+            cursor.execute("DROP TABLE #candles_stage")
+            raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    def _write_sqlite(self, coin: str, timeframe: str, t: np.ndarray, ohlcv: np.ndarray):
+        raw = self.engine.raw_connection()
+        try:
+            cursor = raw.cursor()
+            for batch in self._batches(len(t)):
+                # Stesso formato testuale con cui SQLAlchemy salva i DateTime su SQLite
+                timestamps = np.char.replace(np.datetime_as_string(t[batch].astype("datetime64[ms]").astype("datetime64[us]")), "T", " ").tolist()
+                cursor.executemany(SQLITE_UPSERT, self._rows(coin, timeframe, timestamps, ohlcv[:, batch]))
+                raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+    def _write_duckdb(self, coin: str, timeframe: str, t: np.ndarray, ohlcv: np.ndarray):
+        import pyarrow as pa
+
+        raw = self.engine.raw_connection()
+        try:
+            con = raw.driver_connection
+            for batch in self._batches(len(t)):
+                # Colonne Arrow sopra gli array numpy, senza conversione riga per riga
+                stage = pa.table({
+                    "t": pa.array(t[batch].astype("datetime64[ms]")),
+                    **{field: pa.array(np.ascontiguousarray(ohlcv[row, batch])) for row, field in enumerate("ohlcv")},
+                })
+                con.register("candles_stage", stage)
+                try:
+                    con.execute(DUCKDB_UPSERT, [coin, timeframe])
+                finally:
+                    con.unregister("candles_stage")
+                raw.commit()
+        except Exception:
+            raw.rollback()
+            raise
+        finally:
+            raw.close()
+
+
+def backfill(coin: str, timeframe: str, days: float, store: CandleStore = None, client=None) -> int:
+    """
+    Scarica da Hyperliquid le candele degli ultimi `days` giorni a finestre
+    di 5000 e le scrive con CandleStore. Hyperliquid conserva solo le
+    ultime 5000 candele per timeframe: le finestre più vecchie tornano vuote.
+    Ritorna le candele scritte.
+    """
+    from services.hyperliquid_client import INTERVAL_MS
+    from services.container import container
+
+    store = store or CandleStore()
+    client = client or container.hyperliquid_client()
+    step = INTERVAL_MS[timeframe]
+    window = 5000 * step
+
+    end = int(time.time() * 1000)
+    start = end - int(days * 86400 * 1000)
+    written = 0
+    while start < end:
+        candles = client.get_candles_range(coin, timeframe, start, min(start + window, end))
+        written += store.upsert_candles(coin, timeframe, candles)
+        start += window
+    return written
+
+
+# Test
+if __name__ == "__main__":
+    from sqlalchemy import create_engine, text
+    from database.models import Base
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    store = CandleStore(engine)
+
+    n = 500_000
+    t = np.arange(n, dtype=np.int64) * 60_000 + 1_700_000_000_000
+    ohlcv = np.tile(np.linspace(100, 200, n), (5, 1))
+
+    start = time.perf_counter()
+    store.upsert("BTC", "1m", t, ohlcv)
+    elapsed = time.perf_counter() - start
+    print(f"Inserted {n:,} candles in {elapsed:.2f}s ({n / elapsed:,.0f} rows/s)")
+
+    # Secondo passaggio: stesse chiavi, nessun duplicato
+    store.upsert("BTC", "1m", t[-1000:], ohlcv[:, -1000:] + 1)
+    with engine.connect() as conn:
+        count, close = conn.execute(text("SELECT COUNT(*), MAX(close) FROM candles")).one()
+    print(f"Rows after re-upsert: {count:,} (max close {close})")
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine, text
+import threading
+
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.orm import sessionmaker
 import sys
 from pathlib import Path
@@ -27,8 +29,62 @@ def get_db():
         db.close()
 
 
+# Colonne aggiunte a tabelle già esistenti: create_all non altera le tabelle create in passato
+COLUMN_UPGRADES = [
+    ("trades", "account"),
+    ("trades", "sl_order_id"),
+    ("trades", "tp_order_id"),
+]
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def upgrade_db() -> int:
+    """Aggiunge (con i loro indici) le colonne mancanti alle tabelle esistenti; idempotente"""
+    inspector = inspect(engine)
+    added = 0
+    with engine.begin() as conn:
+        for table_name, column_name in COLUMN_UPGRADES:
+            if not inspector.has_table(table_name):
+                continue
+            if column_name in {c["name"] for c in inspector.get_columns(table_name)}:
+                continue
+
+            table = Base.metadata.tables[table_name]
+            column = table.c[column_name]
+            column_type = column.type.compile(dialect=engine.dialect)
+            conn.execute(text(f"ALTER TABLE {table_name} ADD {column_name} {column_type} NULL"))
+            for index in table.indexes:
+                if column_name in index.columns:
+                    index.create(conn)
+            print(f"✅ Added column {table_name}.{column_name}")
+            added += 1
+
+        # Trade precedenti al multi-strategy: appartengono all'account di default (HL_ACCOUNT_ADDRESS)
+        default_account = settings.hyperliquid.account_address
+        if default_account and inspector.has_table("trades"):
+            adopted = conn.execute(
+                text("UPDATE trades SET account = :account WHERE account IS NULL"), {"account": default_account}
+            ).rowcount
+            if adopted:
+                print(f"✅ Assigned {adopted} legacy trade(s) to {default_account}")
+    return added
+
+
+def ensure_schema():
+    """Tabelle nuove e colonne mancanti, una volta per processo prima del primo uso dell'ORM"""
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        Base.metadata.create_all(bind=engine)
+        upgrade_db()
+        _schema_ready = True
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
+    ensure_schema()
     print("✅ Tables created!")
 
 
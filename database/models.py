@@ -1,5 +1,5 @@
 from sqlalchemy import (
-    Column, Integer, Float, String, DateTime, Text,
+    Column, Integer, BigInteger, Float, String, DateTime, Text,
     ForeignKey, Boolean, Index, Enum as SQLEnum
 )
 
@@ -35,6 +35,7 @@ class Trade(Base):
     timestamp_open = Column(DateTime, nullable=False, index=True)
     timestamp_close = Column(DateTime, nullable=True)
 
+    account = Column(String(42), nullable=True, index=True)
     coin = Column(String(10), nullable=False, index=True)
     direction = Column(SQLEnum(TradeDirection), nullable=False)
 
@@ -42,6 +43,8 @@ class Trade(Base):
     exit_price = Column(Float, nullable=True)
     sl_price = Column(Float, nullable=True)
     tp_price = Column(Float, nullable=True)
+    sl_order_id = Column(BigInteger, nullable=True)
+    tp_order_id = Column(BigInteger, nullable=True)
 
     size = Column(Float, nullable=False)
     size_usd = Column(Float, nullable=True)
@@ -95,8 +98,83 @@ class Candle(Base):
     close = Column(Float, nullable=False)
     volume = Column(Float, nullable=False)
 
+    # Unico: le scritture massive (database/candle_store.py) fanno upsert su questa chiave
     __table_args__ = (
-        Index('ix_candles_coin_tf_ts', 'coin', 'timeframe', 'timestamp'),
+        Index('ix_candles_coin_tf_ts', 'coin', 'timeframe', 'timestamp', unique=True),
+    )
+
+
+class DerivativesSnapshot(Base):
+    __tablename__ = 'derivatives_snapshots'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, nullable=False, index=True)
+    coin = Column(String(20), nullable=False)
+
+    funding = Column(Float, nullable=False)
+    open_interest = Column(Float, nullable=False)
+    premium = Column(Float, nullable=True)
+    mark_price = Column(Float, nullable=False)
+    oracle_price = Column(Float, nullable=True)
+    day_volume_usd = Column(Float, nullable=True)
+
+    __table_args__ = (
+        Index('ix_derivatives_coin_ts', 'coin', 'timestamp'),
+    )
+
+
+class NewsPost(Base):
+    __tablename__ = 'news_posts'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    external_id = Column(String(64), nullable=True, index=True)
+    url_hash = Column(String(40), nullable=False, unique=True)
+    title_hash = Column(String(40), nullable=False, index=True)
+
+    title = Column(String(500), nullable=False)
+    source = Column(String(100), nullable=True)
+    url = Column(String(1000), nullable=True)
+    published_at = Column(DateTime, nullable=False, index=True)
+    fetched_at = Column(DateTime, default=datetime.utcnow)
+
+    sentiment = Column(String(10), nullable=False)
+    votes_positive = Column(Integer, default=0)
+    votes_negative = Column(Integer, default=0)
+
+    tags = relationship("NewsTag", back_populates="post", cascade="all, delete-orphan")
+
+    def __repr__(self):
+        return f"<NewsPost {self.id}: {self.title[:30]}>"
+
+
+class NewsTag(Base):
+    __tablename__ = 'news_tags'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    post_id = Column(Integer, ForeignKey('news_posts.id'), nullable=False, index=True)
+    coin = Column(String(20), nullable=False)
+    # Copia di NewsPost.published_at: l'indice (coin, published_at) basta per le letture per coin
+    published_at = Column(DateTime, nullable=False)
+    sentiment = Column(String(10), nullable=False)
+
+    post = relationship("NewsPost", back_populates="tags")
+
+    __table_args__ = (
+        Index('ix_news_tags_coin_published', 'coin', 'published_at'),
+    )
+
+
+class SentimentPoint(Base):
+    __tablename__ = 'sentiment_history'
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    source = Column(String(20), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    value = Column(Integer, nullable=False)
+    classification = Column(String(20), nullable=True)
+
+    __table_args__ = (
+        Index('ix_sentiment_source_ts', 'source', 'timestamp', unique=True),
     )
 
 
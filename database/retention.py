@@ -0,0 +1,222 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from datetime import datetime, timedelta
+from typing import Dict, Any
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, delete, func, and_
+
+from config.settings import settings
+from database.models import Candle, Decision, MarketSnapshot, DerivativesSnapshot
+from database.candle_store import CandleStore
+from services.candle_buffer import resample_ohlcv
+from services.hyperliquid_client import INTERVAL_MS
+from services.metrics import metrics
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_ms(when: datetime) -> int:
+    return (when - EPOCH) // timedelta(milliseconds=1)
+
+
+def _from_ms(ms: int) -> datetime:
+    return EPOCH + timedelta(milliseconds=ms)
+
+
+def _ranges(starts: np.ndarray, step: int):
+    """Inizi di bucket ordinati -> range [lo, hi) di bucket consecutivi"""
+    breaks = np.flatnonzero(np.diff(starts) != step) + 1
+    for group in np.split(starts, breaks):
+        yield int(group[0]), int(group[-1]) + step
+
+
+class RetentionManager:
+    """
+    Tiene piccole le tabelle calde, così indici e backup non crescono con lo storico.
+
+    Policy (RETENTION_*):
+    - candele RETENTION_CANDLE_SOURCE più vecchie di RETENTION_CANDLE_DAYS:
+      aggregate nei RETENTION_CANDLE_TARGETS (scritte con CandleStore, quindi
+      idempotente) e poi cancellate; solo i bucket completi, quelli con buchi
+      restano come candele sorgente
+    - decisioni, market snapshot e snapshot dei derivati più vecchi di
+      RETENTION_DECISION_DAYS / RETENTION_SNAPSHOT_DAYS / RETENTION_DERIVATIVES_DAYS
+      (questi mai sotto DERIVATIVES_WARM_START_HOURS): copiati in Parquet
+      compresso sotto RETENTION_ARCHIVE_DIR/<tabella>/ e poi cancellati
+    Si lavora a batch di RETENTION_BATCH_ROWS con un commit per batch:
+    un'interruzione lascia i dati coerenti e basta rieseguire. Con
+    dry_run=True non si scrive nulla e si ottiene solo il report.
+    """
+
+    def __init__(self, engine=None, dry_run: bool = False):
+        if engine is None:
+            from database.connection import engine
+        self.engine = engine
+        self.dry_run = dry_run
+        self.batch_rows = settings.retention.batch_rows
+        self.archive_dir = Path(settings.retention.archive_dir)
+        self.compression = settings.retention.compression
+
+    def run(self) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        policy = settings.retention
+        derivatives_hours = max(policy.derivatives_days * 24, settings.derivatives.warm_start_hours)
+        return {
+            "dry_run": self.dry_run,
+            "candles": self.downsample_candles(now - timedelta(days=policy.candle_days)),
+            "decisions": self.archive(Decision.__table__, "created_at", now - timedelta(days=policy.decision_days)),
+            "market_snapshots": self.archive(MarketSnapshot.__table__, "timestamp", now - timedelta(days=policy.snapshot_days)),
+            "derivatives_snapshots": self.archive(
+                DerivativesSnapshot.__table__, "timestamp", now - timedelta(hours=derivatives_hours)
+            ),
+        }
+
+    # ---------- candele ----------
+
+    @metrics.timed("retention.candles")
+    def downsample_candles(self, cutoff: datetime) -> Dict[str, Any]:
+        source = settings.retention.candle_source
+        base_ms = INTERVAL_MS[source]
+        steps = {tf: INTERVAL_MS[tf] for tf in settings.retention.candle_targets if INTERVAL_MS[tf] > base_ms}
+        # Il cutoff si allinea al timeframe più lungo; gli altri target devono dividerlo
+        largest = max(steps.values(), default=base_ms)
+        steps = {tf: step for tf, step in steps.items() if largest % step == 0}
+        per_bucket = largest // base_ms
+        cutoff_ms = _to_ms(cutoff) // largest * largest
+
+        candles = Candle.__table__
+        old = and_(candles.c.timeframe == source, candles.c.timestamp < _from_ms(cutoff_ms))
+        with self.engine.connect() as conn:
+            per_coin = conn.execute(
+                select(candles.c.coin, func.count(), func.min(candles.c.timestamp)).where(old).group_by(candles.c.coin)
+            ).all()
+
+        total = sum(count for _, count, _ in per_coin)
+        report = {
+            "cutoff": _from_ms(cutoff_ms).isoformat(),
+            "source": source,
+            "rows": total,
+            "coins": {coin: count for coin, count, _ in per_coin},
+            "bars": {tf: total * base_ms // step for tf, step in steps.items()},
+            "deleted": 0,
+            "kept_incomplete": 0,
+        }
+        # Senza timeframe di destinazione non si cancella nulla
+        if self.dry_run or not total or not steps:
+            return report
+
+        store = CandleStore(self.engine)
+        # Finestre allineate al timeframe più lungo, di circa batch_rows candele sorgente
+        window = max(self.batch_rows * base_ms // largest, 1) * largest
+        for coin, _, oldest in per_coin:
+            start = _to_ms(oldest) // largest * largest
+            while start < cutoff_ms:
+                end = min(start + window, cutoff_ms)
+                in_window = and_(
+                    candles.c.coin == coin, candles.c.timeframe == source,
+                    candles.c.timestamp >= _from_ms(start), candles.c.timestamp < _from_ms(end)
+                )
+                with self.engine.connect() as conn:
+                    rows = conn.execute(
+                        select(candles.c.timestamp, candles.c.open, candles.c.high, candles.c.low,
+                               candles.c.close, candles.c.volume).where(in_window).order_by(candles.c.timestamp)
+                    ).all()
+
+                if rows:
+                    t = np.array([row[0] for row in rows], dtype="datetime64[ms]").astype(np.int64)
+                    ohlcv = np.array([row[1:] for row in rows], dtype=np.float64).T
+
+                    # Solo bucket del timeframe più lungo con tutte le candele sorgente
+                    # (quindi completi anche per i target più corti): un bucket con buchi
+                    # sovrascriverebbe una barra buona con OHLCV sbagliati. Le sue candele
+                    # sorgente restano nel DB.
+                    buckets = t // largest * largest
+                    starts, counts = np.unique(buckets, return_counts=True)
+                    complete = starts[counts == per_bucket]
+                    mask = np.isin(buckets, complete)
+                    report["kept_incomplete"] += int((~mask).sum())
+
+                    if len(complete):
+                        for tf, step in steps.items():
+                            store.upsert(coin, tf, *resample_ohlcv(t[mask], ohlcv[:, mask], base_ms, step, drop_partial=False))
+                        # Cancellazione solo dopo che gli aggregati sono scritti, per range di bucket completi consecutivi
+                        with self.engine.begin() as conn:
+                            for lo, hi in _ranges(complete, largest):
+                                report["deleted"] += conn.execute(delete(candles).where(
+                                    in_window, candles.c.timestamp >= _from_ms(lo), candles.c.timestamp < _from_ms(hi)
+                                )).rowcount
+                start = end
+
+        metrics.inc("retention_deleted_rows_total", value=report["deleted"], table=candles.name)
+        return report
+
+    # ---------- archivio Parquet ----------
+
+    def archive(self, table, column: str, cutoff: datetime) -> Dict[str, Any]:
+        """Copia in Parquet e cancella le righe di `table` con `column` < cutoff, in ordine di id"""
+        old = table.c[column] < cutoff
+        with self.engine.connect() as conn:
+            rows, oldest = conn.execute(select(func.count(), func.min(table.c[column])).where(old)).one()
+
+        report = {
+            "cutoff": cutoff.isoformat(),
+            "rows": rows,
+            "oldest": oldest.isoformat() if oldest else None,
+            "archived": 0,
+            "files": [],
+        }
+        if self.dry_run or not rows:
+            return report
+
+        directory = self.archive_dir / table.name
+        directory.mkdir(parents=True, exist_ok=True)
+        with metrics.span("retention.archive", table=table.name):
+            while True:
+                with self.engine.begin() as conn:
+                    batch = pd.read_sql(select(table).where(old).order_by(table.c.id).limit(self.batch_rows), conn)
+                    if batch.empty:
+                        break
+                    first, last = int(batch["id"].iloc[0]), int(batch["id"].iloc[-1])
+
+                    # Nome dal range di id: rieseguire dopo un errore sovrascrive lo stesso file
+                    path = directory / f"{table.name}_{first:010d}_{last:010d}.parquet"
+                    tmp = path.with_suffix(".parquet.tmp")
+                    batch.to_parquet(tmp, compression=self.compression, index=False)
+                    tmp.replace(path)
+
+                    conn.execute(delete(table).where(old, table.c.id >= first, table.c.id <= last))
+                report["archived"] += len(batch)
+                report["files"].append(path.name)
+
+        metrics.inc("retention_archived_rows_total", value=report["archived"], table=table.name)
+        return report
+
+
+def print_report(report: Dict[str, Any]):
+    mode = "DRY RUN - nothing written" if report["dry_run"] else "APPLIED"
+    print(f"\n=== Retention ({mode}) ===")
+
+    candles = report["candles"]
+    print(f"\nCandles {candles['source']} before {candles['cutoff']}: {candles['rows']:,} rows")
+    for coin, count in sorted(candles["coins"].items()):
+        print(f"  {coin}: {count:,}")
+    for tf, bars in candles["bars"].items():
+        print(f"  -> ~{bars:,} {tf} bars")
+    if not report["dry_run"]:
+        print(f"  deleted {candles['deleted']:,}, kept {candles['kept_incomplete']:,} in incomplete buckets")
+
+    for name in ("decisions", "market_snapshots", "derivatives_snapshots"):
+        table = report[name]
+        print(f"\n{name} before {table['cutoff']}: {table['rows']:,} rows (oldest {table['oldest'] or '-'})")
+        if not report["dry_run"]:
+            print(f"  archived {table['archived']:,} in {len(table['files'])} file(s)")
+
+
+# Test
+if __name__ == "__main__":
+    print_report(RetentionManager(dry_run=True).run())
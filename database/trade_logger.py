@@ -7,16 +7,28 @@ from datetime import datetime
 from typing import Dict, Any, Optional
 
 from sqlalchemy.orm import Session
-from database.connection import SessionLocal
+from database.connection import SessionLocal, ensure_schema
 from database.models import Trade, Decision, TradeDirection, TradeResult, ExitReason
+from services.metrics import metrics
 
 
 class TradeLogger:
     """Salva trades e decisioni nel database"""
     
-    def __init__(self):
+    def __init__(self, account: Optional[str] = None):
+        ensure_schema()
         self.db: Session = SessionLocal()
+        # Con più strategie ogni logger vede solo i trade del proprio account
+        self.account = account or None
     
+    def _trades(self):
+        query = self.db.query(Trade)
+        if self.account:
+            # I trade senza account sono assegnati all'account di default da upgrade_db
+            query = query.filter(Trade.account == self.account)
+        return query
+    
+    @metrics.timed("db.log_decision")
     def log_decision(
         self,
         context: Dict[str, Any],
@@ -41,6 +53,7 @@ class TradeLogger:
         
         return db_decision.id
     
+    @metrics.timed("db.log_trade_open")
     def log_trade_open(
         self,
         coin: str,
@@ -51,7 +64,9 @@ class TradeLogger:
         leverage: int,
         sl_price: Optional[float] = None,
         tp_price: Optional[float] = None,
-        decision_id: Optional[int] = None
+        decision_id: Optional[int] = None,
+        sl_order_id: Optional[int] = None,
+        tp_order_id: Optional[int] = None
     ) -> int:
         """Salva un trade aperto"""
         trade_direction = TradeDirection.LONG if direction == "LONG" else TradeDirection.SHORT
@@ -59,6 +74,7 @@ class TradeLogger:
         db_trade = Trade(
             created_at=datetime.utcnow(),
             timestamp_open=datetime.utcnow(),
+            account=self.account,
             coin=coin,
             direction=trade_direction,
             entry_price=entry_price,
@@ -67,6 +83,8 @@ class TradeLogger:
             leverage=leverage,
             sl_price=sl_price,
             tp_price=tp_price,
+            sl_order_id=sl_order_id,
+            tp_order_id=tp_order_id,
             result=TradeResult.OPEN
         )
         
@@ -84,6 +102,7 @@ class TradeLogger:
         
         return db_trade.id
     
+    @metrics.timed("db.log_trade_close")
     def log_trade_close(
         self,
         trade_id: int,
@@ -123,7 +142,8 @@ class TradeLogger:
             "TP": ExitReason.TAKE_PROFIT,
             "SL": ExitReason.STOP_LOSS,
             "MANUAL": ExitReason.MANUAL,
-            "SIGNAL": ExitReason.SIGNAL
+            "SIGNAL": ExitReason.SIGNAL,
+            "LIQUIDATION": ExitReason.LIQUIDATION
         }
         trade.exit_reason = reason_map.get(exit_reason, ExitReason.MANUAL)
         
@@ -132,12 +152,29 @@ class TradeLogger:
     
     def get_open_trades(self) -> list:
         """Trade aperti"""
-        trades = self.db.query(Trade).filter(Trade.result == TradeResult.OPEN).all()
-        return [{"id": t.id, "coin": t.coin, "direction": t.direction.value, "entry_price": t.entry_price} for t in trades]
+        trades = (
+            self._trades()
+            .filter(Trade.result == TradeResult.OPEN)
+            .order_by(Trade.timestamp_open)
+            .all()
+        )
+        return [
+            {
+                "id": t.id,
+                "coin": t.coin,
+                "direction": t.direction.value,
+                "entry_price": t.entry_price,
+                "size": t.size,
+                "timestamp_open": t.timestamp_open,
+                "sl_order_id": t.sl_order_id,
+                "tp_order_id": t.tp_order_id
+            }
+            for t in trades
+        ]
     
     def get_stats(self) -> Dict[str, Any]:
         """Statistiche trading"""
-        trades = self.db.query(Trade).filter(Trade.result != TradeResult.OPEN).all()
+        trades = self._trades().filter(Trade.result != TradeResult.OPEN).all()
         
         if not trades:
             return {"total_trades": 0}
@@ -0,0 +1,332 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import asyncio
+import concurrent.futures
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Any, Callable, List, Optional
+
+from config.settings import settings
+from services.cassette import cassette
+
+
+class AlgoOrder(ABC):
+    """
+    Ordine "padre" eseguito a pezzi (child order IOC) su uno scheduler asincrono.
+    Alla fine piazza SL/TP sulla quantità effettivamente fillata.
+    """
+
+    MAX_CONSECUTIVE_ERRORS = 3
+
+    def __init__(
+        self,
+        executor,
+        coin: str,
+        is_buy: bool,
+        size: float,
+        leverage: int,
+        decision: Dict[str, Any],
+        timeout: float,
+        on_complete: Optional[Callable[[Dict[str, Any]], None]] = None
+    ):
+        self.id = uuid.uuid4().hex[:8]
+        self.executor = executor
+        self.coin = coin
+        self.is_buy = is_buy
+        self.size = size
+        self.leverage = leverage
+        self.decision = decision
+        self.timeout = timeout
+        self.on_complete = on_complete
+
+        self.state = "PENDING"
+        self.children: List[Dict[str, Any]] = []
+        self.filled_size = 0.0
+        self.filled_notional = 0.0
+        self.protection: Dict[str, Any] = {}
+        self.created_at = time.time()
+        self._errors = 0
+        self._stopped = False
+        self._work_task: Optional[asyncio.Task] = None
+
+    @property
+    def name(self) -> str:
+        return type(self).__name__
+
+    @property
+    def remaining(self) -> float:
+        return self.executor.round_size(self.coin, self.size - self.filled_size)
+
+    @property
+    def avg_price(self) -> float:
+        return self.filled_notional / self.filled_size if self.filled_size > 0 else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "algo": self.name,
+            "state": self.state,
+            "coin": self.coin,
+            "side": "LONG" if self.is_buy else "SHORT",
+            "target_size": self.size,
+            "size": round(self.filled_size, 8),
+            "price": self.avg_price,
+            "leverage": self.leverage,
+            "children": len(self.children),
+            "protection": self.protection,
+        }
+
+    def stop(self):
+        """
+        Ferma l'invio di nuovi child (va chiamato sul loop dello scheduler).
+        Il child in volo viene atteso e SL/TP vengono comunque piazzati.
+        """
+        self._stopped = True
+        if self._work_task is not None:
+            self._work_task.cancel()
+
+    async def run(self):
+        self.state = "RUNNING"
+        try:
+            await asyncio.to_thread(self.executor.set_leverage, self.coin, self.leverage)
+            if self._stopped:
+                raise asyncio.CancelledError()
+            self._work_task = asyncio.ensure_future(self._work())
+            await asyncio.wait_for(self._work_task, timeout=cassette.scaled(self.timeout) or None)
+            if self.state == "RUNNING":
+                self.state = "DONE"
+        except asyncio.TimeoutError:
+            self.state = "TIMEOUT"
+        except asyncio.CancelledError:
+            self.state = "CANCELLED"
+        except Exception as e:
+            print(f"[ERROR] Algo {self.id} failed: {e}")
+            self.state = "FAILED"
+
+        # SL/TP sulla quantità aggregata realmente eseguita
+        if self.filled_size > 0:
+            self.protection = await asyncio.to_thread(
+                self.executor.place_protection,
+                self.coin, self.is_buy, self.avg_price, round(self.filled_size, 8), self.decision
+            )
+
+        print(f"[OK] Algo {self.id} {self.state}: {round(self.filled_size, 8)} / {self.size} {self.coin} @ {self.avg_price:,.4f}")
+
+        if self.on_complete:
+            try:
+                self.on_complete(self.summary())
+            except Exception as e:
+                print(f"[ERROR] Algo {self.id} completion callback: {e}")
+
+        return self.summary()
+
+    @abstractmethod
+    async def _work(self):
+        """Invia i child order finché l'ordine non è eseguito"""
+
+    async def _send_child(self, size: float, max_size: Optional[float] = None, slippage: Optional[float] = None):
+        """Invia un child order IOC, limitato alla profondità disponibile"""
+        if slippage is None or max_size is None:
+            plan = await asyncio.to_thread(self.executor.plan_order, self.coin, self.is_buy, size)
+            slippage = plan["slippage"]
+            max_size = plan.get("max_size") or 0.0
+
+        if max_size > 0:
+            size = min(size, max_size)
+        size = self.executor.round_size(self.coin, size)
+        if size <= 0:
+            return
+
+        verdict = await asyncio.to_thread(self.executor.check_risk, self.coin, self.is_buy, size, self.leverage)
+        if not verdict["allowed"]:
+            raise RuntimeError(f"Risk veto: {verdict['reason']}")
+        size = verdict["size"]
+
+        # L'IOC parte comunque: se l'algo viene cancellato (timeout, stop) se ne
+        # aspetta l'esito, così i fill finiscono in filled_size e nello SL/TP
+        child_task = asyncio.ensure_future(asyncio.to_thread(
+            self.executor._execute_market, self.coin, self.is_buy, size, slippage, "exchange.algo_child", self.leverage
+        ))
+        try:
+            execution = await asyncio.shield(child_task)
+        except asyncio.CancelledError:
+            self._record_child(size, slippage, await child_task)
+            raise
+        self._record_child(size, slippage, execution)
+
+        if execution["fills"]:
+            self._errors = 0
+        else:
+            self._errors += 1
+            if self._errors >= self.MAX_CONSECUTIVE_ERRORS:
+                raise RuntimeError(f"{self._errors} consecutive child orders rejected: {execution['error']}")
+
+    def _record_child(self, size: float, slippage: float, execution: Dict[str, Any]):
+        child = {"size": size, "slippage": slippage, "ts": time.time(), "fills": execution["fills"], "error": execution["error"]}
+        self.children.append(child)
+
+        for fill in execution["fills"]:
+            self.filled_size += fill["size"]
+            self.filled_notional += fill["size"] * fill["price"]
+
+
+class TwapAlgo(AlgoOrder):
+    """Divide l'ordine in N pezzi equidistanti nel tempo"""
+
+    def __init__(self, *args, slices: int = 5, duration: float = 300, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slices = max(1, slices)
+        self.duration = duration
+
+    async def _work(self):
+        interval = self.duration / self.slices
+
+        for i in range(self.slices):
+            if self.remaining <= 0:
+                break
+
+            # Il non fillato dei pezzi precedenti viene redistribuito sui successivi
+            await self._send_child(self.remaining / (self.slices - i))
+
+            if i < self.slices - 1:
+                await asyncio.sleep(cassette.scaled(interval))
+
+
+class IcebergAlgo(AlgoOrder):
+    """Mostra al mercato solo una frazione della profondità disponibile per volta"""
+
+    def __init__(self, *args, depth_fraction: float = 0.5, refresh: float = 10, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.depth_fraction = depth_fraction
+        self.refresh = refresh
+
+    async def _work(self):
+        # Almeno un lotto: una frazione che arrotonda a 0 non invierebbe nulla fino al timeout
+        lot = 10 ** -self.executor.asset_meta.sz_decimals(self.coin)
+        while self.remaining > 0:
+            plan = await asyncio.to_thread(self.executor.plan_order, self.coin, self.is_buy, self.remaining)
+            depth = plan.get("max_size") or 0.0
+            clip = max(depth * self.depth_fraction, lot) if depth > 0 else self.remaining
+            if depth > 0:
+                depth = max(depth, lot)
+
+            await self._send_child(min(clip, self.remaining), max_size=depth, slippage=plan["slippage"])
+
+            if self.remaining > 0:
+                await asyncio.sleep(cassette.scaled(self.refresh))
+
+
+class ExecutionScheduler:
+    """
+    Event loop asyncio su un thread dedicato: gli algo non bloccano il loop principale.
+    Degli algo conclusi si tengono solo gli ultimi MAX_FINISHED (per wait e riepiloghi).
+    """
+
+    MAX_FINISHED = 100
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.algos: Dict[str, AlgoOrder] = {}
+        self._futures = {}
+        self._finished = deque()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self._loop.run_forever, name="algo-scheduler", daemon=True)
+            self._thread.start()
+
+    def submit(self, algo: AlgoOrder) -> AlgoOrder:
+        self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(algo.run(), self._loop)
+        with self._lock:
+            self.algos[algo.id] = algo
+            self._futures[algo.id] = future
+        future.add_done_callback(lambda _: self._on_done(algo.id))
+        print(f"[OK] {algo.name} {algo.id} scheduled: {algo.size} {algo.coin}")
+        return algo
+
+    def _on_done(self, algo_id: str):
+        with self._lock:
+            self._finished.append(algo_id)
+            while len(self._finished) > self.MAX_FINISHED:
+                old = self._finished.popleft()
+                self.algos.pop(old, None)
+                self._futures.pop(old, None)
+
+    def cancel(self, algo_id: str) -> bool:
+        """Ferma l'algo: niente nuovi child, ma SL/TP sul fillato vengono piazzati"""
+        future = self._futures.get(algo_id)
+        algo = self.algos.get(algo_id)
+        if future is None or algo is None or future.done() or self._loop is None:
+            return False
+        self._loop.call_soon_threadsafe(algo.stop)
+        return True
+
+    def active(self) -> List[Dict[str, Any]]:
+        return [a.summary() for a in list(self.algos.values()) if a.state in ("PENDING", "RUNNING")]
+
+    def wait(self, algo_id: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        return self._futures[algo_id].result(timeout=timeout)
+
+    def shutdown(self, timeout: Optional[float] = None):
+        """
+        Ferma tutti gli algo e aspetta che ognuno abbia piazzato SL/TP sul
+        fillato prima di fermare il loop (timeout=None: senza limite).
+        """
+        if self._loop is None:
+            return
+        with self._lock:
+            algo_ids = list(self._futures)
+        for algo_id in algo_ids:
+            self.cancel(algo_id)
+        deadline = time.time() + timeout if timeout is not None else None
+        with self._lock:
+            running = [(algo_id, future, self.algos[algo_id]) for algo_id, future in self._futures.items()]
+        for algo_id, future, algo in running:
+            try:
+                future.result(timeout=max(0, deadline - time.time()) if deadline else None)
+            except concurrent.futures.TimeoutError:
+                print(f"[WARNING] Algo {algo_id} still running at shutdown: "
+                      f"{round(algo.filled_size, 8)} {algo.coin} filled, protection {algo.protection or 'not placed'}")
+            except Exception:
+                pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+
+def build_algo(executor, coin, is_buy, size, leverage, decision, on_complete=None) -> AlgoOrder:
+    """Crea l'algo configurato in settings (twap | iceberg)"""
+    common = dict(
+        executor=executor,
+        coin=coin,
+        is_buy=is_buy,
+        size=size,
+        leverage=leverage,
+        decision=decision,
+        timeout=settings.trading.algo_timeout_seconds,
+        on_complete=on_complete,
+    )
+
+    if settings.trading.algo_type == "iceberg":
+        return IcebergAlgo(
+            depth_fraction=settings.trading.iceberg_depth_fraction,
+            refresh=settings.trading.iceberg_refresh_seconds,
+            **common
+        )
+
+    return TwapAlgo(
+        slices=settings.trading.twap_slices,
+        duration=settings.trading.twap_duration_seconds,
+        **common
+    )
@@ -0,0 +1,316 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Callable, List, Optional
+
+from config.settings import settings
+
+
+APPROVE = "approve"
+REJECT = "reject"
+
+
+class PendingDecision:
+    """Decisione dell'LLM in attesa di approvazione, con scadenza"""
+
+    def __init__(self, decision: Dict[str, Any], decision_id: Optional[int], price: float, ttl: float):
+        self.id = uuid.uuid4().hex[:8]
+        self.decision = decision
+        self.decision_id = decision_id
+        self.price = price
+        self.created_at = time.time()
+        self.expires_at = self.created_at + ttl
+        self.state = "PENDING"
+        self.result: Optional[Dict[str, Any]] = None
+
+    @property
+    def expired(self) -> bool:
+        return time.time() > self.expires_at
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "state": self.state,
+            "decision_id": self.decision_id,
+            "action": self.decision.get("decision"),
+            "coin": self.decision.get("coin"),
+            "size_pct": self.decision.get("size_pct"),
+            "leverage": self.decision.get("leverage"),
+            "confidence": self.decision.get("confidence"),
+            "price": self.price,
+            "expires_at": self.expires_at,
+            "expires_in": max(round(self.expires_at - time.time()), 0),
+        }
+
+
+class ApprovalQueue:
+    """
+    Coda di approvazione non bloccante per il loop di trading.
+
+    Il loop mette le decisioni in coda e prosegue; l'approvazione arriva da:
+    - HTTP su localhost: GET /pending, POST /approve/<id>, POST /reject/<id>
+    - file: <id>.approve o <id>.reject nella cartella APPROVAL_DIR
+      (è quello che fanno `main.py approve/reject`), dove pending.json
+      riporta le decisioni in attesa
+    Un thread dedicato esegue le decisioni approvate: l'executor ricontrolla
+    il prezzo e rifiuta l'apertura se si è mosso oltre APPROVAL_MAX_DRIFT_PCT.
+    Le decisioni scadono dopo APPROVAL_TTL_SECONDS; una nuova decisione
+    sulla stessa coin sostituisce quella ancora in attesa.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[PendingDecision], Dict[str, Any]],
+        ttl: float = None,
+        port: int = None,
+        directory: str = None
+    ):
+        self.execute = execute
+        self.ttl = settings.approval.ttl_seconds if ttl is None else ttl
+        self.port = settings.approval.port if port is None else port
+        self.directory = Path(directory or settings.approval.directory)
+
+        self._pending: Dict[str, PendingDecision] = {}
+        self._approved: "queue.Queue[PendingDecision]" = queue.Queue()
+        self._lock = threading.Lock()
+        # pending.json è scritto da loop, worker e thread HTTP: una scrittura alla volta
+        self._write_lock = threading.Lock()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    # ---------- ciclo di vita ----------
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write_pending()
+
+        self._thread = threading.Thread(target=self._worker, name="approval-queue", daemon=True)
+        self._thread.start()
+
+        if self.port:
+            self._start_server()
+        print(f"[OK] Approval queue ready (files in {self.directory}"
+              f"{f', http://127.0.0.1:{self.port}/pending' if self._server else ''})")
+
+    def stop(self):
+        self._running = False
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    # ---------- API ----------
+
+    def submit(self, decision: Dict[str, Any], decision_id: Optional[int], price: float) -> PendingDecision:
+        """Mette in coda una decisione; ritorna subito"""
+        pending = PendingDecision(decision, decision_id, price, self.ttl)
+        with self._lock:
+            for other in self._pending.values():
+                if other.state == "PENDING" and other.decision.get("coin") == decision.get("coin"):
+                    other.state = "SUPERSEDED"
+            self._pending[pending.id] = pending
+            self._prune()
+        self._write_pending()
+        return pending
+
+    def approve(self, pending_id: str) -> Dict[str, Any]:
+        return self._resolve(pending_id, APPROVE)
+
+    def reject(self, pending_id: str) -> Dict[str, Any]:
+        return self._resolve(pending_id, REJECT)
+
+    def pending(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [p.summary() for p in self._pending.values() if p.state == "PENDING"]
+
+    def _resolve(self, pending_id: str, verdict: str) -> Dict[str, Any]:
+        with self._lock:
+            pending = self._pending.get(pending_id)
+            if pending is None:
+                return {"success": False, "error": f"Unknown decision {pending_id}"}
+            if pending.state != "PENDING":
+                return {"success": False, "error": f"Decision {pending_id} is {pending.state}"}
+            if pending.expired:
+                pending.state = "EXPIRED"
+            elif verdict == APPROVE:
+                pending.state = "APPROVED"
+            else:
+                pending.state = "REJECTED"
+            state = pending.state
+
+        self._write_pending()
+        print(f"\n📨 Decision {pending_id} {state}")
+        if state == "APPROVED":
+            self._approved.put(pending)
+        return {"success": state in ("APPROVED", "REJECTED"), "id": pending_id, "state": state}
+
+    # ---------- worker ----------
+
+    def _worker(self):
+        while self._running:
+            try:
+                pending = self._approved.get(timeout=1)
+            except queue.Empty:
+                self._poll_files()
+                self._expire()
+                continue
+            self._run(pending)
+
+    def _run(self, pending: PendingDecision):
+        decision = pending.decision
+        print(f"\n⚡ Executing approved decision {pending.id}: {decision.get('decision')} {decision.get('coin')}")
+        try:
+            pending.result = self.execute(pending)
+            pending.state = _outcome(pending.result)
+            if pending.state == "FAILED":
+                print(f"❌ Approved decision {pending.id} failed: {pending.result.get('error') or pending.result.get('trade')}")
+        except Exception as e:
+            pending.result = {"error": str(e)}
+            pending.state = "FAILED"
+            print(f"❌ Approved decision {pending.id} failed: {e}")
+        self._write_pending()
+
+    def _expire(self):
+        changed = False
+        with self._lock:
+            for pending in self._pending.values():
+                if pending.state == "PENDING" and pending.expired:
+                    pending.state = "EXPIRED"
+                    changed = True
+                    print(f"\n⌛ Decision {pending.id} expired ({pending.decision.get('decision')} {pending.decision.get('coin')})")
+        if changed:
+            self._write_pending()
+
+    def _prune(self):
+        """Tiene solo le decisioni in attesa e le ultime 50 concluse"""
+        done = [key for key, p in self._pending.items() if p.state != "PENDING"]
+        for key in done[:-50]:
+            del self._pending[key]
+
+    # ---------- canale file ----------
+
+    def _poll_files(self):
+        for path in self.directory.glob("*.*"):
+            verdict = path.suffix[1:]
+            if verdict not in (APPROVE, REJECT):
+                continue
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            self._resolve(path.stem, verdict)
+
+    def _write_pending(self):
+        """pending.json: le decisioni in attesa, per chi approva da file"""
+        with self._write_lock:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                tmp = self.directory / "pending.json.tmp"
+                tmp.write_text(json.dumps(self.pending(), indent=2))
+                tmp.replace(self.directory / "pending.json")
+            except OSError as e:
+                print(f"[ERROR] Could not write pending approvals: {e}")
+
+    # ---------- canale HTTP ----------
+
+    def _start_server(self):
+        approvals = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, status: int, payload):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/pending":
+                    self._reply(200, approvals.pending())
+                else:
+                    self._reply(404, {"error": "not found"})
+
+            def do_POST(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 2 or parts[0] not in (APPROVE, REJECT):
+                    self._reply(404, {"error": "not found"})
+                    return
+                result = approvals._resolve(parts[1], parts[0])
+                self._reply(200 if result["success"] else 409, result)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        except OSError as e:
+            print(f"[WARNING] Approval HTTP endpoint unavailable on port {self.port}: {e}")
+            return
+        threading.Thread(target=self._server.serve_forever, name="approval-http", daemon=True).start()
+
+
+def _outcome(result: Dict[str, Any]) -> str:
+    """Stato finale dal risultato di execute_decision: errori e ordini rifiutati sono FAILED"""
+    if result.get("stale"):
+        return "STALE"
+    if result.get("error") or result.get("trade", {}).get("success") is False:
+        return "FAILED"
+    return "EXECUTED"
+
+
+def request_verdict(pending_id: str, verdict: str, directory: str = None) -> Path:
+    """Approva o rifiuta da un altro processo (file letto dal worker entro ~1s)"""
+    directory = Path(directory or settings.approval.directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{pending_id}.{verdict}"
+    path.touch()
+    return path
+
+
+def read_pending(directory: str = None) -> List[Dict[str, Any]]:
+    path = Path(directory or settings.approval.directory) / "pending.json"
+    if not path.exists():
+        return []
+    return json.loads(path.read_text())
+
+
+# Test
+if __name__ == "__main__":
+    import tempfile
+
+    executed = []
+    approvals = ApprovalQueue(
+        execute=lambda p: executed.append(p.id) or {"success": True},
+        ttl=2,
+        port=0,
+        directory=tempfile.mkdtemp()
+    )
+    approvals.start()
+
+    first = approvals.submit({"decision": "OPEN_LONG", "coin": "BTC"}, None, 100000.0)
+    second = approvals.submit({"decision": "OPEN_SHORT", "coin": "ETH"}, None, 3000.0)
+    third = approvals.submit({"decision": "OPEN_LONG", "coin": "SOL"}, None, 150.0)
+
+    print("Pending:", [p["id"] for p in approvals.pending()])
+    request_verdict(first.id, APPROVE, approvals.directory)
+    approvals.reject(second.id)
+
+    time.sleep(3.5)
+    print("States:", first.state, second.state, third.state)
+    print("Executed:", executed)
+    approvals.stop()
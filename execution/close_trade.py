@@ -2,43 +2,43 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
+# Percorso di emergenza: solo l'executor, niente agent, pandas o DB
 from execution.executor import TradingExecutor
 
-executor = TradingExecutor()
-
-print("=== CLOSE ALL TRADES ===\n")
-
-# Posizioni attuali
-print("--- Current Positions ---")
-positions = executor.get_positions()
-
-if not positions:
-    print("  No open positions")
-else:
-    for pos in positions:
-        print(f"  {pos['coin']}: {pos['side']} {pos['size']} @ ${pos['entry_price']:,.2f}")
-        print(f"    Unrealized PnL: ${pos['unrealized_pnl']:.2f}")
-
-    # Chiudi tutte le posizioni
-    print("\n--- Closing All Positions ---")
-    for pos in positions:
-        coin = pos['coin']
-        print(f"Closing {coin}...")
-        result = executor.close_position(coin)
-        if result.get("success"):
-            print(f"  [OK] {coin} closed")
-        else:
-            print(f"  [ERROR] {coin}: {result.get('error')}")
-
-# Verifica
-print("\n--- Positions After Close ---")
-positions = executor.get_positions()
-if positions:
-    for pos in positions:
-        print(f"  {pos['coin']}: {pos['side']} {pos['size']}")
-else:
-    print("  No open positions")
-
-# Balance finale
-balance = executor.get_balance()
-print(f"\nFinal Balance: ${balance['balance']:,.2f}")
\ No newline at end of file
+
+def close_all(executor: TradingExecutor = None):
+    """Chiude tutte le posizioni aperte in un colpo solo e mostra il risultato"""
+    executor = executor or TradingExecutor()
+
+    print("=== CLOSE ALL TRADES ===\n")
+
+    # Snapshot, bulk cancel e bulk close in un'unica passata
+    print("--- Closing All Positions ---")
+    result = executor.flatten_all()
+    if "error" in result:
+        print(f"  [ERROR] {result['error']}")
+        return result
+
+    print(f"  Cancelled orders: {result['cancelled_orders']}")
+    for fill in result["closed"]:
+        print(f"  [OK] {fill['coin']} closed {fill['size']} @ ${fill['price']:,.2f}")
+    for coin, error in result["remaining"].items():
+        print(f"  [ERROR] {coin}: {error}")
+    print(f"  Done in {result['elapsed_seconds']:.2f}s")
+
+    # Verifica (snapshot già aggiornato da flatten_all)
+    print("\n--- Positions After Close ---")
+    positions = executor.get_positions()
+    if positions:
+        for pos in positions:
+            print(f"  {pos['coin']}: {pos['side']} {pos['size']}")
+    else:
+        print("  No open positions")
+
+    # Balance finale
+    balance = executor.get_balance()
+    print(f"\nFinal Balance: ${balance['balance']:,.2f}")
+    return result
+
+if __name__ == "__main__":
+    close_all()
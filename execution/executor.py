@@ -4,17 +4,49 @@ sys.path.append(str(Path(__file__).parent.parent))
 
 import eth_account
 from eth_account.signers.local import LocalAccount
-from hyperliquid.exchange import Exchange
-from hyperliquid.info import Info
 from hyperliquid.utils import constants
-from typing import Dict, Any, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+import time
 
 from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+from services.account_state import AccountStateProvider
+from services.container import container
+from execution.slippage import plan_market_order, split_size
+from execution.algos import ExecutionScheduler, build_algo
+from execution.risk_engine import RiskEngine
+
+
+def _order_id(result):
+    """oid dalla risposta di un ordine (resting o filled)"""
+    statuses = result.get("response", {}).get("data", {}).get("statuses", [{}])
+    status = statuses[0] if statuses else {}
+    for key in ("resting", "filled"):
+        if key in status:
+            return status[key].get("oid")
+    return None
 
 
 class TradingExecutor:
-    def __init__(self):
+    def __init__(
+        self,
+        account_address: Optional[str] = None,
+        private_key: Optional[str] = None,
+        vault_address: Optional[str] = None,
+        risk: Optional[RiskEngine] = None,
+        default_leverage: Optional[int] = None
+    ):
+        """
+        Senza parametri usa l'account di settings (HL_ACCOUNT_ADDRESS / HL_PRIVATE_KEY).
+        Il multi-strategy runner passa account, chiave e risk engine di ogni strategia.
+        """
         self.testnet = settings.hyperliquid.testnet
+        self.account_address = account_address if account_address is not None else settings.hyperliquid.account_address
+        self.private_key = private_key if private_key is not None else settings.hyperliquid.private_key
+        self.vault_address = vault_address
+        self.default_leverage = default_leverage or settings.trading.default_leverage
         
         if self.testnet:
             self.base_url = constants.TESTNET_API_URL
@@ -23,12 +55,18 @@ class TradingExecutor:
         
         self.account = None
         self.exchange = None
-        self.info = Info(base_url=self.base_url, skip_ws=True)
+        # Info e metadati condivisi da tutti gli executor del processo
+        self.info = container.info(self.base_url)
+        self.asset_meta = container.asset_meta(self.base_url)
+        self.risk = risk or RiskEngine()
+        self.account_state = AccountStateProvider(self.info, self.account_address)
+        self.account_state.add_listener(self.risk.sync)
+        self.algos = ExecutionScheduler()
         
         self._setup_account()
     
     def _setup_account(self):
-        private_key = settings.hyperliquid.private_key
+        private_key = self.private_key
         
         if not private_key:
             print("[WARNING] No private key configured - read-only mode")
@@ -39,117 +77,197 @@ class TradingExecutor:
                 private_key = "0x" + private_key
             
             self.account = eth_account.Account.from_key(private_key)
-            self.exchange = Exchange(
-                self.account,
-                base_url=self.base_url
-            )
+            self.exchange = container.exchange(self.account, self.base_url, self.vault_address)
             print(f"[OK] Account configured: {self.account.address}")
         except Exception as e:
             print(f"[ERROR] Error setting up account: {e}")
     
     def get_balance(self):
-        if not settings.hyperliquid.account_address:
-            return {"error": "No account address configured"}
+        state = self.account_state.get()
+        if "error" in state:
+            return state
         
-        try:
-            user_state = self.info.user_state(settings.hyperliquid.account_address)
-            
-            return {
-                "balance": float(user_state.get("marginSummary", {}).get("accountValue", 0)),
-                "available": float(user_state.get("withdrawable", 0)),
-                "positions": user_state.get("assetPositions", [])
-            }
-        except Exception as e:
-            return {"error": str(e)}
+        return {
+            "balance": state["balance"],
+            "available": state["available"],
+            "positions": state["positions"]
+        }
     
     def get_positions(self):
-        if not settings.hyperliquid.account_address:
+        state = self.account_state.get()
+        if "error" in state:
+            if self.account_address:
+                print(f"Error getting positions: {state['error']}")
             return []
         
-        try:
-            user_state = self.info.user_state(settings.hyperliquid.account_address)
-            positions = []
-            
-            for pos in user_state.get("assetPositions", []):
-                position = pos.get("position", {})
-                size = float(position.get("szi", 0))
-                
-                if size != 0:
-                    positions.append({
-                        "coin": position.get("coin"),
-                        "size": size,
-                        "entry_price": float(position.get("entryPx", 0)),
-                        "unrealized_pnl": float(position.get("unrealizedPnl", 0)),
-                        "leverage": float(position.get("leverage", {}).get("value", 1)),
-                        "side": "LONG" if size > 0 else "SHORT"
-                    })
-            
-            return positions
-        except Exception as e:
-            print(f"Error getting positions: {e}")
-            return []
+        return state["positions"]
     
     def get_price(self, coin):
-        all_mids = self.info.all_mids()
-        return float(all_mids.get(coin, 0))
+        return float(self._all_mids().get(coin, 0))
     
     def set_leverage(self, coin, leverage, is_cross=False):
-        if not self.exchange:
+        if not self.exchange and not cassette.replaying:
             print("[ERROR] Exchange not configured")
             return False
         
         try:
-            self.exchange.update_leverage(
-                leverage=leverage,
-                name=coin,
-                is_cross=is_cross
-            )
+            with metrics.span("exchange.update_leverage", upstream="hyperliquid"):
+                cassette.call(
+                    "hyperliquid", "update_leverage", [coin, leverage, is_cross],
+                    lambda: self.exchange.update_leverage(
+                        leverage=leverage,
+                        name=coin,
+                        is_cross=is_cross
+                    )
+                )
             print(f"[OK] Leverage set to {leverage}x for {coin}")
             return True
         except Exception as e:
             print(f"[ERROR] Error setting leverage: {e}")
             return False
     
-    def open_position(self, coin, is_buy, size, leverage=3, slippage=0.01):
-        if not self.exchange:
-            return {"error": "Exchange not configured"}
-        
+    def get_orderbook(self, coin):
+        with metrics.span("hyperliquid.l2_snapshot", upstream="hyperliquid"):
+            return cassette.call("hyperliquid", "l2_snapshot", coin, lambda: self.info.l2_snapshot(coin))
+    
+    def plan_order(self, coin, is_buy, size):
+        """Stima l'impatto sul book L2: bound di slippage e numero di pezzi"""
         try:
-            self.set_leverage(coin, leverage)
+            book = self.get_orderbook(coin)
+        except Exception as e:
+            print(f"[WARNING] Order book unavailable for {coin}: {e}")
+            return {"slippage": settings.trading.default_slippage, "parts": 1, "estimate": None}
+        
+        return plan_market_order(
+            book,
+            is_buy,
+            size,
+            max_slippage=settings.trading.max_slippage,
+            buffer=settings.trading.slippage_buffer
+        )
+    
+    def _execute_market(self, coin, is_buy, size, slippage, span_name, leverage=None):
+        """
+        Invia un market order (IOC). Se slippage è None lo calcola dal book
+        e, se la size supera la profondità disponibile, la spezza in più ordini.
+        """
+        plan = None
+        if slippage is None:
+            plan = self.plan_order(coin, is_buy, size)
+            slippage = plan["slippage"]
+            chunks = split_size(size, plan["parts"], self.asset_meta.sz_decimals(coin))
+        else:
+            chunks = [size]
+        
+        fills = []
+        error = None
+        raw = None
+        
+        for i, chunk in enumerate(chunks):
+            if i > 0:
+                # Lascia ricostruire il book prima del pezzo successivo
+                cassette.sleep(settings.trading.split_interval_seconds)
+                slippage = self.plan_order(coin, is_buy, chunk)["slippage"]
             
-            result = self.exchange.market_open(
-                name=coin,
-                is_buy=is_buy,
-                sz=size,
-                px=None,
-                slippage=slippage
-            )
+            with metrics.span(span_name, upstream="hyperliquid", histogram="order_roundtrip_seconds", coin=coin):
+                result = cassette.call(
+                    "hyperliquid", "market_open", [coin, is_buy, chunk],
+                    lambda: self.exchange.market_open(
+                        name=coin,
+                        is_buy=is_buy,
+                        sz=chunk,
+                        px=None,
+                        slippage=slippage
+                    )
+                )
             
             status = result.get("response", {}).get("data", {}).get("statuses", [{}])[0]
             
             if "filled" in status:
                 fill = status["filled"]
+                fills.append({
+                    "size": float(fill.get("totalSz", chunk)),
+                    "price": float(fill.get("avgPx", 0)),
+                    "order_id": fill.get("oid")
+                })
+                # Il risk engine vede subito il fill, senza attendere il feed
+                self.risk.on_fill(
+                    coin, is_buy, fills[-1]["size"], fills[-1]["price"],
+                    order_id=fills[-1]["order_id"], leverage=leverage, own=True
+                )
+            else:
+                error = status.get("error", "Unknown error")
+                raw = result
+                break
+        
+        if fills:
+            self.account_state.invalidate()
+        
+        return {"fills": fills, "error": error, "raw": raw, "plan": plan, "slippage": slippage}
+    
+    def check_risk(self, coin, is_buy, size, leverage, price=None):
+        """Veto o riduzione della size secondo i limiti del risk engine"""
+        if price is None:
+            price = self.get_price(coin)
+        verdict = self.risk.check(coin, is_buy, size, price, leverage)
+        if verdict["allowed"]:
+            verdict["size"] = self.round_size(coin, verdict["size"])
+            if verdict["size"] <= 0:
+                return {"allowed": False, "size": 0.0, "reason": "size below minimum after risk resize"}
+        return verdict
+    
+    def open_position(self, coin, is_buy, size, leverage=3, slippage=None, price=None):
+        if not self.exchange and not cassette.replaying:
+            return {"error": "Exchange not configured"}
+        
+        try:
+            verdict = self.check_risk(coin, is_buy, size, leverage, price)
+            if not verdict["allowed"]:
+                print(f"[WARNING] Risk veto on {coin}: {verdict['reason']}")
+                return {"success": False, "error": f"Risk veto: {verdict['reason']}"}
+            if verdict["size"] < size:
+                print(f"[WARNING] {coin} size reduced {size} -> {verdict['size']}: {verdict['reason']}")
+                size = verdict["size"]
+            
+            self.set_leverage(coin, leverage)
+            
+            execution = self._execute_market(coin, is_buy, size, slippage, "exchange.market_open", leverage)
+            fills = execution["fills"]
+            
+            if fills:
+                filled_size = sum(f["size"] for f in fills)
+                avg_price = sum(f["size"] * f["price"] for f in fills) / filled_size
+                plan = execution["plan"]
                 return {
                     "success": True,
                     "side": "LONG" if is_buy else "SHORT",
                     "coin": coin,
-                    "size": size,
-                    "price": float(fill.get("avgPx", 0)),
-                    "order_id": fill.get("oid"),
-                    "leverage": leverage
+                    "size": round(filled_size, 8),
+                    "price": avg_price,
+                    "order_id": fills[0]["order_id"],
+                    "order_ids": [f["order_id"] for f in fills],
+                    "leverage": leverage,
+                    "slippage": execution["slippage"],
+                    "expected_price": plan["estimate"]["avg_px"] if plan and plan["estimate"] else None,
+                    "partial": execution["error"]
                 }
             else:
                 return {
                     "success": False,
-                    "error": status.get("error", "Unknown error"),
-                    "raw": result
+                    "error": execution["error"],
+                    "raw": execution["raw"]
                 }
                 
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def close_position(self, coin, slippage=0.03):
-        if not self.exchange:
+    def close_position(self, coin, slippage=None):
+        """
+        Chiude la posizione con un solo IOC reduce-only (come flatten_all), senza
+        spezzarlo: se nel frattempo SL/TP o il monitor la chiudono, l'ordine non
+        può aprirne una opposta. Slippage=None: bound stimato dal book.
+        """
+        if not self.exchange and not cassette.replaying:
             return {"error": "Exchange not configured"}
         
         try:
@@ -165,76 +283,279 @@ class TradingExecutor:
             
             size = abs(position["size"])
             is_buy = position["side"] == "SHORT"
+            if slippage is None:
+                slippage = self.plan_order(coin, is_buy, size)["slippage"]
             
-            result = self.exchange.market_open(
-                name=coin,
-                is_buy=is_buy,
-                sz=size,
-                px=None,
-                slippage=slippage
-            )
+            closes = self._close_requests([position], self._all_mids(), slippage)
+            fills, errors = self._bulk_close(closes)
+            
+            if not fills:
+                return {"success": False, "coin": coin, "error": errors.get(coin, "Unknown error")}
             
-            return {"success": True, "coin": coin, "result": result}
+            self.account_state.invalidate()
+            # IOC: la parte oltre la profondità entro lo slippage resta aperta
+            remaining = self.round_size(coin, size - sum(f["size"] for f in fills))
+            error = errors.get(coin)
+            if error is None and remaining > 0:
+                error = f"partial close, {remaining} {coin} still open"
+            return {"success": True, "coin": coin, "fills": fills, "error": error}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
+    def flatten_all(self, slippage=None, retries=None):
+        """
+        Chiusura di emergenza di tutte le posizioni.
+        
+        Un solo snapshot dell'account, poi in parallelo una bulk cancel di
+        tutti gli ordini aperti (SL/TP compresi) e un unico bulk order di
+        chiusure reduce-only IOC ai prezzi mid del momento. Verifica con un
+        nuovo snapshot e ritenta le posizioni rimaste con slippage crescente.
+        """
+        if not self.exchange and not cassette.replaying:
+            return {"success": False, "error": "Exchange not configured"}
+        
+        base_slippage = settings.trading.flatten_slippage if slippage is None else slippage
+        retries = settings.trading.flatten_retries if retries is None else retries
+        start = time.perf_counter()
+        closed = []
+        errors = {}
+        cancelled = 0
+        
+        with metrics.span("exchange.flatten_all", upstream="hyperliquid"):
+            state = self.account_state.refresh()
+            if "error" in state:
+                return {"success": False, "error": state["error"]}
+            positions = state["positions"]
+            
+            for attempt in range(retries + 1):
+                if not positions:
+                    break
+                # Dal secondo tentativo si accetta più slippage pur di uscire
+                attempt_slippage = min(base_slippage * (attempt + 1), max(base_slippage, settings.trading.max_slippage))
+                
+                with ThreadPoolExecutor(max_workers=2) as pool:
+                    orders = pool.submit(self._open_orders) if attempt == 0 else None
+                    mids = pool.submit(self._all_mids)
+                    closes = self._close_requests(positions, mids.result(), attempt_slippage)
+                    closing = pool.submit(self._bulk_close, closes)
+                    if orders is not None:
+                        try:
+                            cancelled = self._bulk_cancel(orders.result())
+                        except Exception as e:
+                            print(f"[ERROR] Could not list open orders: {e}")
+                    fills, errors = closing.result()
+                closed.extend(fills)
+                
+                self.account_state.invalidate()
+                state = self.account_state.refresh()
+                positions = state.get("positions", positions)
+                if positions:
+                    print(f"[WARNING] Flatten attempt {attempt + 1}: {len(positions)} positions still open")
+        
+        remaining = {p["coin"]: errors.get(p["coin"], "still open") for p in positions}
+        return {
+            "success": not positions,
+            "closed": closed,
+            "cancelled_orders": cancelled,
+            "remaining": remaining,
+            "elapsed_seconds": round(time.perf_counter() - start, 3)
+        }
+    
+    def _open_orders(self) -> List[Dict[str, Any]]:
+        with metrics.span("hyperliquid.frontend_open_orders", upstream="hyperliquid"):
+            return cassette.call(
+                "hyperliquid", "frontend_open_orders", self.account_address,
+                lambda: self.info.frontend_open_orders(self.account_address)
+            )
+    
+    def _all_mids(self) -> Dict[str, str]:
+        with metrics.span("hyperliquid.all_mids", upstream="hyperliquid"):
+            all_mids = cassette.call("hyperliquid", "all_mids", None, self.info.all_mids)
+        self.risk.on_prices(all_mids)
+        return all_mids
+    
+    def _close_requests(self, positions, all_mids, slippage) -> List[Dict[str, Any]]:
+        """Ordini IOC reduce-only opposti a ogni posizione, limite = mid ± slippage"""
+        closes = []
+        for pos in positions:
+            coin = pos["coin"]
+            mid = float(all_mids.get(coin, 0)) or pos["entry_price"]
+            is_buy = pos["side"] == "SHORT"
+            closes.append({
+                "coin": coin,
+                "is_buy": is_buy,
+                "sz": abs(pos["size"]),
+                "limit_px": self.round_price(coin, mid * (1 + slippage if is_buy else 1 - slippage)),
+                "order_type": {"limit": {"tif": "Ioc"}},
+                "reduce_only": True
+            })
+        return closes
+    
+    def _bulk_close(self, closes):
+        """Invia tutte le chiusure in un'unica azione; ritorna (fill, errori per coin)"""
+        fills = []
+        errors = {}
+        try:
+            with metrics.span("exchange.bulk_orders", upstream="hyperliquid", histogram="order_roundtrip_seconds"):
+                result = cassette.call(
+                    "hyperliquid", "bulk_orders", [[r["coin"], r["is_buy"], r["sz"]] for r in closes],
+                    lambda: self.exchange.bulk_orders(closes)
+                )
+        except Exception as e:
+            return fills, {r["coin"]: str(e) for r in closes}
+        
+        response = result.get("response", {})
+        statuses = response.get("data", {}).get("statuses", []) if isinstance(response, dict) else []
+        if not statuses:
+            return fills, {r["coin"]: str(response or result) for r in closes}
+        
+        for close, status in zip(closes, statuses):
+            coin = close["coin"]
+            if isinstance(status, dict) and "filled" in status:
+                fill = status["filled"]
+                fills.append({
+                    "coin": coin,
+                    "size": float(fill.get("totalSz", close["sz"])),
+                    "price": float(fill.get("avgPx", 0)),
+                    "order_id": fill.get("oid")
+                })
+                self.risk.on_fill(
+                    coin, close["is_buy"], fills[-1]["size"], fills[-1]["price"],
+                    order_id=fills[-1]["order_id"], own=True
+                )
+            else:
+                errors[coin] = status.get("error", "Unknown error") if isinstance(status, dict) else str(status)
+        return fills, errors
+    
+    def _bulk_cancel(self, orders) -> int:
+        """Cancella in un'unica azione gli ordini aperti; ritorna quanti"""
+        if not orders:
+            return 0
+        cancels = [{"coin": o["coin"], "oid": o["oid"]} for o in orders]
+        try:
+            with metrics.span("exchange.bulk_cancel", upstream="hyperliquid"):
+                result = cassette.call(
+                    "hyperliquid", "bulk_cancel", [[c["coin"], c["oid"]] for c in cancels],
+                    lambda: self.exchange.bulk_cancel(cancels)
+                )
+        except Exception as e:
+            print(f"[ERROR] Bulk cancel failed: {e}")
+            return 0
+        statuses = result.get("response", {}).get("data", {}).get("statuses", [])
+        return sum(1 for s in statuses if s == "success")
+    
     def place_stop_loss(self, coin, is_buy, size, trigger_price):
-        if not self.exchange:
+        if not self.exchange and not cassette.replaying:
             return {"success": False, "error": "Exchange not configured"}
         
         try:
-            price = float(trigger_price)
+            price = self.round_price(coin, float(trigger_price))
             
-            result = self.exchange.order(
-                name=coin,
-                is_buy=is_buy,
-                sz=size,
-                limit_px=price,
-                order_type={
-                    "trigger": {
-                        "triggerPx": price,
-                        "isMarket": True,
-                        "tpsl": "sl"
-                    }
-                },
-                reduce_only=True
-            )
+            with metrics.span("exchange.trigger_order", upstream="hyperliquid", histogram="order_roundtrip_seconds", coin=coin):
+                result = cassette.call(
+                    "hyperliquid", "trigger_order", [coin, is_buy, size, "sl"],
+                    lambda: self.exchange.order(
+                        name=coin,
+                        is_buy=is_buy,
+                        sz=size,
+                        limit_px=price,
+                        order_type={
+                            "trigger": {
+                                "triggerPx": price,
+                                "isMarket": True,
+                                "tpsl": "sl"
+                            }
+                        },
+                        reduce_only=True
+                    )
+                )
             
             print(f"[OK] Stop Loss placed at {price:,.2f} USD")
-            return {"success": True, "price": price, "result": result}
+            return {"success": True, "price": price, "order_id": _order_id(result), "result": result}
         except Exception as e:
             print(f"[ERROR] Error placing SL: {e}")
             return {"success": False, "error": str(e)}
     
     def place_take_profit(self, coin, is_buy, size, trigger_price):
-        if not self.exchange:
+        if not self.exchange and not cassette.replaying:
             return {"success": False, "error": "Exchange not configured"}
         
         try:
-            price = float(trigger_price)
+            price = self.round_price(coin, float(trigger_price))
             
-            result = self.exchange.order(
-                name=coin,
-                is_buy=is_buy,
-                sz=size,
-                limit_px=price,
-                order_type={
-                    "trigger": {
-                        "triggerPx": price,
-                        "isMarket": True,
-                        "tpsl": "tp"
-                    }
-                },
-                reduce_only=True
-            )
+            with metrics.span("exchange.trigger_order", upstream="hyperliquid", histogram="order_roundtrip_seconds", coin=coin):
+                result = cassette.call(
+                    "hyperliquid", "trigger_order", [coin, is_buy, size, "tp"],
+                    lambda: self.exchange.order(
+                        name=coin,
+                        is_buy=is_buy,
+                        sz=size,
+                        limit_px=price,
+                        order_type={
+                            "trigger": {
+                                "triggerPx": price,
+                                "isMarket": True,
+                                "tpsl": "tp"
+                            }
+                        },
+                        reduce_only=True
+                    )
+                )
             
             print(f"[OK] Take Profit placed at {price:,.2f} USD")
-            return {"success": True, "price": price, "result": result}
+            return {"success": True, "price": price, "order_id": _order_id(result), "result": result}
         except Exception as e:
             print(f"[ERROR] Error placing TP: {e}")
             return {"success": False, "error": str(e)}
     
-    def execute_decision(self, decision):
+    def cancel_order(self, coin, order_id):
+        if not self.exchange and not cassette.replaying:
+            return {"success": False, "error": "Exchange not configured"}
+        
+        try:
+            with metrics.span("exchange.cancel", upstream="hyperliquid"):
+                result = cassette.call(
+                    "hyperliquid", "cancel", [coin, order_id],
+                    lambda: self.exchange.cancel(coin, order_id)
+                )
+            statuses = result.get("response", {}).get("data", {}).get("statuses", [])
+            return {"success": bool(statuses) and statuses[0] == "success", "result": result}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+    
+    def round_size(self, coin, size):
+        return self.asset_meta.round_size(coin, size)
+    
+    def round_price(self, coin, price):
+        return self.asset_meta.round_price(coin, price)
+    
+    def place_protection(self, coin, is_long, entry_price, size, decision):
+        """Piazza SL/TP attorno al prezzo di ingresso per la size indicata"""
+        sl_pct = float(decision.get("stop_loss_pct", 3)) / 100
+        tp_pct = float(decision.get("take_profit_pct", 6)) / 100
+        
+        if is_long:
+            sl_price = self.round_price(coin, entry_price * (1 - sl_pct))
+            tp_price = self.round_price(coin, entry_price * (1 + tp_pct))
+        else:
+            sl_price = self.round_price(coin, entry_price * (1 + sl_pct))
+            tp_price = self.round_price(coin, entry_price * (1 - tp_pct))
+        
+        # Gli ordini di chiusura vanno nel verso opposto alla posizione
+        return {
+            "stop_loss": self.place_stop_loss(coin, not is_long, size, sl_price),
+            "take_profit": self.place_take_profit(coin, not is_long, size, tp_price)
+        }
+    
+    def execute_decision(self, decision, on_complete=None, reference_price=None, max_drift_pct=None):
+        """
+        Esegue la decisione dell'LLM.
+        on_complete: callback chiamata con il riepilogo quando un ordine
+        eseguito a pezzi (TWAP/iceberg) termina in background.
+        reference_price: prezzo al momento della decisione. Se il prezzo
+        attuale se ne discosta più di max_drift_pct l'apertura viene
+        rifiutata (decisione approvata in ritardo, prezzo non più valido).
+        """
         action = decision.get("decision", "HOLD")
         
         if action == "HOLD":
@@ -248,20 +569,27 @@ class TradingExecutor:
         if "error" in balance:
             return balance
         
-        size_pct = min(float(decision.get("size_pct", 3)), settings.trading.max_position_size_pct)
+        size_pct = min(float(decision.get("size_pct", 3)), self.risk.max_position_pct)
         size_usd = (balance["available"] * size_pct) / 100
         
         price = self.get_price(coin)
         if price == 0:
             return {"error": f"Could not get price for {coin}"}
         
-        leverage = int(decision.get("leverage", settings.trading.default_leverage))
-        size_coins = (size_usd * leverage) / price
+        if reference_price and max_drift_pct is not None and action in ("OPEN_LONG", "OPEN_SHORT"):
+            drift_pct = abs(price - reference_price) / reference_price * 100
+            if drift_pct > max_drift_pct:
+                return {
+                    "error": f"Price drift {drift_pct:.2f}% > {max_drift_pct}% since decision "
+                             f"({reference_price:,.4f} -> {price:,.4f})",
+                    "stale": True
+                }
         
-        if coin == "BTC":
-            size_coins = round(size_coins, 5)
-        else:
-            size_coins = round(size_coins, 4)
+        leverage = int(decision.get("leverage", self.default_leverage))
+        leverage = max(1, min(leverage, self.asset_meta.max_leverage(coin, default=leverage)))
+        size_coins = self.round_size(coin, (size_usd * leverage) / price)
+        if size_coins <= 0:
+            return {"error": f"Size too small for {coin}"}
         
         result = {
             "action": action,
@@ -270,61 +598,32 @@ class TradingExecutor:
             "size_usd": size_usd
         }
         
-        # OPEN LONG
-        if action == "OPEN_LONG":
-            trade_result = self.open_position(
-                coin=coin,
-                is_buy=True,
-                size=size_coins,
-                leverage=leverage
-            )
-            result["trade"] = trade_result
+        # OPEN LONG / OPEN SHORT
+        if action in ("OPEN_LONG", "OPEN_SHORT"):
+            is_buy = action == "OPEN_LONG"
+            threshold = settings.trading.algo_threshold_usd
+            
+            # Ordini grandi: esecuzione a pezzi in background
+            if threshold > 0 and size_coins * price >= threshold:
+                algo = self.algos.submit(
+                    build_algo(self, coin, is_buy, size_coins, leverage, decision, on_complete)
+                )
+                result["algo"] = algo.summary()
+                return result
             
-            if trade_result.get("success"):
-                entry_price = float(trade_result["price"])
-                sl_pct = float(decision.get("stop_loss_pct", 3)) / 100
-                tp_pct = float(decision.get("take_profit_pct", 6)) / 100
-                
-                if coin == "BTC":
-                  sl_price = round(entry_price * (1 - sl_pct))
-                  tp_price = round(entry_price * (1 + tp_pct))
-                else:
-                  sl_price = round(entry_price * (1 - sl_pct), 1)
-                  tp_price = round(entry_price * (1 + tp_pct), 1)
-                
-                sl_result = self.place_stop_loss(coin, False, size_coins, sl_price)
-                result["stop_loss"] = sl_result
-                
-                tp_result = self.place_take_profit(coin, False, size_coins, tp_price)
-                result["take_profit"] = tp_result
-        
-        # OPEN SHORT
-        elif action == "OPEN_SHORT":
             trade_result = self.open_position(
                 coin=coin,
-                is_buy=False,
+                is_buy=is_buy,
                 size=size_coins,
-                leverage=leverage
+                leverage=leverage,
+                price=price
             )
             result["trade"] = trade_result
             
             if trade_result.get("success"):
-                entry_price = float(trade_result["price"])
-                sl_pct = float(decision.get("stop_loss_pct", 3)) / 100
-                tp_pct = float(decision.get("take_profit_pct", 6)) / 100
-                
-                if coin == "BTC":
-                  sl_price = round(entry_price * (1 - sl_pct))
-                  tp_price = round(entry_price * (1 + tp_pct))
-                else:
-                  sl_price = round(entry_price * (1 - sl_pct), 1)
-                  tp_price = round(entry_price * (1 + tp_pct), 1)
-                
-                sl_result = self.place_stop_loss(coin, True, size_coins, sl_price)
-                result["stop_loss"] = sl_result
-                
-                tp_result = self.place_take_profit(coin, True, size_coins, tp_price)
-                result["take_profit"] = tp_result
+                result.update(self.place_protection(
+                    coin, is_buy, float(trade_result["price"]), trade_result["size"], decision
+                ))
         
         # CLOSE
         elif action == "CLOSE":
@@ -332,7 +631,6 @@ class TradingExecutor:
         
         return result
 
-
 if __name__ == "__main__":
     print("=== Trading Executor Test ===\n")
     
@@ -0,0 +1,340 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+
+from hyperliquid.info import Info
+
+from config.settings import settings
+from database.trade_logger import TradeLogger
+from services.metrics import metrics
+from services.cassette import cassette
+from services.container import container
+
+
+# Tolleranza per considerare chiusa una posizione (arrotondamenti sulle size)
+SIZE_TOLERANCE = 1e-6
+
+# dir dei fill Hyperliquid che chiudono una posizione -> lato chiuso.
+# Un flip ("Long > Short") chiude il lato vecchio e apre l'altro con il resto.
+CLOSED_DIRECTION = {
+    "Close Long": "LONG",
+    "Close Short": "SHORT",
+    "Long > Short": "LONG",
+    "Short > Long": "SHORT",
+}
+
+# Tid dei fill già visti da ricordare per la deduplica (i più vecchi escono)
+MAX_SEEN_FILLS = 10_000
+
+
+class PositionMonitor:
+    """
+    Riconcilia i Trade aperti nel DB con i fill reali dell'exchange.
+
+    Riceve i fill via WebSocket (userFills) o, come fallback, li legge con
+    user_fills_by_time dall'ultimo visto: all'avvio, se il WebSocket non è
+    disponibile e quando resta muto per MONITOR_WS_STALE_SECONDS. Il primo
+    messaggio userFills è uno snapshot dello storico e serve solo a
+    inizializzare la deduplica. Quando un trade viene chiuso
+    (SL, TP, liquidazione o manuale) aggiorna il DB e cancella l'ordine
+    SL/TP gemello rimasto orfano.
+    """
+
+    def __init__(self, executor, use_ws: bool = None, poll_seconds: float = None, ws_stale_seconds: float = None):
+        self.executor = executor
+        self.address = executor.account_address
+        self.use_ws = settings.monitor.use_ws if use_ws is None else use_ws
+        self.poll_seconds = settings.monitor.poll_seconds if poll_seconds is None else poll_seconds
+        self.ws_stale_seconds = settings.monitor.ws_stale_seconds if ws_stale_seconds is None else ws_stale_seconds
+
+        self._lock = threading.Lock()
+        # Deduplica limitata: set per il lookup, deque per l'ordine di uscita
+        self._seen_tids = set()
+        self._seen_order = deque()
+        self._closing: Dict[int, Dict[str, float]] = {}
+        # Trade già chiusi da questo processo: due handler concorrenti non li chiudono due volte
+        self._closed_trades = set()
+        self._last_fill_ms: Optional[int] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._ws_info: Optional[Info] = None
+        self._ws_message_at = 0.0
+        self._ws_stale = False
+        # I fill dello snapshot WS fino a qui sono già coperti dal poll di avvio
+        self._snapshot_until_ms = 0
+
+    # ---------- ciclo di vita ----------
+
+    def start(self):
+        if not self.address:
+            print("[WARNING] No account address configured - position monitor disabled")
+            return
+
+        # Recupera i fill persi mentre il bot era spento
+        self._snapshot_until_ms = int(time.time() * 1000)
+        self.poll_once()
+
+        if self.use_ws and not cassette.replaying:
+            try:
+                base_url = self.executor.base_url
+                self._ws_message_at = time.time()
+                self._ws_info = Info(
+                    base_url=base_url, skip_ws=False,
+                    meta=container.meta(base_url), spot_meta=container.spot_meta(base_url)
+                )
+                self._ws_info.subscribe({"type": "userFills", "user": self.address}, self._on_ws_message)
+                self._ws_info.subscribe({"type": "allMids"}, self._on_ws_mids)
+                print("[OK] Position monitor subscribed to userFills")
+            except Exception as e:
+                print(f"[WARNING] WebSocket unavailable, polling fills every {self.poll_seconds}s: {e}")
+                self._ws_info = None
+
+        # Con il WebSocket attivo il thread fa polling solo se lo stream si ferma
+        self._thread = threading.Thread(target=self._poll_loop, name="position-monitor", daemon=True)
+        self._thread.start()
+        if self._ws_info is None:
+            print(f"[OK] Position monitor polling every {self.poll_seconds}s")
+
+    def stop(self):
+        self._stop.set()
+        if self._ws_info is not None:
+            try:
+                self._ws_info.disconnect_websocket()
+            except Exception:
+                pass
+            self._ws_info = None
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_seconds + 1)
+            self._thread = None
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_seconds):
+            if not self._ws_down():
+                continue
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"[ERROR] Position monitor poll failed: {e}")
+
+    def _ws_down(self) -> bool:
+        """True senza WebSocket o se non arriva nulla da ws_stale_seconds"""
+        if self._ws_info is None:
+            return True
+        stale = time.time() - self._ws_message_at > self.ws_stale_seconds
+        if stale != self._ws_stale:
+            self._ws_stale = stale
+            if stale:
+                metrics.inc("monitor_ws_stale_total")
+                print(f"[WARNING] Position monitor WebSocket silent for {self.ws_stale_seconds}s, polling fills")
+            else:
+                print("[OK] Position monitor WebSocket back, polling stopped")
+        return stale
+
+    def _on_ws_message(self, message: Dict[str, Any]):
+        self._ws_message_at = time.time()
+        try:
+            data = message.get("data", {})
+            fills = data.get("fills", [])
+            if not fills:
+                return
+            if data.get("isSnapshot"):
+                self._seed(fills)
+            else:
+                self.handle_fills(fills)
+        except Exception as e:
+            print(f"[ERROR] Position monitor WS handler: {e}")
+
+    def _seed(self, fills: List[Dict[str, Any]]):
+        """
+        Snapshot userFills: lo storico già riconciliato dal poll di avvio va solo
+        segnato come visto; i fill arrivati dopo il poll vengono applicati.
+        """
+        with self._lock:
+            for fill in fills:
+                if int(fill.get("time", 0)) < self._snapshot_until_ms:
+                    self._mark_seen(fill.get("tid"))
+        self.handle_fills(fills)
+
+    def _mark_seen(self, tid) -> bool:
+        """Registra il tid; False se era già visto"""
+        if tid in self._seen_tids:
+            return False
+        self._seen_tids.add(tid)
+        self._seen_order.append(tid)
+        if len(self._seen_order) > MAX_SEEN_FILLS:
+            self._seen_tids.discard(self._seen_order.popleft())
+        return True
+
+    def _on_ws_mids(self, message: Dict[str, Any]):
+        self._ws_message_at = time.time()
+        mids = message.get("data", {}).get("mids", {})
+        if mids:
+            self.executor.risk.on_prices(mids)
+
+    # ---------- riconciliazione ----------
+
+    def poll_once(self):
+        """Legge i fill dall'ultimo visto (o dall'apertura del trade più vecchio)"""
+        logger = TradeLogger(account=self.address)
+        try:
+            open_trades = logger.get_open_trades()
+        finally:
+            logger.close()
+
+        if not open_trades:
+            return
+
+        if self._last_fill_ms is not None:
+            start_ms = self._last_fill_ms
+        else:
+            oldest = min(t["timestamp_open"] for t in open_trades)
+            start_ms = int(oldest.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+        with metrics.span("hyperliquid.user_fills_by_time", upstream="hyperliquid"):
+            fills = cassette.call(
+                "hyperliquid", "user_fills_by_time", self.address,
+                lambda: self.executor.info.user_fills_by_time(self.address, start_ms)
+            )
+
+        if fills:
+            self.handle_fills(fills)
+
+    def handle_fills(self, fills: List[Dict[str, Any]]):
+        """
+        Abbina i fill di chiusura ai Trade aperti (FIFO per coin).
+        Sotto lock solo deduplica, risk engine e accumulo dei parziali:
+        DB e cancel degli ordini gemelli stanno fuori, così il thread WS
+        (che consegna anche allMids) non aspetta l'I/O.
+        """
+        with self._lock:
+            new_fills = []
+            for fill in sorted(fills, key=lambda f: f.get("time", 0)):
+                if not self._mark_seen(fill.get("tid")):
+                    continue
+                self._last_fill_ms = max(self._last_fill_ms or 0, int(fill.get("time", 0)))
+                new_fills.append(fill)
+
+                # Esposizione e PnL del risk engine seguono tutti i fill
+                self.executor.risk.on_fill(
+                    fill.get("coin"),
+                    fill.get("side") == "B",
+                    float(fill.get("sz", 0)),
+                    float(fill.get("px", 0)),
+                    closed_pnl=float(fill.get("closedPnl", 0)),
+                    fee=float(fill.get("fee", 0)),
+                    order_id=fill.get("oid"),
+                    fill_time_ms=int(fill.get("time", 0))
+                )
+
+        if not new_fills:
+            return
+        self.executor.account_state.invalidate()
+
+        closing = [f for f in new_fills if _closed_direction(f)]
+        if not closing:
+            return
+
+        logger = TradeLogger(account=self.address)
+        try:
+            open_trades = logger.get_open_trades()
+            for fill in closing:
+                metrics.inc("monitor_fills_total", coin=fill.get("coin"))
+                for trade, exit_price in self._match_fill(open_trades, fill):
+                    self._close_trade(logger, trade, exit_price, fill)
+        finally:
+            logger.close()
+
+    def _match_fill(self, open_trades: List[Dict[str, Any]], fill: Dict[str, Any]) -> List[tuple]:
+        """Accumula il fill sui trade del lato chiuso; ritorna (trade, prezzo di uscita) di quelli coperti"""
+        coin = fill.get("coin")
+        direction = _closed_direction(fill)
+        fill_ms = int(fill.get("time", 0))
+        remaining = float(fill.get("sz", 0))
+        px = float(fill.get("px", 0))
+        # In un flip solo la posizione di partenza viene chiusa, il resto apre il lato opposto
+        if fill.get("dir") in ("Long > Short", "Short > Long") and fill.get("startPosition") is not None:
+            remaining = min(remaining, abs(float(fill["startPosition"])))
+
+        completed = []
+        with self._lock:
+            for trade in open_trades:
+                if remaining <= SIZE_TOLERANCE:
+                    break
+                if trade["coin"] != coin or trade["direction"] != direction or trade["id"] in self._closed_trades:
+                    continue
+                opened_ms = int(trade["timestamp_open"].replace(tzinfo=timezone.utc).timestamp() * 1000)
+                if fill_ms < opened_ms:
+                    continue
+
+                # Accumula i fill parziali finché la size del trade è coperta
+                state = self._closing.setdefault(trade["id"], {"size": 0.0, "notional": 0.0})
+                take = min(remaining, trade["size"] - state["size"])
+                state["size"] += take
+                state["notional"] += take * px
+                remaining -= take
+
+                if state["size"] < trade["size"] - SIZE_TOLERANCE:
+                    continue
+
+                self._closed_trades.add(trade["id"])
+                del self._closing[trade["id"]]
+                completed.append((trade, state["notional"] / state["size"]))
+        return completed
+
+    def _close_trade(self, logger: TradeLogger, trade: Dict[str, Any], exit_price: float, fill: Dict[str, Any]):
+        reason = self._exit_reason(trade, fill, fill.get("oid"))
+        logger.log_trade_close(trade["id"], exit_price, reason)
+
+        fill_ms = int(fill.get("time", 0))
+        metrics.observe("reconcile_latency_seconds", max(0.0, time.time() - fill_ms / 1000))
+        print(f"[OK] Trade {trade['id']} {trade['coin']} {trade['direction']} closed by {reason} @ {exit_price:,.4f}")
+
+        self._cancel_siblings(trade, reason)
+
+    def _exit_reason(self, trade: Dict[str, Any], fill: Dict[str, Any], oid) -> str:
+        if fill.get("liquidation"):
+            return "LIQUIDATION"
+        if oid is not None and oid == trade.get("sl_order_id"):
+            return "SL"
+        if oid is not None and oid == trade.get("tp_order_id"):
+            return "TP"
+        return "MANUAL"
+
+    def _cancel_siblings(self, trade: Dict[str, Any], reason: str):
+        """Cancella gli ordini SL/TP rimasti senza posizione"""
+        orphans = []
+        if reason != "SL" and trade.get("sl_order_id"):
+            orphans.append(trade["sl_order_id"])
+        if reason != "TP" and trade.get("tp_order_id"):
+            orphans.append(trade["tp_order_id"])
+
+        for order_id in orphans:
+            result = self.executor.cancel_order(trade["coin"], order_id)
+            if result.get("success"):
+                print(f"[OK] Cancelled orphan order {order_id} on {trade['coin']}")
+            else:
+                print(f"[WARNING] Could not cancel order {order_id} on {trade['coin']}: {result.get('error', result.get('result'))}")
+
+
+def _closed_direction(fill: Dict[str, Any]) -> Optional[str]:
+    """Lato (LONG/SHORT) chiuso dal fill: chiusure, flip e liquidazioni; None se apre"""
+    direction = CLOSED_DIRECTION.get(fill.get("dir", ""))
+    if direction is None and fill.get("liquidation"):
+        # Liquidazione: una vendita chiude un long, un acquisto uno short
+        direction = "LONG" if fill.get("side") == "A" else "SHORT"
+    return direction
+
+
+# Test
+if __name__ == "__main__":
+    from execution.executor import TradingExecutor
+
+    monitor = PositionMonitor(TradingExecutor(), use_ws=False)
+    print("=== Position Monitor: one-shot reconciliation ===")
+    monitor.poll_once()
@@ -0,0 +1,306 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+
+
+class RiskEngine:
+    """
+    Limiti di rischio pre-trade mantenuti in memoria.
+
+    Esposizione per coin e totale, PnL giornaliero (realizzato del giorno +
+    variazione del non realizzato dal cambio di giorno UTC) e leva
+    dell'account sono aggiornati in modo incrementale da fill e prezzi:
+    check() costa O(1) e non fa chiamate all'exchange.
+
+    Esposizione = margine impegnato (nozionale / leva) in % dell'equity,
+    come max_position_size_pct in execute_decision.
+    """
+
+    def __init__(
+        self,
+        max_position_pct: float = None,
+        max_exposure_pct: float = None,
+        max_daily_loss_pct: float = None,
+        max_account_leverage: float = None
+    ):
+        self.max_position_pct = settings.trading.max_position_size_pct if max_position_pct is None else max_position_pct
+        self.max_exposure_pct = settings.trading.max_total_exposure_pct if max_exposure_pct is None else max_exposure_pct
+        self.max_daily_loss_pct = settings.trading.max_daily_loss_pct if max_daily_loss_pct is None else max_daily_loss_pct
+        self.max_account_leverage = settings.trading.max_account_leverage if max_account_leverage is None else max_account_leverage
+
+        self._lock = threading.Lock()
+        self.equity = 0.0
+        self.day = None
+        self.day_start_equity = 0.0
+        self.realized_pnl = 0.0
+        # Non realizzato al cambio di giorno: il PnL maturato prima non conta oggi
+        self.day_start_upnl = 0.0
+
+        # coin -> {"size", "entry", "mark", "leverage", "notional", "margin", "upnl"}
+        self.positions: Dict[str, Dict[str, float]] = {}
+        self.total_notional = 0.0
+        self.total_margin = 0.0
+        self.unrealized_pnl = 0.0
+
+        # Fill dei nostri ordini già applicati (oid -> size) per non contarli due volte
+        self._own_fills: Dict[Any, float] = {}
+        self.synced = False
+        self.synced_at_ms = 0
+
+    # ---------- aggiornamenti ----------
+
+    def sync(self, user_state: Dict[str, Any]):
+        """Riallinea tutto lo stato da un user_state già scaricato"""
+        with self._lock:
+            self._roll_day()
+            self.equity = float(user_state.get("marginSummary", {}).get("accountValue", 0))
+            if not self.synced:
+                self.day_start_equity = self.equity
+
+            self.positions = {}
+            self.total_notional = 0.0
+            self.total_margin = 0.0
+            self.unrealized_pnl = 0.0
+
+            for pos in user_state.get("assetPositions", []):
+                position = pos.get("position", {})
+                size = float(position.get("szi", 0))
+                if size == 0:
+                    continue
+                value = float(position.get("positionValue", 0))
+                self.positions[position.get("coin")] = {
+                    "size": size,
+                    "entry": float(position.get("entryPx", 0) or 0),
+                    "mark": value / abs(size) if value else float(position.get("entryPx", 0) or 0),
+                    "leverage": float(position.get("leverage", {}).get("value", 1)),
+                    "notional": 0.0,
+                    "margin": 0.0,
+                    "upnl": 0.0,
+                }
+                self._reprice(position.get("coin"))
+
+            if not self.synced:
+                self.day_start_upnl = self.unrealized_pnl
+            self.synced = True
+            self.synced_at_ms = int(time.time() * 1000)
+
+    def on_price(self, coin: str, price: float):
+        """Nuovo mark price per una coin in posizione"""
+        with self._lock:
+            pos = self.positions.get(coin)
+            if pos is None or price <= 0:
+                return
+            pos["mark"] = price
+            self._reprice(coin)
+
+    def on_prices(self, mids: Dict[str, Any]):
+        """Tick da allMids: aggiorna solo le coin in posizione"""
+        with self._lock:
+            for coin, pos in self.positions.items():
+                price = mids.get(coin)
+                if price is not None:
+                    pos["mark"] = float(price)
+                    self._reprice(coin)
+
+    def on_fill(
+        self,
+        coin: str,
+        is_buy: bool,
+        size: float,
+        price: float,
+        closed_pnl: Optional[float] = None,
+        fee: float = 0.0,
+        order_id: Any = None,
+        leverage: Optional[float] = None,
+        own: bool = False,
+        fill_time_ms: Optional[int] = None
+    ):
+        """
+        Applica un fill.
+        own=True: fill di un nostro ordine appena eseguito; se lo stesso oid
+        arriva poi dal feed dei fill, la parte già applicata viene saltata.
+        fill_time_ms: i fill precedenti all'ultimo sync sono già nello stato.
+        """
+        with self._lock:
+            # Prima del controllo sul sync: un nostro fill che torna dal feed
+            # va scalato da _own_fills anche se lo stato lo contiene già
+            if order_id is not None and not own:
+                already = self._own_fills.get(order_id, 0.0)
+                if already > 0:
+                    skipped = min(already, size)
+                    self._own_fills[order_id] = already - skipped
+                    if self._own_fills[order_id] <= 0:
+                        del self._own_fills[order_id]
+                    size -= skipped
+                    if size <= 0:
+                        return
+
+            if fill_time_ms is not None and fill_time_ms < self.synced_at_ms:
+                return
+
+            self._roll_day()
+
+            if order_id is not None and own:
+                self._own_fills[order_id] = self._own_fills.get(order_id, 0.0) + size
+
+            pos = self.positions.get(coin)
+            if pos is None:
+                pos = self.positions[coin] = {
+                    "size": 0.0, "entry": price, "mark": price,
+                    "leverage": leverage or settings.trading.default_leverage,
+                    "notional": 0.0, "margin": 0.0, "upnl": 0.0,
+                }
+            if leverage:
+                pos["leverage"] = leverage
+
+            signed = size if is_buy else -size
+            old = pos["size"]
+            new = old + signed
+
+            if old == 0 or (old > 0) == (signed > 0):
+                # Apertura o incremento: prezzo medio ponderato
+                pos["entry"] = (abs(old) * pos["entry"] + size * price) / abs(new)
+            else:
+                closed = min(abs(signed), abs(old))
+                if closed_pnl is None:
+                    direction = 1 if old > 0 else -1
+                    closed_pnl = (price - pos["entry"]) * closed * direction
+                if (new > 0) != (old > 0) and new != 0:
+                    # Flip: la parte eccedente apre al prezzo del fill
+                    pos["entry"] = price
+
+            self.realized_pnl += (closed_pnl or 0.0) - fee
+            pos["size"] = new
+            pos["mark"] = price
+            self._reprice(coin)
+
+            if new == 0:
+                self._remove(coin)
+
+    def _reprice(self, coin: str):
+        """Ricalcola i contributi di una coin ai totali (O(1))"""
+        pos = self.positions[coin]
+        self.total_notional -= pos["notional"]
+        self.total_margin -= pos["margin"]
+        self.unrealized_pnl -= pos["upnl"]
+
+        pos["notional"] = abs(pos["size"]) * pos["mark"]
+        pos["margin"] = pos["notional"] / max(pos["leverage"], 1)
+        pos["upnl"] = (pos["mark"] - pos["entry"]) * pos["size"]
+
+        self.total_notional += pos["notional"]
+        self.total_margin += pos["margin"]
+        self.unrealized_pnl += pos["upnl"]
+
+    def _remove(self, coin: str):
+        pos = self.positions.pop(coin)
+        self.total_notional -= pos["notional"]
+        self.total_margin -= pos["margin"]
+        self.unrealized_pnl -= pos["upnl"]
+
+    def _roll_day(self):
+        today = datetime.now(timezone.utc).date()
+        if self.day != today:
+            self.day = today
+            self.realized_pnl = 0.0
+            self.day_start_equity = self.equity
+            self.day_start_upnl = self.unrealized_pnl
+
+    @property
+    def daily_pnl(self) -> float:
+        """
+        PnL da inizio giornata UTC. Alla chiusura di una posizione aperta ieri il
+        realizzato include anche la parte maturata ieri, che day_start_upnl toglie.
+        """
+        return self.realized_pnl + self.unrealized_pnl - self.day_start_upnl
+
+    # ---------- controllo pre-trade ----------
+
+    def check(self, coin: str, is_buy: bool, size: float, price: float, leverage: float) -> Dict[str, Any]:
+        """
+        Verifica un ordine contro i limiti.
+        Ritorna {"allowed", "size", "reason"}: la size può essere ridotta.
+        Gli ordini che riducono una posizione sono sempre ammessi.
+        """
+        with self._lock:
+            self._roll_day()
+
+            pos = self.positions.get(coin)
+            current = pos["size"] if pos else 0.0
+            signed = size if is_buy else -size
+
+            if current != 0 and (current > 0) != (signed > 0) and abs(signed) <= abs(current):
+                return {"allowed": True, "size": size, "reason": "reducing"}
+
+            equity = self.day_start_equity if self.day_start_equity > 0 else self.equity
+            if equity <= 0 or price <= 0:
+                return self._veto(coin, "no equity or price known")
+
+            # Perdita giornaliera
+            daily_pnl = self.daily_pnl
+            if self.max_daily_loss_pct > 0 and daily_pnl <= -equity * self.max_daily_loss_pct / 100:
+                return self._veto(coin, f"daily loss limit reached ({daily_pnl:,.2f} USD)")
+
+            leverage = max(leverage, 1)
+            margin_per_unit = price / leverage
+            coin_margin = pos["margin"] if pos else 0.0
+
+            # Size massima ammessa da ciascun limite (in unità della coin)
+            limits = []
+            if self.max_position_pct > 0:
+                limits.append((equity * self.max_position_pct / 100 - coin_margin) / margin_per_unit)
+            if self.max_exposure_pct > 0:
+                limits.append((equity * self.max_exposure_pct / 100 - self.total_margin) / margin_per_unit)
+            if self.max_account_leverage > 0:
+                limits.append((equity * self.max_account_leverage - self.total_notional) / price)
+
+            allowed_size = min([size] + limits)
+            if allowed_size <= 0:
+                return self._veto(coin, "exposure limit reached")
+
+            if allowed_size < size:
+                metrics.inc("risk_resized_total", coin=coin)
+                return {"allowed": True, "size": allowed_size, "reason": "resized to exposure limit"}
+
+            return {"allowed": True, "size": size, "reason": "ok"}
+
+    def _veto(self, coin: str, reason: str) -> Dict[str, Any]:
+        metrics.inc("risk_vetoes_total", coin=coin)
+        return {"allowed": False, "size": 0.0, "reason": reason}
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            equity = self.equity or 1.0
+            return {
+                "equity": self.equity,
+                "day_start_equity": self.day_start_equity,
+                "realized_pnl": round(self.realized_pnl, 2),
+                "unrealized_pnl": round(self.unrealized_pnl, 2),
+                "daily_pnl": round(self.daily_pnl, 2),
+                "total_notional": round(self.total_notional, 2),
+                "exposure_pct": round(self.total_margin / equity * 100, 2),
+                "account_leverage": round(self.total_notional / equity, 2),
+                "positions": {c: dict(p) for c, p in self.positions.items()},
+            }
+
+
+# Test
+if __name__ == "__main__":
+    engine = RiskEngine(max_position_pct=20, max_exposure_pct=50, max_daily_loss_pct=5, max_account_leverage=5)
+    engine.sync({"marginSummary": {"accountValue": "10000"}, "assetPositions": []})
+
+    print(engine.check("BTC", True, 0.1, 100000, 3))
+    engine.on_fill("BTC", True, 0.05, 100000, leverage=3, order_id=1, own=True)
+    engine.on_fill("BTC", True, 0.05, 100000, order_id=1)
+    print(engine.check("ETH", True, 10, 3000, 3))
+    engine.on_price("BTC", 90000)
+    print(engine.snapshot())
+    print(engine.check("ETH", True, 1, 3000, 3))
@@ -0,0 +1,133 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from typing import Dict, Any, List
+
+
+def _book_side(book: Dict[str, Any], is_buy: bool) -> List[Dict[str, Any]]:
+    """Livelli L2 dal lato che consumiamo: ask per un buy, bid per un sell"""
+    levels = book.get("levels", [[], []])
+    return levels[1] if is_buy else levels[0]
+
+
+def mid_price(book: Dict[str, Any]) -> float:
+    levels = book.get("levels", [[], []])
+    if not levels[0] or not levels[1]:
+        return 0.0
+    return (float(levels[0][0]["px"]) + float(levels[1][0]["px"])) / 2
+
+
+def estimate_impact(book: Dict[str, Any], is_buy: bool, size: float) -> Dict[str, Any]:
+    """
+    Cammina il book L2 per stimare il fill di un market order.
+
+    Ritorna prezzo medio atteso, prezzo peggiore toccato e slippage
+    rispetto al mid (frazione, 0.01 = 1%).
+    """
+    mid = mid_price(book)
+    remaining = size
+    cost = 0.0
+    worst_px = 0.0
+
+    for level in _book_side(book, is_buy):
+        if remaining <= 0:
+            break
+        px = float(level["px"])
+        take = min(remaining, float(level["sz"]))
+        cost += take * px
+        remaining -= take
+        worst_px = px
+
+    filled = size - remaining
+    avg_px = cost / filled if filled > 0 else 0.0
+
+    if mid > 0 and filled > 0:
+        impact = abs(avg_px - mid) / mid
+        worst_slippage = abs(worst_px - mid) / mid
+    else:
+        impact = 0.0
+        worst_slippage = 0.0
+
+    return {
+        "mid": mid,
+        "avg_px": avg_px,
+        "worst_px": worst_px,
+        "filled": filled,
+        "fully_filled": remaining <= 0,
+        "impact": impact,
+        "worst_slippage": worst_slippage,
+    }
+
+
+def max_size_within(book: Dict[str, Any], is_buy: bool, max_slippage: float) -> float:
+    """Size massima eseguibile senza superare max_slippage dal mid"""
+    mid = mid_price(book)
+    if mid <= 0:
+        return 0.0
+
+    limit_px = mid * (1 + max_slippage) if is_buy else mid * (1 - max_slippage)
+    total = 0.0
+
+    for level in _book_side(book, is_buy):
+        px = float(level["px"])
+        if (is_buy and px > limit_px) or (not is_buy and px < limit_px):
+            break
+        total += float(level["sz"])
+
+    return total
+
+
+def plan_market_order(
+    book: Dict[str, Any],
+    is_buy: bool,
+    size: float,
+    max_slippage: float,
+    buffer: float,
+) -> Dict[str, Any]:
+    """
+    Decide il bound di slippage e se spezzare l'ordine.
+
+    - se la size sta dentro max_slippage: un solo ordine con slippage = peggiore livello + buffer
+    - altrimenti: n pezzi, ognuno entro la profondità disponibile, con slippage = max_slippage
+    """
+    estimate = estimate_impact(book, is_buy, size)
+    depth = max_size_within(book, is_buy, max_slippage)
+
+    if depth <= 0:
+        return {"slippage": max_slippage, "parts": 1, "estimate": estimate, "max_size": 0.0}
+
+    if size <= depth:
+        slippage = min(estimate["worst_slippage"] + buffer, max_slippage)
+        return {"slippage": slippage, "parts": 1, "estimate": estimate, "max_size": depth}
+
+    parts = int(-(-size // depth))
+    return {"slippage": max_slippage, "parts": parts, "estimate": estimate, "max_size": depth}
+
+
+def split_size(size: float, parts: int, decimals: int) -> List[float]:
+    """Divide size in parti arrotondate; l'ultima prende il resto"""
+    if parts <= 1:
+        return [size]
+
+    chunk = round(size / parts, decimals)
+    chunks = [chunk] * (parts - 1)
+    chunks.append(round(size - chunk * (parts - 1), decimals))
+    return [c for c in chunks if c > 0]
+
+
+# Test
+if __name__ == "__main__":
+    book = {
+        "coin": "DEMO",
+        "levels": [
+            [{"px": "99.9", "sz": "5", "n": 1}, {"px": "99.5", "sz": "10", "n": 2}, {"px": "98.0", "sz": "50", "n": 4}],
+            [{"px": "100.1", "sz": "5", "n": 1}, {"px": "100.6", "sz": "10", "n": 2}, {"px": "102.0", "sz": "50", "n": 4}],
+        ],
+    }
+
+    print(estimate_impact(book, True, 12))
+    print("Depth within 1%:", max_size_within(book, True, 0.01))
+    plan = plan_market_order(book, True, 40, max_slippage=0.01, buffer=0.002)
+    print(plan)
+    print(split_size(40, plan["parts"], 4))
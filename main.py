@@ -1,22 +1,68 @@
 import sys
 import time
+import argparse
 from datetime import datetime
 
-from agent.trading_agent import TradingAgent
-from execution.executor import TradingExecutor
-from services.context_builder import ContextBuilder
-from database.trade_logger import TradeLogger
+# Solo moduli leggeri qui: agent (anthropic), context (pandas/ta), executor
+# (eth_account/hyperliquid) e DB (sqlalchemy) si importano quando servono
+from services.container import container
 from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
 
 
 class TradingBot:
-    def __init__(self):
-        print("🤖 Initializing Trading Bot...")
-        self.agent = TradingAgent()
-        self.executor = TradingExecutor()
-        self.context_builder = ContextBuilder()
-        self.logger = TradeLogger()
+    def __init__(self, executor=None, context_builder=None, coins=None, name=None, scanner=None):
+        """
+        Senza parametri: un bot sull'account di settings.
+        Il multi-strategy runner passa executor e context builder di ogni strategia.
+        Senza coins, con UNIVERSE_SCAN_ENABLED le coin vengono scelte a ogni ciclo dallo scanner.
+        """
+        from execution.executor import TradingExecutor
+        from database.trade_logger import TradeLogger
+        
+        self.name = name
+        print(f"🤖 Initializing Trading Bot{f' [{name}]' if name else ''}...")
+        self.executor = executor or TradingExecutor()
+        self.logger = TradeLogger(account=self.executor.account_address)
+        # Context, agent e monitor vengono creati al primo uso (status non li carica)
+        self._context_builder = context_builder
+        self._agent = None
+        self._monitor = None
+        # Coda di approvazione: attiva solo nel loop senza auto-execute
+        self.approvals = None
+        # Ultima decisione (con id DB), salvata nel checkpoint per il riavvio a caldo
+        self.last_decision = None
+        self.coins = coins or settings.trading.trading_coins
+        if scanner is None and coins is None and settings.universe.enabled:
+            scanner = container.universe_scanner()
+        self.scanner = scanner
         self.running = False
+        
+        if settings.metrics.enabled:
+            metrics.start_server(settings.metrics.port)
+    
+    @property
+    def context_builder(self):
+        if self._context_builder is None:
+            from services.context_builder import ContextBuilder
+            # Un solo stato account per ciclo, condiviso da context, risk e status
+            self._context_builder = ContextBuilder(account_state=self.executor.account_state)
+        return self._context_builder
+    
+    @property
+    def agent(self):
+        if self._agent is None:
+            from agent.trading_agent import TradingAgent
+            self._agent = TradingAgent(context_builder=self.context_builder)
+        return self._agent
+    
+    @property
+    def monitor(self):
+        if self._monitor is None:
+            from execution.position_monitor import PositionMonitor
+            self._monitor = PositionMonitor(self.executor)
+        return self._monitor
     
     def show_status(self):
         """Mostra stato attuale"""
@@ -47,20 +93,32 @@ class TradingBot:
             print(f"  Win Rate: {stats['win_rate']}%")
             print(f"  Total PnL: ${stats['total_pnl_usd']:.2f}")
     
-    def run_once(self, auto_execute: bool = False):
-        """Esegue un ciclo di analisi e trading"""
+    def run_once(self, auto_execute: bool = False, interactive: bool = True):
+        """
+        Esegue un ciclo di analisi e trading.
+        interactive=False: senza auto_execute la decisione viene solo salvata.
+        """
         print("\n" + "=" * 50)
-        print(f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"🕐 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}{f'  [{self.name}]' if self.name else ''}")
         print("=" * 50)
         
+        # Chiude nel DB i trade già chiusi da SL/TP sull'exchange
+        if settings.monitor.enabled:
+            self.monitor.poll_once()
+        
+        # Snapshot dell'account per tutto il ciclo
+        self.executor.account_state.get(max_age=0)
+        
         self.show_status()
         
+        coins = self.select_coins()
+        
         # Analisi LLM
         print("\n🧠 LLM analyzing market...")
         
         # Costruisci context
-        context = self.context_builder.build_context(["BTC", "ETH"])
-        decision = self.agent.get_trading_decision(["BTC", "ETH"])
+        context = self.context_builder.build_context(coins)
+        decision = self.agent.get_trading_decision(coins, context=context)
         
         print("\n" + "-" * 30)
         print("💡 LLM DECISION:")
@@ -80,6 +138,7 @@ class TradingBot:
         # Salva decisione nel DB
         decision_id = self.logger.log_decision(context=context, decision=decision)
         print(f"\n💾 Decision saved to DB (ID: {decision_id})")
+        self.last_decision = {"decision": decision, "decision_id": decision_id, "timestamp": time.time()}
         
         # Esegui trade
         if decision.get('decision') == "HOLD":
@@ -88,59 +147,141 @@ class TradingBot:
         
         if auto_execute:
             execute = True
+        elif self.approvals:
+            # Il loop non si ferma: la decisione aspetta l'approvazione in coda
+            price = self.executor.get_price(decision.get('coin'))
+            pending = self.approvals.submit(decision, decision_id, price)
+            print(f"\n📨 Awaiting approval: {pending.id} (expires in {self.approvals.ttl:.0f}s)")
+            print(f"   python main.py approve {pending.id}   |   python main.py reject {pending.id}")
+            return
+        elif not interactive:
+            print("\n📋 Advisory mode - decision logged, not executed")
+            return
         else:
             print("\n" + "=" * 50)
             response = input("Execute trade? (yes/no): ").strip().lower()
             execute = response == "yes"
         
         if execute:
-            print("\n⚡ Executing trade...")
-            result = self.executor.execute_decision(decision)
-            
-            if result.get("trade", {}).get("success"):
-                trade = result["trade"]
-                print("✅ Trade executed successfully!")
-                print(f"  {trade['side']} {trade['coin']}")
-                print(f"  Size: {trade['size']}")
-                print(f"  Price: ${trade['price']:,.2f}")
-                
-                # Calcola size_usd
-                size_usd = trade['size'] * trade['price'] / trade['leverage']
-                
-                # Calcola SL/TP prices
-                sl_pct = decision.get('stop_loss_pct', 3) / 100
-                tp_pct = decision.get('take_profit_pct', 6) / 100
-                
-                if trade['side'] == "LONG":
-                    sl_price = trade['price'] * (1 - sl_pct)
-                    tp_price = trade['price'] * (1 + tp_pct)
-                else:
-                    sl_price = trade['price'] * (1 + sl_pct)
-                    tp_price = trade['price'] * (1 - tp_pct)
-                
-                # Salva trade nel DB
-                trade_id = self.logger.log_trade_open(
-                    coin=trade['coin'],
-                    direction=trade['side'],
-                    entry_price=trade['price'],
-                    size=trade['size'],
-                    size_usd=size_usd,
-                    leverage=trade['leverage'],
-                    sl_price=sl_price,
-                    tp_price=tp_price,
-                    decision_id=decision_id
-                )
-                print(f"💾 Trade saved to DB (ID: {trade_id})")
-                
-            else:
-                print(f"❌ Trade failed: {result}")
-            
+            self._execute(decision, decision_id, self.logger)
             self.show_status()
         else:
             print("\n❌ Trade cancelled")
     
-    def run_loop(self, interval_minutes: int = 60):
-        """Esegue il bot in loop"""
+    def _execute(self, decision, decision_id, logger, reference_price=None):
+        """Esegue la decisione e salva il trade; reference_price attiva il controllo di drift"""
+        print("\n⚡ Executing trade...")
+        result = self.executor.execute_decision(
+            decision,
+            on_complete=lambda summary: self._on_algo_complete(summary, decision, decision_id),
+            reference_price=reference_price,
+            max_drift_pct=settings.approval.max_drift_pct if reference_price else None
+        )
+        
+        if result.get("algo"):
+            algo = result["algo"]
+            print(f"🧩 Large order sliced: {algo['algo']} {algo['id']} ({algo['target_size']} {algo['coin']})")
+            print("   Executing in background, trade will be saved when done")
+        
+        elif result.get("trade", {}).get("success"):
+            trade = result["trade"]
+            print("✅ Trade executed successfully!")
+            print(f"  {trade['side']} {trade['coin']}")
+            print(f"  Size: {trade['size']}")
+            print(f"  Price: ${trade['price']:,.2f}")
+            
+            trade_id = self._log_trade(logger, trade, decision, decision_id, result)
+            print(f"💾 Trade saved to DB (ID: {trade_id})")
+        
+        elif result.get("stale"):
+            print(f"⌛ Trade skipped: {result['error']}")
+        
+        else:
+            print(f"❌ Trade failed: {result}")
+        
+        return result
+    
+    def _execute_approved(self, pending):
+        """Callback dal thread della coda: sessione DB dedicata e controllo di drift"""
+        from database.trade_logger import TradeLogger
+        
+        logger = TradeLogger(account=self.executor.account_address)
+        try:
+            return self._execute(pending.decision, pending.decision_id, logger, reference_price=pending.price)
+        finally:
+            logger.close()
+    
+    def checkpoint_state(self):
+        return {"last_decision": self.last_decision}
+    
+    def restore_checkpoint(self, state):
+        self.last_decision = state["last_decision"]
+        if self.last_decision:
+            decision = self.last_decision["decision"]
+            age = (time.time() - self.last_decision["timestamp"]) / 60
+            print(f"   Last decision {age:.0f} min ago: {decision.get('decision')} {decision.get('coin') or ''}")
+    
+    def select_coins(self) -> list:
+        """Coin del ciclo: fisse, oppure top-K dello scanner più quelle in posizione"""
+        if not self.scanner:
+            return self.coins
+        
+        pinned = [p['coin'] for p in self.executor.get_positions()]
+        coins = self.scanner.select(pinned=pinned)
+        print(f"\n🔭 Universe scan: {len(self.scanner.last_scan)} eligible perps -> {', '.join(coins)}")
+        return coins
+    
+    def _log_trade(self, logger, trade, decision, decision_id, protection):
+        """Salva nel DB un trade aperto con gli id degli ordini SL/TP"""
+        # Calcola size_usd
+        size_usd = trade['size'] * trade['price'] / trade['leverage']
+        
+        # Calcola SL/TP prices
+        sl_pct = decision.get('stop_loss_pct', 3) / 100
+        tp_pct = decision.get('take_profit_pct', 6) / 100
+        
+        if trade['side'] == "LONG":
+            sl_price = trade['price'] * (1 - sl_pct)
+            tp_price = trade['price'] * (1 + tp_pct)
+        else:
+            sl_price = trade['price'] * (1 + sl_pct)
+            tp_price = trade['price'] * (1 - tp_pct)
+        
+        return logger.log_trade_open(
+            coin=trade['coin'],
+            direction=trade['side'],
+            entry_price=trade['price'],
+            size=trade['size'],
+            size_usd=size_usd,
+            leverage=trade['leverage'],
+            sl_price=sl_price,
+            tp_price=tp_price,
+            decision_id=decision_id,
+            sl_order_id=protection.get('stop_loss', {}).get('order_id'),
+            tp_order_id=protection.get('take_profit', {}).get('order_id')
+        )
+    
+    def _on_algo_complete(self, summary, decision, decision_id):
+        """Callback dal thread dello scheduler: usa una sessione DB dedicata"""
+        if summary['size'] <= 0:
+            print(f"\n❌ Algo {summary['id']} {summary['state']} with no fills")
+            return
+        
+        from database.trade_logger import TradeLogger
+        
+        logger = TradeLogger(account=self.executor.account_address)
+        try:
+            trade_id = self._log_trade(logger, summary, decision, decision_id, summary['protection'])
+            print(f"\n💾 Algo {summary['id']} {summary['state']}: trade saved to DB (ID: {trade_id})")
+        finally:
+            logger.close()
+    
+    def run_loop(self, interval_minutes: int = 60, auto_execute: bool = False, interactive: bool = True):
+        """
+        Esegue il bot in loop.
+        interactive=True senza auto_execute: le decisioni vanno nella coda di
+        approvazione e il loop (dati, monitor) continua senza aspettare.
+        """
         print("\n" + "=" * 50)
         print(f"🔄 STARTING AUTO-TRADING LOOP")
         print(f"   Interval: {interval_minutes} minutes")
@@ -148,13 +289,25 @@ class TradingBot:
         print("=" * 50)
         
         self.running = True
+        # Riavvio a caldo: stato del bot e dei servizi condivisi dal checkpoint
+        checkpoint = container.checkpoint()
+        checkpoint.register(f"bot:{self.name or 'default'}", self)
+        
+        if settings.monitor.enabled:
+            self.monitor.start()
+        
+        if interactive and not auto_execute:
+            from execution.approvals import ApprovalQueue
+            self.approvals = ApprovalQueue(execute=self._execute_approved)
+            self.approvals.start()
         
         while self.running:
             try:
-                self.run_once(auto_execute=False)
+                self.run_once(auto_execute=auto_execute, interactive=interactive)
+                checkpoint.maybe_save()
                 
                 print(f"\n⏳ Next analysis in {interval_minutes} minutes...")
-                time.sleep(interval_minutes * 60)
+                cassette.sleep(interval_minutes * 60)
                 
             except KeyboardInterrupt:
                 print("\n\n🛑 Stopping bot...")
@@ -164,11 +317,140 @@ class TradingBot:
                 print("Retrying in 60 seconds...")
                 time.sleep(60)
         
+        if self._monitor:
+            self._monitor.stop()
+        if self.approvals:
+            self.approvals.stop()
+            self.approvals = None
+        self.executor.algos.shutdown()
         self.logger.close()
+        container.shutdown()
+        metrics.close()
+        cassette.close()
         print("👋 Bot stopped")
 
 
+# Moduli caricati da ogni sottocomando, per bench-imports
+COMMAND_IMPORTS = {
+    "menu": ["main"],
+    "status": ["execution.executor", "database.trade_logger"],
+    "flatten": ["execution.close_trade"],
+    "approve": ["execution.approvals"],
+    "run-once": [
+        "execution.executor", "database.trade_logger", "execution.position_monitor",
+        "services.context_builder", "agent.trading_agent"
+    ],
+}
+
+
+def bench_imports(repeat: int = 3):
+    """Tempo di import a freddo (in un processo nuovo) per ogni sottocomando"""
+    import subprocess
+    from pathlib import Path
+    
+    print(f"=== Import time per command (cold, best of {repeat}) ===")
+    for command, modules in COMMAND_IMPORTS.items():
+        code = (
+            "import time; start = time.perf_counter(); "
+            + "; ".join(f"import {module}" for module in modules)
+            + "; print(time.perf_counter() - start)"
+        )
+        timings = []
+        for _ in range(repeat):
+            result = subprocess.run(
+                [sys.executable, "-c", code], cwd=Path(__file__).parent, capture_output=True, text=True
+            )
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "unknown error"
+                print(f"  {command:<10} failed: {error}")
+                break
+            timings.append(float(result.stdout.strip().splitlines()[-1]))
+        if timings:
+            print(f"  {command:<10} {min(timings) * 1000:>7.0f} ms")
+
+
+def cli(argv):
+    """Sottocomandi non interattivi: ognuno importa solo quello che usa"""
+    parser = argparse.ArgumentParser(prog="main.py", description="AI-powered trading bot on Hyperliquid")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    commands.add_parser("status", help="show balance, positions and trade stats")
+    
+    run_once = commands.add_parser("run-once", help="run a single analysis cycle")
+    run_once.add_argument("--execute", action="store_true", help="execute the decision without asking")
+    
+    loop = commands.add_parser("loop", help="run the analysis loop")
+    loop.add_argument("--interval", type=int, default=60, help="minutes between cycles (default 60)")
+    loop.add_argument("--execute", action="store_true", help="execute decisions without asking")
+    loop.add_argument("--strategies", action="store_true", help="run every strategy in STRATEGIES_FILE")
+    loop.add_argument("--approval", action="store_true", help="queue decisions for approval instead of only logging them")
+    
+    commands.add_parser("flatten", help="close all open positions immediately")
+    
+    backfill = commands.add_parser("backfill", help="bulk-load historical candles into the candles table")
+    backfill.add_argument("--coins", nargs="+", default=None, help="coins to load (default TRADING_COINS)")
+    backfill.add_argument("--interval", default="1m", help="candle interval (default 1m)")
+    backfill.add_argument("--days", type=float, default=30, help="days of history (default 30)")
+    
+    retention = commands.add_parser("retention", help="downsample old candles and archive old decisions and snapshots")
+    retention.add_argument("--dry-run", action="store_true", help="only report what would be archived or deleted")
+    
+    commands.add_parser("pending", help="list decisions awaiting approval")
+    for verdict in ("approve", "reject"):
+        command = commands.add_parser(verdict, help=f"{verdict} a pending decision of a running loop")
+        command.add_argument("id", help="pending decision id")
+    
+    bench = commands.add_parser("bench-imports", help="measure import time of each command")
+    bench.add_argument("--repeat", type=int, default=3)
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == "flatten":
+        from execution.close_trade import close_all
+        close_all()
+    elif args.command == "backfill":
+        from database.candle_store import CandleStore, backfill
+        store = CandleStore()
+        for coin in args.coins or settings.trading.trading_coins:
+            start = time.perf_counter()
+            written = backfill(coin, args.interval, args.days, store)
+            print(f"{coin} {args.interval}: {written:,} candles in {time.perf_counter() - start:.1f}s")
+    elif args.command == "retention":
+        from database.retention import RetentionManager, print_report
+        print_report(RetentionManager(dry_run=args.dry_run).run())
+    elif args.command == "pending":
+        from execution.approvals import read_pending
+        pending = read_pending()
+        if not pending:
+            print("No decisions awaiting approval")
+        for item in pending:
+            print(f"  {item['id']}  {item['action']} {item['coin']} @ ${item['price']:,.4f}  "
+                  f"size {item['size_pct']}%  {item['leverage']}x  "
+                  f"expires in {max(item['expires_at'] - time.time(), 0):.0f}s")
+    elif args.command in ("approve", "reject"):
+        from execution.approvals import request_verdict
+        request_verdict(args.id, args.command)
+        print(f"Sent {args.command} for {args.id}")
+    elif args.command == "bench-imports":
+        bench_imports(args.repeat)
+    elif args.command == "loop" and args.strategies:
+        from strategy_runner import StrategyRunner, load_strategies
+        StrategyRunner(load_strategies()).run_loop(interval_minutes=args.interval)
+    else:
+        bot = TradingBot()
+        if args.command == "status":
+            bot.show_status()
+        elif args.command == "run-once":
+            bot.run_once(auto_execute=args.execute, interactive=False)
+        elif args.command == "loop":
+            bot.run_loop(interval_minutes=args.interval, auto_execute=args.execute, interactive=args.approval)
+
+
 def main():
+    if len(sys.argv) > 1:
+        cli(sys.argv[1:])
+        return
+    
     print("""
     ╔═══════════════════════════════════════════════════════════╗
     ║           🤖 CRYPTO TRADING BOT v1.0                      ║
@@ -181,8 +463,23 @@ def main():
     print("  2. Run loop (continuous trading)")
     print("  3. Show status only")
     print("  4. Exit")
+    print("  5. Run multi-strategy loop (strategies file)")
     
-    choice = input("\nEnter choice (1-4): ").strip()
+    choice = input("\nEnter choice (1-5): ").strip()
+    
+    if choice == "5":
+        from strategy_runner import StrategyRunner, load_strategies
+        runner = StrategyRunner(load_strategies())
+        interval = input("Interval in minutes (default 60): ").strip()
+        runner.run_loop(interval_minutes=int(interval) if interval else 60)
+        return
+    
+    if choice == "4":
+        print("👋 Bye!")
+        return
+    if choice not in ("1", "2", "3"):
+        print("Invalid choice")
+        return
     
     bot = TradingBot()
     
@@ -194,10 +491,6 @@ def main():
         bot.run_loop(interval_minutes=interval)
     elif choice == "3":
         bot.show_status()
-    elif choice == "4":
-        print("👋 Bye!")
-    else:
-        print("Invalid choice")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,120 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from typing import Dict, Any, Callable, List, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+
+
+class AccountStateProvider:
+    """
+    Stato dell'account (balance, posizioni, PnL, margine) da un solo user_state,
+    condiviso tra executor, context dell'LLM, risk engine e show_status.
+
+    Il bot lo aggiorna una volta per ciclo con refresh(); le letture
+    successive usano lo snapshot in cache finché non scade o viene invalidato
+    (ad esempio dopo un ordine).
+    """
+
+    def __init__(self, info, address: str, ttl_seconds: float = None):
+        self.info = info
+        self.address = address
+        self.ttl = settings.trading.account_state_ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._snapshot: Optional[Dict[str, Any]] = None
+        self._fetched_at = 0.0
+        self._lock = threading.Lock()
+        self._listeners: List[Callable[[Dict[str, Any]], None]] = []
+
+    def add_listener(self, callback: Callable[[Dict[str, Any]], None]):
+        """callback(user_state) chiamata a ogni refresh (es. RiskEngine.sync)"""
+        self._listeners.append(callback)
+
+    def refresh(self) -> Dict[str, Any]:
+        """Scarica user_state e ricostruisce lo snapshot"""
+        if not self.address:
+            return {"error": "No account address configured"}
+
+        with metrics.span("hyperliquid.user_state", upstream="hyperliquid"):
+            user_state = cassette.call(
+                "hyperliquid", "user_state", self.address,
+                lambda: self.info.user_state(self.address)
+            )
+
+        snapshot = self._parse(user_state)
+        with self._lock:
+            self._snapshot = snapshot
+            self._fetched_at = time.time()
+
+        for callback in self._listeners:
+            callback(user_state)
+
+        return snapshot
+
+    def get(self, max_age: Optional[float] = None) -> Dict[str, Any]:
+        """Snapshot in cache, o uno nuovo se più vecchio di max_age (default: TTL)"""
+        max_age = self.ttl if max_age is None else max_age
+        with self._lock:
+            snapshot = self._snapshot
+            age = time.time() - self._fetched_at
+        if snapshot is not None and age <= max_age:
+            return snapshot
+        try:
+            return self.refresh()
+        except Exception as e:
+            return {"error": str(e)}
+
+    def invalidate(self):
+        """Forza il prossimo get() a riscaricare (dopo ordini o chiusure)"""
+        with self._lock:
+            self._fetched_at = 0.0
+
+    def _parse(self, user_state: Dict[str, Any]) -> Dict[str, Any]:
+        margin = user_state.get("marginSummary", {})
+        balance = float(margin.get("accountValue", 0))
+        margin_used = float(margin.get("totalMarginUsed", 0))
+        positions = []
+
+        for pos in user_state.get("assetPositions", []):
+            position = pos.get("position", {})
+            size = float(position.get("szi", 0))
+
+            if size != 0:
+                positions.append({
+                    "coin": position.get("coin"),
+                    "size": size,
+                    "entry_price": float(position.get("entryPx", 0)),
+                    "unrealized_pnl": float(position.get("unrealizedPnl", 0)),
+                    "leverage": float(position.get("leverage", {}).get("value", 1)),
+                    "position_value": float(position.get("positionValue", 0)),
+                    "margin_used": float(position.get("marginUsed", 0)),
+                    "liquidation_price": float(position.get("liquidationPx") or 0),
+                    "side": "LONG" if size > 0 else "SHORT"
+                })
+
+        return {
+            "balance": balance,
+            "available": float(user_state.get("withdrawable", 0)),
+            "margin_used": margin_used,
+            "total_notional": float(margin.get("totalNtlPos", 0)),
+            "unrealized_pnl": round(sum(p["unrealized_pnl"] for p in positions), 2),
+            "exposure_pct": round(margin_used / balance * 100, 2) if balance > 0 else 0.0,
+            "positions": positions,
+        }
+
+
+# Test
+if __name__ == "__main__":
+    from hyperliquid.info import Info
+    from hyperliquid.utils import constants
+
+    base_url = constants.TESTNET_API_URL if settings.hyperliquid.testnet else constants.MAINNET_API_URL
+    provider = AccountStateProvider(Info(base_url=base_url, skip_ws=True), settings.hyperliquid.account_address)
+
+    state = provider.refresh()
+    print(state)
+    print("Cached:", provider.get() is state)
@@ -0,0 +1,115 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+
+
+# Hyperliquid perps: prezzi con max 5 cifre significative e (6 - szDecimals) decimali
+MAX_PRICE_DECIMALS = 6
+MAX_SIGNIFICANT_FIGURES = 5
+
+# Per una coin sconosciuta non ricarichiamo più spesso di così
+UNKNOWN_COIN_REFRESH_SECONDS = 60
+
+
+class AssetMetaCache:
+    """
+    Metadati degli asset perp (szDecimals, maxLeverage) caricati una volta
+    da `meta` e ricaricati dopo un TTL.
+    """
+
+    def __init__(self, info, ttl_seconds: float = None, meta: Optional[Dict[str, Any]] = None):
+        self.info = info
+        self.ttl = ttl_seconds if ttl_seconds is not None else settings.trading.meta_ttl_seconds
+        self._assets: Dict[str, Dict[str, Any]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        # meta già scaricato (es. dal container all'avvio): nessuna richiesta in più
+        if meta is not None:
+            self.load(meta)
+
+    def refresh(self):
+        """Ricarica l'universo degli asset"""
+        with metrics.span("hyperliquid.meta", upstream="hyperliquid"):
+            meta = cassette.call("hyperliquid", "meta", None, self.info.meta)
+        self.load(meta)
+
+    def load(self, meta: Dict[str, Any]):
+        """Costruisce la cache da una risposta di `meta`"""
+        assets = {}
+        for index, asset in enumerate(meta.get("universe", [])):
+            sz_decimals = int(asset.get("szDecimals", 0))
+            assets[asset["name"]] = {
+                "index": index,
+                "sz_decimals": sz_decimals,
+                "px_decimals": max(MAX_PRICE_DECIMALS - sz_decimals, 0),
+                "max_leverage": int(asset.get("maxLeverage", 1)),
+                "only_isolated": bool(asset.get("onlyIsolated", False)),
+                "delisted": bool(asset.get("isDelisted", False)),
+            }
+
+        with self._lock:
+            self._assets = assets
+            self._loaded_at = time.time()
+
+    def _ensure_loaded(self, coin: Optional[str] = None):
+        age = time.time() - self._loaded_at
+        unknown = coin is not None and coin not in self._assets and age > UNKNOWN_COIN_REFRESH_SECONDS
+        if age > self.ttl or unknown:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[ERROR] Error loading asset metadata: {e}")
+
+    def get(self, coin: str) -> Optional[Dict[str, Any]]:
+        """Metadati di una coin (ricarica se scaduti o se la coin è sconosciuta)"""
+        self._ensure_loaded(coin)
+        return self._assets.get(coin)
+
+    def coins(self) -> list:
+        """Tutte le perp quotate"""
+        self._ensure_loaded()
+        return [name for name, asset in self._assets.items() if not asset["delisted"]]
+
+    def sz_decimals(self, coin: str, default: int = 4) -> int:
+        asset = self.get(coin)
+        return asset["sz_decimals"] if asset else default
+
+    def max_leverage(self, coin: str, default: int = 1) -> int:
+        asset = self.get(coin)
+        return asset["max_leverage"] if asset else default
+
+    def round_size(self, coin: str, size: float) -> float:
+        return round(size, self.sz_decimals(coin))
+
+    def round_price(self, coin: str, price: float) -> float:
+        """Arrotonda a 5 cifre significative e ai decimali ammessi per la coin"""
+        if price <= 0:
+            return 0.0
+        asset = self.get(coin)
+        px_decimals = asset["px_decimals"] if asset else MAX_PRICE_DECIMALS
+        # I prezzi interi sono sempre validi, anche con più di 5 cifre
+        if price >= 10 ** MAX_SIGNIFICANT_FIGURES:
+            return float(round(price))
+        return round(float(f"{price:.{MAX_SIGNIFICANT_FIGURES}g}"), px_decimals)
+
+
+# Test
+if __name__ == "__main__":
+    from hyperliquid.info import Info
+    from hyperliquid.utils import constants
+
+    cache = AssetMetaCache(Info(base_url=constants.MAINNET_API_URL, skip_ws=True))
+
+    for coin in ["BTC", "ETH", "SOL", "DOGE"]:
+        asset = cache.get(coin)
+        print(f"{coin}: {asset}")
+        print(f"  size 0.123456789 -> {cache.round_size(coin, 0.123456789)}")
+        print(f"  price 1234.56789 -> {cache.round_price(coin, 1234.56789)}")
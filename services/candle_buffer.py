@@ -0,0 +1,147 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+OHLCV_FIELDS = ("o", "h", "l", "c", "v")
+
+
+class CandleBuffer:
+    """
+    Ring buffer a capacità fissa delle candele di una coin/timeframe.
+
+    Timestamp in un array int64 e o, h, l, c, v in un array float64 (5, n).
+    Lo storage è doppio e speculare (ogni candela scritta in i e i + capacity):
+    le ultime n candele sono sempre una fetta contigua, quindi arrays()
+    restituisce viste NumPy senza copie né allocazioni.
+
+    extend() modifica il buffer sul posto: chi condivide un buffer tra
+    thread (MarketDataStore) lo tratta come immutabile una volta pubblicato
+    e aggiorna una copia (resized).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._t = np.zeros(2 * capacity, dtype=np.int64)
+        self._ohlcv = np.zeros((len(OHLCV_FIELDS), 2 * capacity), dtype=np.float64)
+        # Prossima posizione di scrittura in [0, capacity)
+        self._head = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_t(self) -> Optional[int]:
+        return int(self._t[self._head - 1 + self.capacity]) if self._size else None
+
+    def _write(self, pos: int, t: int, values: Tuple[float, ...]):
+        self._t[pos] = self._t[pos + self.capacity] = t
+        self._ohlcv[:, pos] = self._ohlcv[:, pos + self.capacity] = values
+
+    def extend(self, candles: Iterable[Dict[str, Any]]) -> int:
+        """
+        Aggiunge candele in formato Hyperliquid (JSON già parsato, campi stringa)
+        in ordine di tempo. Una candela con lo stesso t dell'ultima la aggiorna
+        (candela ancora aperta), quelle più vecchie vengono ignorate.
+        Ritorna il numero di candele nuove.
+        """
+        added = 0
+        last = self.last_t
+        for candle in candles:
+            t = int(candle["t"])
+            if last is not None and t < last:
+                continue
+            values = tuple(float(candle[field]) for field in OHLCV_FIELDS)
+            if t == last:
+                self._write((self._head - 1) % self.capacity, t, values)
+                continue
+            self._write(self._head, t, values)
+            self._head = (self._head + 1) % self.capacity
+            self._size = min(self._size + 1, self.capacity)
+            last = t
+            added += 1
+        return added
+
+    def clear(self):
+        self._head = 0
+        self._size = 0
+
+    def arrays(self, n: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Ultime n candele come viste (t (n,), ohlcv (5, n)), dalla più vecchia"""
+        n = self._size if n is None else min(n, self._size)
+        end = self._head + self.capacity
+        return self._t[end - n:end], self._ohlcv[:, end - n:end]
+
+    def to_candles(self, n: int = None) -> List[Dict[str, Any]]:
+        """Ultime n candele come dict (per chi usa ancora il formato dell'exchange)"""
+        t, ohlcv = self.arrays(n)
+        columns = [t.tolist()] + [row.tolist() for row in ohlcv]
+        return [dict(zip(("t",) + OHLCV_FIELDS, values)) for values in zip(*columns)]
+
+    def resized(self, capacity: int) -> "CandleBuffer":
+        """Nuovo buffer con altra capacità e le ultime candele di questo"""
+        buffer = CandleBuffer(capacity)
+        t, ohlcv = self.arrays(capacity)
+        n = len(t)
+        buffer._t[:n] = buffer._t[capacity:capacity + n] = t
+        buffer._ohlcv[:, :n] = buffer._ohlcv[:, capacity:capacity + n] = ohlcv
+        buffer._head = n % capacity
+        buffer._size = n
+        return buffer
+
+
+def resample_ohlcv(t: np.ndarray, ohlcv: np.ndarray, base_ms: int, step_ms: int,
+                   drop_partial: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Aggrega candele da base_ms in candele da step_ms, vettorizzato.
+    I bucket sono allineati all'epoch UTC come quelli dell'exchange; l'ultima
+    candela può essere parziale (come quella in corso), la prima parziale
+    viene scartata se drop_partial.
+    """
+    if not len(t):
+        return t, ohlcv
+
+    buckets = t // step_ms * step_ms
+    starts = np.flatnonzero(np.concatenate(([True], buckets[1:] != buckets[:-1])))
+    ends = np.append(starts[1:], len(t))
+
+    bars = np.empty((len(OHLCV_FIELDS), len(starts)), dtype=np.float64)
+    bars[0] = ohlcv[0, starts]
+    bars[1] = np.maximum.reduceat(ohlcv[1], starts)
+    bars[2] = np.minimum.reduceat(ohlcv[2], starts)
+    bars[3] = ohlcv[3, ends - 1]
+    bars[4] = np.add.reduceat(ohlcv[4], starts)
+    bar_t = buckets[starts]
+
+    if drop_partial and ends[0] - starts[0] < step_ms // base_ms:
+        return bar_t[1:], bars[:, 1:]
+    return bar_t, bars
+
+
+# Test
+if __name__ == "__main__":
+    hour = 60 * 60 * 1000
+    candles = [
+        {"t": i * hour, "o": str(100 + i), "h": str(101 + i), "l": str(99 + i), "c": str(100.5 + i), "v": "10"}
+        for i in range(12)
+    ]
+
+    buffer = CandleBuffer(capacity=8)
+    print("Added:", buffer.extend(candles), "size:", len(buffer))
+
+    t, ohlcv = buffer.arrays(5)
+    print("Last 5 t (h):", (t // hour).tolist(), "close:", ohlcv[3].tolist())
+    print("Zero-copy view:", np.shares_memory(ohlcv, buffer._ohlcv))
+
+    # Candela in corso aggiornata, poi una nuova
+    buffer.extend([{**candles[-1], "c": "200"}, {"t": 12 * hour, "o": "200", "h": "201", "l": "199", "c": "200.5", "v": "1"}])
+    t, ohlcv = buffer.arrays(3)
+    print("After update t (h):", (t // hour).tolist(), "close:", ohlcv[3].tolist())
+
+    grown = buffer.resized(16)
+    print("Resized:", len(grown), grown.to_candles(2))
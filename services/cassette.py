@@ -0,0 +1,164 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import gzip
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Dict, Optional
+
+from config.settings import settings
+
+
+class CassetteMiss(KeyError):
+    """Nessuna risposta registrata per la richiesta in replay"""
+
+
+class ReplayedError(Exception):
+    """Errore registrato durante la sessione originale, rilanciato in replay"""
+
+
+class Cassette:
+    """
+    Record/replay di tutte le chiamate verso servizi esterni.
+
+    mode:
+      off    -> chiamata diretta
+      record -> esegue la chiamata e salva risposta + durata su file (JSON lines gzip)
+      replay -> serve le risposte salvate, nello stesso ordine, senza rete
+    speed (solo replay):
+      0   -> il più veloce possibile
+      1   -> con i tempi registrati
+      N   -> tempi registrati accelerati N volte
+    """
+
+    def __init__(self, mode: str = "off", path: str = "", speed: float = 0.0):
+        self.mode = mode
+        self.path = Path(path) if path else None
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._writer = None
+        self._tapes: Dict[str, deque] = defaultdict(deque)
+        self._last: Dict[str, dict] = {}
+
+        if mode == "record":
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._writer = gzip.open(self.path, "at", encoding="utf-8")
+            print(f"[OK] Recording upstream I/O to {self.path}")
+        elif mode == "replay":
+            self._load()
+            print(f"[OK] Replaying upstream I/O from {self.path}")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    def _load(self):
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                # Chiamate interrotte (registrate da versioni precedenti): nessuna risposta da ripetere
+                if "r" in entry or "e" in entry:
+                    self._tapes[entry["k"]].append(entry)
+
+    @staticmethod
+    def _key(upstream: str, op: str, key: Any) -> str:
+        return json.dumps([upstream, op, key], sort_keys=True, default=str, separators=(",", ":"))
+
+    def call(self, upstream: str, op: str, key: Any, fn: Callable[[], Any]) -> Any:
+        """
+        Esegue fn() passando dal registratore.
+
+        key identifica la richiesta: deve contenere solo i parametri stabili
+        (coin, interval, ...), non timestamp calcolati al momento della chiamata.
+        """
+        if self.mode == "off":
+            return fn()
+
+        tape_key = self._key(upstream, op, key)
+
+        if self.mode == "replay":
+            return self._replay(tape_key)
+
+        wall = time.time()
+        start = time.perf_counter()
+        entry = {"k": tape_key, "t": round(wall, 3)}
+        try:
+            result = fn()
+            entry["r"] = result
+            return result
+        except Exception as e:
+            entry["e"] = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            # Interrotta da KeyboardInterrupt/CancelledError: né risposta né errore, non si registra
+            if "r" in entry or "e" in entry:
+                entry["d"] = round(time.perf_counter() - start, 4)
+                line = json.dumps(entry, default=str, separators=(",", ":"))
+                with self._lock:
+                    self._writer.write(line + "\n")
+
+    def _replay(self, tape_key: str) -> Any:
+        with self._lock:
+            tape = self._tapes.get(tape_key)
+            if tape:
+                entry = tape.popleft()
+                self._last[tape_key] = entry
+            else:
+                # Nastro esaurito: ripete l'ultima risposta nota
+                entry = self._last.get(tape_key)
+
+        if entry is None:
+            raise CassetteMiss(tape_key)
+
+        if self.speed > 0:
+            time.sleep(entry["d"] / self.speed)
+
+        if "e" in entry:
+            raise ReplayedError(entry["e"])
+        return entry["r"]
+
+    def scaled(self, seconds: float) -> float:
+        """Durata effettiva di un'attesa: accelerata (o azzerata con speed=0) in replay"""
+        if self.mode == "replay":
+            return seconds / self.speed if self.speed > 0 else 0.0
+        return seconds
+
+    def sleep(self, seconds: float):
+        """time.sleep che in replay viene accelerato (o saltato con speed=0)"""
+        delay = self.scaled(seconds)
+        if delay > 0:
+            time.sleep(delay)
+
+    def close(self):
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+cassette = Cassette(
+    mode=settings.cassette.mode,
+    path=settings.cassette.path,
+    speed=settings.cassette.speed,
+)
+
+
+# Test
+if __name__ == "__main__":
+    import tempfile
+
+    tmp = Path(tempfile.mkdtemp()) / "test.jsonl.gz"
+
+    rec = Cassette(mode="record", path=str(tmp))
+    for i in range(3):
+        rec.call("demo", "square", {"x": 2}, lambda i=i: {"value": 4, "n": i})
+    rec.close()
+
+    rep = Cassette(mode="replay", path=str(tmp))
+    for _ in range(4):
+        print(rep.call("demo", "square", {"x": 2}, lambda: None))
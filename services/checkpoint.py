@@ -0,0 +1,177 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import hashlib
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Any, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+
+
+MAGIC = b"HLBOTCKP"
+VERSION = 2
+# magic, versione, timestamp di creazione, lunghezza payload, sha256 del payload
+HEADER = struct.Struct("<8sHdQ32s")
+
+
+class CheckpointManager:
+    """
+    Checkpoint su disco dello stato in memoria per i riavvii a caldo.
+
+    Ogni componente con stato (store delle candele, cache degli indicatori,
+    storico dello scanner e dei derivati, ultima decisione del bot) si
+    registra con register(name, provider): il provider espone
+    checkpoint_state() e restore_checkpoint(state). Il file è un header
+    binario (magic, versione, timestamp, sha256) seguito da pickle
+    compresso, scritto in modo atomico. Al caricamento si scartano file
+    corrotti, di un'altra versione o rete, o più vecchi di
+    CHECKPOINT_MAX_AGE_HOURS; lo stato viene restituito a ogni provider
+    nel momento in cui si registra. Le candele ripristinate sono poi
+    aggiornate dallo store con un fetch solo delle candele mancanti.
+    """
+
+    def __init__(self, path: str = None, interval_seconds: float = None, enabled: bool = None):
+        self.path = Path(path or settings.checkpoint.path)
+        self.interval = settings.checkpoint.interval_seconds if interval_seconds is None else interval_seconds
+        self.max_age = settings.checkpoint.max_age_hours * 3600
+        if enabled is None:
+            # In replay il cassette deve vedere le stesse richieste della registrazione
+            enabled = settings.checkpoint.enabled and settings.cassette.mode == "off"
+        self.enabled = enabled
+
+        self._providers: Dict[str, Any] = {}
+        self._restored: Optional[Dict[str, Any]] = None
+        self._last_save = time.time()
+        self._lock = threading.RLock()
+
+    # ---------- registrazione e ripristino ----------
+
+    def register(self, name: str, provider):
+        """Registra un provider e gli restituisce subito lo stato salvato, se c'è"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._providers[name] = provider
+            if self._restored is None:
+                self._restored = self._load()
+            state = self._restored.pop(name, None)
+
+        if state is None:
+            return
+        try:
+            provider.restore_checkpoint(state)
+            print(f"[OK] Warm restart: {name} restored from checkpoint")
+        except Exception as e:
+            print(f"[WARNING] Could not restore {name} from checkpoint: {e}")
+
+    def _load(self) -> Dict[str, Any]:
+        if not self.path.exists():
+            return {}
+        try:
+            with metrics.span("checkpoint.load"):
+                raw = self.path.read_bytes()
+                magic, version, created_at, length, digest = HEADER.unpack_from(raw)
+                payload = raw[HEADER.size:]
+                if magic != MAGIC or version != VERSION:
+                    raise ValueError(f"unsupported format (version {version})")
+                if len(payload) != length or hashlib.sha256(payload).digest() != digest:
+                    raise ValueError("checksum mismatch")
+                age = time.time() - created_at
+                if age > self.max_age:
+                    raise ValueError(f"too old ({age / 3600:.1f}h)")
+                data = pickle.loads(zlib.decompress(payload))
+                if data.get("testnet") != settings.hyperliquid.testnet:
+                    raise ValueError("saved for a different network")
+        except Exception as e:
+            print(f"[WARNING] Ignoring checkpoint {self.path.name}: {e}")
+            return {}
+
+        print(f"[OK] Checkpoint loaded ({len(raw) / 1024:.0f} KB, {age / 60:.0f} min old)")
+        return data["providers"]
+
+    # ---------- salvataggio ----------
+
+    def save(self) -> Optional[int]:
+        """Scrive il checkpoint (atomico); ritorna i byte scritti"""
+        if not self.enabled or not self._providers:
+            return None
+
+        with self._lock:
+            providers = dict(self._providers)
+
+        states = {}
+        for name, provider in providers.items():
+            try:
+                states[name] = provider.checkpoint_state()
+            except Exception as e:
+                print(f"[WARNING] Checkpoint skipped {name}: {e}")
+
+        try:
+            with metrics.span("checkpoint.save"):
+                payload = zlib.compress(
+                    pickle.dumps({"testnet": settings.hyperliquid.testnet, "providers": states}, protocol=pickle.HIGHEST_PROTOCOL),
+                    1
+                )
+                header = HEADER.pack(MAGIC, VERSION, time.time(), len(payload), hashlib.sha256(payload).digest())
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+                with open(tmp, "wb") as f:
+                    f.write(header)
+                    f.write(payload)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"[ERROR] Error writing checkpoint: {e}")
+            return None
+
+        self._last_save = time.time()
+        return HEADER.size + len(payload)
+
+    def maybe_save(self) -> Optional[int]:
+        """Salva se è passato CHECKPOINT_INTERVAL_SECONDS dall'ultimo salvataggio"""
+        if time.time() - self._last_save < self.interval:
+            return None
+        return self.save()
+
+
+# Test
+if __name__ == "__main__":
+    import tempfile
+
+    class Counter:
+        def __init__(self):
+            self.values = []
+
+        def checkpoint_state(self):
+            return {"values": list(self.values)}
+
+        def restore_checkpoint(self, state):
+            self.values = state["values"]
+
+    path = Path(tempfile.mkdtemp()) / "state.bin"
+
+    before = Counter()
+    before.values = list(range(1000))
+    writer = CheckpointManager(path=str(path), enabled=True)
+    writer.register("counter", before)
+    print(f"Saved {writer.save()} bytes")
+
+    after = Counter()
+    CheckpointManager(path=str(path), enabled=True).register("counter", after)
+    print("Restored:", after.values == before.values)
+
+    # Un byte corrotto: il checkpoint viene scartato
+    raw = bytearray(path.read_bytes())
+    raw[-1] ^= 0xFF
+    path.write_bytes(bytes(raw))
+    corrupted = Counter()
+    CheckpointManager(path=str(path), enabled=True).register("counter", corrupted)
+    print("Corrupted ignored:", corrupted.values == [])
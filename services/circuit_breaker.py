@@ -0,0 +1,197 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from typing import Dict, Any, Callable, Optional, Tuple
+
+from config.settings import settings
+from services.metrics import metrics
+
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(Exception):
+    """Chiamata rifiutata subito: l'upstream è considerato giù"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker per un upstream (CryptoPanic, alternative.me, Hyperliquid).
+
+    Dopo BREAKER_FAILURE_THRESHOLD errori consecutivi il circuito si apre:
+    le chiamate falliscono subito con CircuitOpenError (0 ms invece del
+    timeout) e un thread in background riprova l'ultima chiamata fallita
+    ogni BREAKER_RESET_SECONDS, richiudendo il circuito al primo successo.
+    L'ultimo valore buono per chiave resta disponibile con la sua età
+    (call_cached) per servire dati marcati come stale.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = None, reset_seconds: float = None):
+        self.name = name
+        self.failure_threshold = settings.breaker.failure_threshold if failure_threshold is None else failure_threshold
+        self.reset_seconds = settings.breaker.reset_seconds if reset_seconds is None else reset_seconds
+        self.enabled = settings.breaker.enabled
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._last_good: Dict[Any, Tuple[float, Any]] = {}
+        self._probe: Optional[Tuple[Callable[[], Any], Any]] = None
+        self._probe_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[[], Any], key: Any = None):
+        """Esegue fn attraverso il circuito; con key il risultato resta come ultimo valore buono"""
+        if self.enabled:
+            with self._lock:
+                if self.state != CLOSED:
+                    metrics.inc("breaker_rejected_total", upstream=self.name)
+                    raise CircuitOpenError(f"{self.name} circuit open ({self.last_error})")
+
+        try:
+            value = fn()
+        except Exception as e:
+            self._on_failure(e, fn, key)
+            raise
+
+        self._on_success(key, value)
+        return value
+
+    def call_cached(self, fn: Callable[[], Any], key: Any = None) -> Tuple[Any, Optional[float]]:
+        """
+        Come call(), ma se la chiamata fallisce (o il circuito è aperto) ritorna
+        l'ultimo valore buono per la chiave. Ritorna (valore, età in secondi
+        se stale, altrimenti None); rilancia l'errore se non c'è nulla in cache.
+        """
+        try:
+            return self.call(fn, key), None
+        except Exception:
+            cached = self.last_good(key)
+            if cached is None:
+                raise
+            metrics.inc("breaker_stale_served_total", upstream=self.name)
+            return cached["value"], cached["age_seconds"]
+
+    def last_good(self, key: Any = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._last_good.get(key)
+        if entry is None:
+            return None
+        return {"value": entry[1], "age_seconds": round(time.time() - entry[0])}
+
+    def _on_success(self, key, value):
+        with self._lock:
+            self.failures = 0
+            self.last_error = None
+            if key is not None:
+                self._last_good[key] = (time.time(), value)
+
+    def _on_failure(self, error: Exception, fn, key):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)[:200]
+            if not self.enabled or self.state != CLOSED or self.failures < self.failure_threshold:
+                return
+            self.state = OPEN
+            self.opened_at = time.time()
+            self._probe = (fn, key)
+            self._probe_thread = threading.Thread(target=self._probe_loop, name=f"breaker-{self.name}", daemon=True)
+            self._probe_thread.start()
+
+        metrics.inc("breaker_opened_total", upstream=self.name)
+        print(f"[WARNING] {self.name} circuit OPEN after {self.failures} failures: {self.last_error}")
+
+    def _probe_loop(self):
+        """Riprova in background finché l'upstream non risponde"""
+        while True:
+            time.sleep(self.reset_seconds)
+            with self._lock:
+                if self.state == CLOSED:
+                    return
+                self.state = HALF_OPEN
+                fn, key = self._probe
+
+            try:
+                value = fn()
+            except Exception as e:
+                with self._lock:
+                    self.state = OPEN
+                    self.last_error = str(e)[:200]
+                continue
+
+            with self._lock:
+                downtime = time.time() - self.opened_at
+                self.state = CLOSED
+                self.failures = 0
+                self.opened_at = None
+                self.last_error = None
+                if key is not None:
+                    self._last_good[key] = (time.time(), value)
+            print(f"[OK] {self.name} circuit CLOSED after {downtime:.0f}s")
+            return
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "open_seconds": round(time.time() - self.opened_at) if self.opened_at else 0,
+                "error": self.last_error,
+            }
+
+
+class BreakerRegistry:
+    """Un breaker per upstream, condiviso da tutto il processo"""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def degraded(self) -> Dict[str, Dict[str, Any]]:
+        """Upstream con il circuito non chiuso, per il context"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {b.name: b.status() for b in breakers if b.state != CLOSED}
+
+
+breakers = BreakerRegistry()
+
+
+# Test
+if __name__ == "__main__":
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_seconds=1)
+    healthy = {"up": True}
+
+    def fetch():
+        if not healthy["up"]:
+            time.sleep(0.2)
+            raise TimeoutError("read timed out")
+        return {"value": 42}
+
+    print("Fresh:", breaker.call_cached(fetch, "fng"))
+    healthy["up"] = False
+    for i in range(4):
+        start = time.perf_counter()
+        try:
+            value, age = breaker.call_cached(fetch, "fng")
+            outcome = f"stale {value} (age {age}s)"
+        except Exception as e:
+            outcome = f"error {e}"
+        print(f"Call {i + 1}: {breaker.state:<9} {outcome} in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    healthy["up"] = True
+    time.sleep(1.5)
+    print("After recovery:", breaker.status())
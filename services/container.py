@@ -0,0 +1,265 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+
+
+# Stesse chiavi del cassette usate da AssetMetaCache
+CASSETTE_OPS = {"meta": "meta", "spotMeta": "spot_meta"}
+
+
+class ServiceContainer:
+    """
+    Registro dei servizi condivisi del processo.
+
+    Ogni client, servizio e factory di sessioni DB viene costruito una sola
+    volta al primo uso e riusato da bot, executor, context builder e runner:
+    un solo `meta` per base URL, una sola connessione HTTP per Info, una sola
+    cache di candele e indicatori. shutdown() chiude tutto in ordine inverso.
+
+    Gli import pesanti avvengono dentro i metodi: chiedere un servizio
+    carica solo i moduli che gli servono.
+
+    La costruzione (spesso con chiamate di rete: Info, Exchange, meta) avviene
+    fuori dal lock del registro, con un lock per chiave: un upstream lento
+    blocca solo chi aspetta quel servizio, non tutti gli altri lookup.
+    """
+
+    def __init__(self):
+        self._instances: Dict[Any, Any] = {}
+        self._closers: List[Tuple[Any, Callable[[Any], None]]] = []
+        self._building: Dict[Any, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, key, factory: Callable[[], Any], close: Optional[Callable[[Any], None]] = None):
+        with self._lock:
+            if key in self._instances:
+                return self._instances[key]
+            building = self._building.setdefault(key, threading.Lock())
+
+        # Double-checked: una sola costruzione per chiave, le altre chiavi non aspettano
+        with building:
+            with self._lock:
+                if key in self._instances:
+                    return self._instances[key]
+            instance = factory()
+            with self._lock:
+                self._instances[key] = instance
+                if close is not None:
+                    self._closers.append((key, close))
+                self._building.pop(key, None)
+            return instance
+
+    # ---------- Hyperliquid ----------
+
+    def gateway(self):
+        """Gateway REST unico: singleflight, cache allMids e budget di peso condiviso"""
+        def build():
+            from services.request_gateway import RequestGateway
+            return RequestGateway()
+
+        return self._get("gateway", build)
+
+    def base_url(self, mainnet: bool = False) -> str:
+        """URL di trading (testnet da settings) o mainnet per i dati di mercato"""
+        from hyperliquid.utils import constants
+
+        if mainnet or not settings.hyperliquid.testnet:
+            return constants.MAINNET_API_URL
+        return constants.TESTNET_API_URL
+
+    def meta(self, base_url: str) -> Dict[str, Any]:
+        """`meta` dei perp, scaricato una volta per base URL"""
+        return self._get(("meta", base_url), lambda: self._post_info(base_url, "meta"))
+
+    def spot_meta(self, base_url: str) -> Dict[str, Any]:
+        return self._get(("spot_meta", base_url), lambda: self._post_info(base_url, "spotMeta"))
+
+    def _post_info(self, base_url: str, request_type: str) -> Dict[str, Any]:
+        from hyperliquid.api import API
+
+        with metrics.span(f"hyperliquid.{request_type}", upstream="hyperliquid"):
+            return cassette.call(
+                "hyperliquid", CASSETTE_OPS[request_type], None,
+                lambda: self.gateway().wrap(API(base_url=base_url)).post("/info", {"type": request_type})
+            )
+
+    def info(self, base_url: str):
+        """Info REST condiviso (costruito con meta già scaricato: nessuna richiesta in più), via gateway"""
+        def build():
+            from hyperliquid.info import Info
+            info = Info(base_url=base_url, skip_ws=True, meta=self.meta(base_url), spot_meta=self.spot_meta(base_url))
+            return self.gateway().wrap(info)
+
+        return self._get(("info", base_url), build, close=lambda info: info.session.close())
+
+    def exchange(self, wallet, base_url: str, vault_address: Optional[str] = None):
+        """Exchange per un wallet, con meta condiviso (uno per chiave/vault)"""
+        def build():
+            from hyperliquid.exchange import Exchange
+            exchange = Exchange(
+                wallet,
+                base_url=base_url,
+                meta=self.meta(base_url),
+                vault_address=vault_address,
+                spot_meta=self.spot_meta(base_url)
+            )
+            # Anche l'Info interno dell'Exchange (market_open legge allMids)
+            self.gateway().wrap(exchange.info)
+            return self.gateway().wrap(exchange)
+
+        return self._get(
+            ("exchange", base_url, wallet.address, vault_address), build,
+            close=lambda exchange: exchange.session.close()
+        )
+
+    def asset_meta(self, base_url: str):
+        """Cache dei metadati degli asset, condivisa da tutti gli executor sulla stessa rete"""
+        def build():
+            from services.asset_meta import AssetMetaCache
+            return AssetMetaCache(self.info(base_url), meta=self.meta(base_url))
+
+        return self._get(("asset_meta", base_url), build)
+
+    def hyperliquid_client(self):
+        """Client dati di mercato (sempre mainnet)"""
+        def build():
+            from services.hyperliquid_client import HyperliquidClient
+            return HyperliquidClient(use_mainnet_for_data=True, info=self.info(self.base_url(mainnet=True)))
+
+        return self._get("hyperliquid_client", build)
+
+    # ---------- servizi di mercato ----------
+
+    def market_data(self):
+        def build():
+            from services.market_data import MarketDataStore
+            store = MarketDataStore(client=self.hyperliquid_client())
+            self.checkpoint().register("market_data", store)
+            return store
+
+        return self._get("market_data", build)
+
+    def indicator_pool(self):
+        def build():
+            from services.indicator_pool import IndicatorPool
+            return IndicatorPool()
+
+        return self._get("indicator_pool", build, close=lambda pool: pool.shutdown())
+
+    def ta_service(self):
+        def build():
+            from services.technical_analysis import TechnicalAnalysisService
+            service = TechnicalAnalysisService(market_data=self.market_data(), pool=self.indicator_pool())
+            self.checkpoint().register("ta_service", service)
+            return service
+
+        return self._get("ta_service", build)
+
+    def sentiment_service(self):
+        def build():
+            from services.sentiment_service import SentimentService
+            return SentimentService()
+
+        return self._get("sentiment_service", build)
+
+    def news_service(self):
+        def build():
+            from services.news_service import NewsService
+            return NewsService()
+
+        return self._get("news_service", build)
+
+    def derivatives(self):
+        """DerivativesAnalytics condiviso, o None se DERIVATIVES_ENABLED=false"""
+        def build():
+            if not settings.derivatives.enabled:
+                return None
+            from services.derivatives_analytics import DerivativesAnalytics
+            analytics = DerivativesAnalytics(market_data=self.market_data())
+            self.checkpoint().register("derivatives", analytics)
+            return analytics
+
+        return self._get("derivatives", build)
+
+    def universe_scanner(self):
+        def build():
+            from services.universe_scanner import UniverseScanner
+            scanner = UniverseScanner(market_data=self.market_data())
+            self.checkpoint().register("universe_scanner", scanner)
+            return scanner
+
+        return self._get("universe_scanner", build)
+
+    def anthropic(self):
+        def build():
+            from anthropic import Anthropic
+            return Anthropic(api_key=settings.llm.anthropic_api_key)
+
+        return self._get("anthropic", build, close=lambda client: client.close())
+
+    # ---------- stato ----------
+
+    def checkpoint(self):
+        """Checkpoint per il riavvio a caldo; l'ultimo salvataggio avviene in shutdown()"""
+        def build():
+            from services.checkpoint import CheckpointManager
+            return CheckpointManager()
+
+        return self._get("checkpoint", build, close=lambda checkpoint: checkpoint.save())
+
+    # ---------- database ----------
+
+    def session_factory(self):
+        """sessionmaker condiviso (engine e pool di connessioni unici)"""
+        def build():
+            from database.connection import SessionLocal, ensure_schema
+            ensure_schema()
+            return SessionLocal
+
+        return self._get("session_factory", build, close=lambda factory: factory.kw["bind"].dispose())
+
+    # ---------- ciclo di vita ----------
+
+    def shutdown(self):
+        """Chiude i servizi costruiti, dal più recente al più vecchio"""
+        with self._lock:
+            closers, self._closers = self._closers, []
+            instances, self._instances = self._instances, {}
+
+        for key, close in reversed(closers):
+            instance = instances.get(key)
+            if instance is None:
+                continue
+            try:
+                close(instance)
+            except Exception as e:
+                print(f"[ERROR] Error closing {key}: {e}")
+
+
+container = ServiceContainer()
+
+
+# Test
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    ta_service = container.ta_service()
+    news_service = container.news_service()
+    base_url = container.base_url()
+    asset_meta = container.asset_meta(base_url)
+    elapsed = time.perf_counter() - start
+
+    print(f"Services built in {elapsed * 1000:.0f} ms")
+    print("Shared client:", ta_service.client is container.market_data().client)
+    print("Shared Info:", asset_meta.info is container.info(base_url))
+    print("BTC szDecimals:", asset_meta.sz_decimals("BTC"))
+
+    container.shutdown()
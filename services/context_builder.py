@@ -9,15 +9,35 @@ import json
 from services.technical_analysis import TechnicalAnalysisService
 from services.sentiment_service import SentimentService
 from services.news_service import NewsService
+from services.derivatives_analytics import DerivativesAnalytics
 from config.settings import settings
+from services.metrics import metrics
+from services.container import container
+from services.circuit_breaker import breakers
 
 
 class ContextBuilder:
-    def __init__(self):
-        self.ta_service = TechnicalAnalysisService()
-        self.sentiment_service = SentimentService()
-        self.news_service = NewsService()
+    def __init__(
+        self,
+        account_state=None,
+        ta_service: TechnicalAnalysisService = None,
+        sentiment_service: SentimentService = None,
+        news_service: NewsService = None,
+        risk_params: Dict[str, Any] = None,
+        derivatives: DerivativesAnalytics = None
+    ):
+        # Servizi di mercato condivisi nel processo (container), salvo override
+        self.ta_service = ta_service or container.ta_service()
+        self.sentiment_service = sentiment_service or container.sentiment_service()
+        self.news_service = news_service or container.news_service()
+        # Funding / OI dai contesti degli asset già nello store delle candele
+        self.derivatives = derivatives or container.derivatives()
+        # AccountStateProvider condiviso con l'executor (None = nessun account)
+        self.account_state = account_state
+        # Limiti di rischio della strategia (default: settings.trading)
+        self.risk_params = risk_params
     
+    @metrics.timed("context.build")
     def build_context(self, coins: List[str] = None) -> Dict[str, Any]:
         """Costruisce il context completo per l'LLM"""
         if coins is None:
@@ -33,7 +53,7 @@ class ContextBuilder:
             "market": {},
             "sentiment": sentiment,
             "news": news,
-            "risk_params": {
+            "risk_params": self.risk_params or {
                 "max_position_size_pct": settings.trading.max_position_size_pct,
                 "max_total_exposure_pct": settings.trading.max_total_exposure_pct,
                 "max_daily_loss_pct": settings.trading.max_daily_loss_pct,
@@ -41,55 +61,127 @@ class ContextBuilder:
             }
         }
         
-        for coin in coins:
-            ta_data = self.ta_service.get_indicators(coin, "1h", 100)
-            
+        # Un solo passaggio per tutte le coin: il calcolo può andare sul pool di processi
+        with metrics.span("context.indicators", coins=len(coins)):
+            indicators = self.ta_service.get_market_indicators(coins, "1h", 100)
+        
+        derivatives = {}
+        if self.derivatives:
+            with metrics.span("context.derivatives"):
+                self.derivatives.ingest()
+                derivatives = self.derivatives.get_features_many(coins)
+        
+        for coin, ta_data in indicators.items():
             if "error" not in ta_data:
                 context["market"][coin] = {
                     "price": ta_data["price"],
                     "trend": ta_data["trend"],
                     "indicators": ta_data["indicators"]
                 }
+                if "timeframes" in ta_data:
+                    context["market"][coin]["timeframes"] = ta_data["timeframes"]
+                if "error" not in derivatives.get(coin, {"error": None}):
+                    context["market"][coin]["derivatives"] = derivatives[coin]
+        
+        # Upstream con il circuito aperto: i dati relativi sono cache o mancanti
+        degraded = breakers.degraded()
+        if degraded:
+            context["degraded"] = degraded
         
         return context
     
     def _get_portfolio(self) -> Dict[str, Any]:
-        """Portfolio attuale"""
+        """Portfolio attuale dallo snapshot dell'account già in cache per il ciclo"""
+        state = self.account_state.get() if self.account_state else {"error": "No account configured"}
+        
+        if "error" in state:
+            return {
+                "balance_usd": 0,
+                "available_usd": 0,
+                "positions": [],
+                "unrealized_pnl_usd": 0,
+                "margin_used_usd": 0,
+                "total_exposure_pct": 0,
+                "error": state["error"]
+            }
+        
         return {
-            "balance_usd": 10000,
-            "available_usd": 10000,
-            "positions": [],
-            "total_exposure_pct": 0
+            "balance_usd": state["balance"],
+            "available_usd": state["available"],
+            "positions": [
+                {
+                    "coin": p["coin"],
+                    "side": p["side"],
+                    "size": p["size"],
+                    "entry_price": p["entry_price"],
+                    "unrealized_pnl": p["unrealized_pnl"],
+                    "leverage": p["leverage"],
+                    "liquidation_price": p["liquidation_price"]
+                }
+                for p in state["positions"]
+            ],
+            "unrealized_pnl_usd": state["unrealized_pnl"],
+            "margin_used_usd": state["margin_used"],
+            "total_exposure_pct": state["exposure_pct"]
         }
     
-    def build_prompt_context(self, coins: List[str] = None) -> str:
-        """Converte il context in formato leggibile per l'LLM"""
-        context = self.build_context(coins)
+    def build_prompt_context(self, coins: List[str] = None, context: Dict[str, Any] = None) -> str:
+        """Converte il context in formato leggibile per l'LLM (riusa context se già costruito)"""
+        if context is None:
+            context = self.build_context(coins)
         sentiment = context['sentiment']
         news = context['news']
         
         prompt = f"""
 === MARKET CONTEXT ===
 Timestamp: {context['timestamp']}
-
+"""
+        if context.get('degraded'):
+            upstreams = ", ".join(
+                f"{name} ({status['state']} for {status['open_seconds']}s)"
+                for name, status in context['degraded'].items()
+            )
+            prompt += f"WARNING - degraded data sources, related data may be stale or missing: {upstreams}\n"
+        
+        prompt += f"""
 === PORTFOLIO ===
 Balance: ${context['portfolio']['balance_usd']:,.2f}
 Available: ${context['portfolio']['available_usd']:,.2f}
 Open Positions: {len(context['portfolio']['positions'])}
+Unrealized PnL: ${context['portfolio']['unrealized_pnl_usd']:,.2f}
+Margin Used: ${context['portfolio']['margin_used_usd']:,.2f}
 Total Exposure: {context['portfolio']['total_exposure_pct']}%
-
+"""
+        for pos in context['portfolio']['positions']:
+            prompt += f"- {pos['coin']} {pos['side']} {abs(pos['size'])} @ ${pos['entry_price']:,.2f} ({pos['leverage']:.0f}x) | PnL: ${pos['unrealized_pnl']:,.2f}\n"
+        
+        prompt += f"""
 === SENTIMENT ===
 Fear & Greed Index: {sentiment['fear_greed']['value']} ({sentiment['fear_greed']['classification']})
 Signal: {sentiment['overall_signal']}
 Bias: {sentiment['overall_bias']}
 Score: {sentiment['sentiment_score']}
-
+"""
+        if sentiment['fear_greed'].get('stale'):
+            prompt += f"(stale: Fear & Greed value is {sentiment['fear_greed']['stale_seconds'] / 3600:.1f}h old)\n"
+        
+        prompt += f"""
 === NEWS ===
 News Sentiment: {news.get('sentiment_summary', 'N/A')} (Bullish: {news.get('bullish_count', 0)}, Bearish: {news.get('bearish_count', 0)})
 Recent Headlines:
 """
         for headline in news.get('headlines', [])[:5]:
             prompt += f"- {headline}\n"
+        if news.get('stale'):
+            age = f"{news['stale_seconds'] / 3600:.1f}h old" if news.get('stale_seconds') is not None else "age unknown"
+            prompt += f"(stale: news feed unavailable, headlines {age})\n"
+        if news.get('by_coin'):
+            by_coin = ", ".join(
+                f"{coin} {counts['score']:+.2f} (+{counts['bullish']}/-{counts['bearish']} of {counts['total']})"
+                for coin, counts in news['by_coin'].items() if counts['total']
+            )
+            if by_coin:
+                prompt += f"News Score by Coin ({settings.news.window_hours:.0f}h): {by_coin}\n"
         
         prompt += """
 === MARKET DATA ===
@@ -110,6 +202,15 @@ Indicators:
 """
             if 'pivots' in data['indicators']:
                 prompt += f"- Pivot Position: {data['indicators']['pivots']['position']} (P: {data['indicators']['pivots']['pivot']:,.0f}, R1: {data['indicators']['pivots']['r1']:,.0f}, S1: {data['indicators']['pivots']['s1']:,.0f})\n"
+            if 'timeframes' in data:
+                tf = data['timeframes']
+                trends = " | ".join(f"{interval} {trend} (RSI {tf['rsi'][interval]})" for interval, trend in tf['trends'].items())
+                prompt += f"- Timeframes: {trends} -> {tf['alignment']}\n"
+            if 'derivatives' in data:
+                d = data['derivatives']
+                prompt += f"- Funding: {d['funding'] * 100:.4f}%/h (APR {d['funding_apr_pct']}%, z {d['funding_z']}, {d['funding_trend']})\n"
+                prompt += f"- Open Interest: ${d['open_interest_usd']:,.0f} (z {d['open_interest_z']}, {d['open_interest_change_pct']}% over {d['samples']} samples, {d['open_interest_trend']})\n"
+                prompt += f"- Premium: {d['premium'] * 100:.4f}% (z {d['premium_z']})\n"
         
         prompt += f"""
 === RISK PARAMETERS ===
@@ -0,0 +1,291 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
+
+from config.settings import settings
+from services.market_data import MarketDataStore
+from services.metrics import metrics
+from services.container import container
+
+
+# Funding Hyperliquid: tasso orario
+FUNDING_PERIODS_PER_YEAR = 24 * 365
+
+
+class RollingStat:
+    """Media e deviazione standard su finestra mobile, aggiornate in O(1)"""
+
+    def __init__(self, window: int):
+        self.values = deque(maxlen=window)
+        self.sum = 0.0
+        self.sumsq = 0.0
+
+    def push(self, value: float):
+        if len(self.values) == self.values.maxlen:
+            old = self.values[0]
+            self.sum -= old
+            self.sumsq -= old * old
+        self.values.append(value)
+        self.sum += value
+        self.sumsq += value * value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / len(self.values) if self.values else 0.0
+
+    @property
+    def std(self) -> float:
+        n = len(self.values)
+        if n < 2:
+            return 0.0
+        return math.sqrt(max(self.sumsq / n - self.mean ** 2, 0.0))
+
+    def zscore(self, value: float) -> Optional[float]:
+        std = self.std
+        return round((value - self.mean) / std, 2) if std > 0 else None
+
+    def change_pct(self, lookback: int = None) -> Optional[float]:
+        """Variazione % dell'ultimo valore rispetto a `lookback` campioni fa (default: inizio finestra)"""
+        if len(self.values) < 2:
+            return None
+        past = self.values[-min(lookback or len(self.values), len(self.values))]
+        return round((self.values[-1] - past) / abs(past) * 100, 2) if past else None
+
+    def trend(self, lookback: int = 4) -> str:
+        """RISING / FALLING / FLAT sugli ultimi campioni, in unità di deviazione standard"""
+        if len(self.values) < 2:
+            return "FLAT"
+        delta = self.values[-1] - self.values[-min(lookback, len(self.values))]
+        threshold = self.std * 0.25
+        if delta > threshold:
+            return "RISING"
+        if delta < -threshold:
+            return "FALLING"
+        return "FLAT"
+
+
+class DerivativesAnalytics:
+    """
+    Funding, open interest e premium di tutti i perp con storico mobile.
+
+    Ingest una volta per ciclo dai contesti già presenti nello store
+    (nessuna richiesta per coin), statistiche mobili aggiornate in modo
+    incrementale e campioni salvati nella tabella derivatives_snapshots,
+    da cui lo storico viene ricaricato al riavvio.
+    """
+
+    def __init__(self, market_data: MarketDataStore = None, window: int = None, persist: bool = None):
+        self.market_data = market_data or container.market_data()
+        self.window = settings.derivatives.window if window is None else window
+        self.persist = settings.derivatives.persist if persist is None else persist
+        self.sample_seconds = settings.derivatives.sample_seconds
+
+        # coin -> {"funding", "open_interest_usd", "premium"} -> RollingStat
+        self._stats: Dict[str, Dict[str, RollingStat]] = {}
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._last_sample = 0.0
+        self._warmed = False
+        # _lock protegge solo lo stato in memoria: rete e DB restano fuori
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+
+    def _stats_for(self, coin: str) -> Dict[str, RollingStat]:
+        stats = self._stats.get(coin)
+        if stats is None:
+            stats = self._stats[coin] = {
+                "funding": RollingStat(self.window),
+                "open_interest_usd": RollingStat(self.window),
+                "premium": RollingStat(self.window),
+            }
+        return stats
+
+    def _push(self, coin: str, funding: float, open_interest_usd: float, premium: float):
+        stats = self._stats_for(coin)
+        stats["funding"].push(funding)
+        stats["open_interest_usd"].push(open_interest_usd)
+        stats["premium"].push(premium)
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "stats": {
+                    coin: {name: list(stat.values) for name, stat in stats.items()}
+                    for coin, stats in self._stats.items()
+                },
+                "last_sample": self._last_sample,
+            }
+
+    def restore_checkpoint(self, state: Dict[str, Any]):
+        """Storico dal checkpoint: più recente del DB, il warm start non serve"""
+        with self._lock:
+            for coin, series in state["stats"].items():
+                stats = self._stats_for(coin)
+                for name, values in series.items():
+                    for value in values[-self.window:]:
+                        stats[name].push(value)
+            self._last_sample = state["last_sample"]
+            self._warmed = True
+
+    def warm_start(self):
+        """Ricarica dal DB lo storico recente (una query, una volta sola)"""
+        with self._warm_lock:
+            if self._warmed:
+                return
+            rows = self._load_history() if self.persist else []
+
+            with self._lock:
+                # Un checkpoint ripristinato nel frattempo è più recente del DB
+                if self._warmed:
+                    return
+                for coin, funding, oi_usd, premium, _ in rows:
+                    self._push(coin, funding, oi_usd, premium)
+                if rows:
+                    self._last_sample = (rows[-1][4] - datetime(1970, 1, 1)).total_seconds()
+                self._warmed = True
+
+    def _load_history(self) -> List[tuple]:
+        """Ultimi `window` campioni per coin nelle warm_start_hours, solo le colonne usate"""
+        from sqlalchemy import func, select
+        from database.connection import SessionLocal
+        from database.models import DerivativesSnapshot
+
+        snap = DerivativesSnapshot.__table__.c
+        since = datetime.utcnow() - timedelta(hours=settings.derivatives.warm_start_hours)
+        recent = (
+            select(
+                snap.coin, snap.funding, snap.open_interest, snap.mark_price, snap.premium, snap.timestamp,
+                func.row_number().over(partition_by=snap.coin, order_by=snap.timestamp.desc()).label("rn"),
+            )
+            .where(snap.timestamp >= since)
+            .subquery()
+        )
+        query = (
+            select(recent.c.coin, recent.c.funding, recent.c.open_interest, recent.c.mark_price,
+                   recent.c.premium, recent.c.timestamp)
+            .where(recent.c.rn <= self.window)
+            .order_by(recent.c.timestamp)
+        )
+
+        db = SessionLocal()
+        try:
+            return [
+                (coin, funding, open_interest * mark_price, premium or 0.0, timestamp)
+                for coin, funding, open_interest, mark_price, premium, timestamp in db.execute(query)
+            ]
+        except Exception as e:
+            print(f"[ERROR] Error loading derivatives history: {e}")
+            return []
+        finally:
+            db.close()
+
+    @metrics.timed("derivatives.ingest")
+    def ingest(self) -> int:
+        """
+        Aggiorna lo storico con lo snapshot corrente dello store.
+        Un nuovo campione al massimo ogni DERIVATIVES_SAMPLE_SECONDS:
+        cicli ravvicinati non sbilanciano le statistiche.
+        Ritorna il numero di coin campionate.
+        """
+        if not self._warmed:
+            self.warm_start()
+
+        # Richiesta di rete fuori dal lock: get_features non resta bloccato
+        assets = self.market_data.get_asset_contexts()
+        if not assets:
+            return 0
+
+        with self._lock:
+            now = time.time()
+            for asset in assets:
+                self._latest[asset["coin"]] = asset
+
+            if now - self._last_sample < self.sample_seconds:
+                return 0
+            self._last_sample = now
+
+            live = [a for a in assets if not a["delisted"] and a["mark_price"] > 0]
+            for asset in live:
+                self._push(
+                    asset["coin"],
+                    asset["funding"],
+                    asset["open_interest"] * asset["mark_price"],
+                    asset["premium"],
+                )
+
+        if self.persist:
+            self._save(live, datetime.utcfromtimestamp(now))
+        return len(live)
+
+    def _save(self, assets: List[Dict[str, Any]], timestamp: datetime):
+        from database.connection import SessionLocal
+        from database.models import DerivativesSnapshot
+
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(DerivativesSnapshot, [
+                {
+                    "timestamp": timestamp,
+                    "coin": a["coin"],
+                    "funding": a["funding"],
+                    "open_interest": a["open_interest"],
+                    "premium": a["premium"],
+                    "mark_price": a["mark_price"],
+                    "oracle_price": a["oracle_price"],
+                    "day_volume_usd": a["day_volume_usd"],
+                }
+                for a in assets
+            ])
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            print(f"[ERROR] Error saving derivatives snapshot: {e}")
+        finally:
+            db.close()
+
+    def get_features(self, coin: str) -> Dict[str, Any]:
+        """Feature per il context di una coin (nessuna chiamata di rete)"""
+        with self._lock:
+            asset = self._latest.get(coin)
+            if asset is None:
+                return {"error": f"No asset context for {coin}"}
+
+            stats = self._stats_for(coin)
+            funding = asset["funding"]
+            oi_usd = asset["open_interest"] * asset["mark_price"]
+
+            return {
+                "funding": funding,
+                "funding_apr_pct": round(funding * FUNDING_PERIODS_PER_YEAR * 100, 2),
+                "funding_z": stats["funding"].zscore(funding),
+                "funding_trend": stats["funding"].trend(),
+                "open_interest_usd": round(oi_usd, 0),
+                "open_interest_z": stats["open_interest_usd"].zscore(oi_usd),
+                "open_interest_change_pct": stats["open_interest_usd"].change_pct(),
+                "open_interest_trend": stats["open_interest_usd"].trend(),
+                "premium": asset["premium"],
+                "premium_z": stats["premium"].zscore(asset["premium"]),
+                "samples": len(stats["funding"].values),
+            }
+
+    def get_features_many(self, coins: List[str]) -> Dict[str, Dict[str, Any]]:
+        return {coin: self.get_features(coin) for coin in coins}
+
+
+# Test
+if __name__ == "__main__":
+    analytics = DerivativesAnalytics(persist=False)
+
+    sampled = analytics.ingest()
+    print(f"=== Derivatives Analytics: {sampled} perps sampled ===\n")
+
+    for coin, features in analytics.get_features_many(["BTC", "ETH", "SOL"]).items():
+        print(f"--- {coin} ---")
+        for key, value in features.items():
+            print(f"  {key}: {value}")
@@ -5,26 +5,48 @@ sys.path.append(str(Path(__file__).parent.parent))
 from hyperliquid.info import Info
 from hyperliquid.utils import constants 
 from config.settings import settings 
+from services.metrics import metrics
+from services.cassette import cassette
+from services.circuit_breaker import breakers
 import time
 
 
+INTERVAL_MS = {
+    "1m": 60 * 1000,
+    "3m": 3 * 60 * 1000,
+    "5m": 5 * 60 * 1000,
+    "15m": 15 * 60 * 1000,
+    "30m": 30 * 60 * 1000,
+    "1h": 60 * 60 * 1000,
+    "2h": 2 * 60 * 60 * 1000,
+    "4h": 4 * 60 * 60 * 1000,
+    "8h": 8 * 60 * 60 * 1000,
+    "12h": 12 * 60 * 60 * 1000,
+    "1d": 24 * 60 * 60 * 1000,
+}
+
+
 class HyperliquidClient:
-    def __init__(self, use_mainnet_for_data: bool = True):
+    def __init__(self, use_mainnet_for_data: bool = True, info: Info = None):
         if use_mainnet_for_data:
             base_url = constants.MAINNET_API_URL
         else:
             base_url = constants.TESTNET_API_URL if settings.hyperliquid.testnet else constants.MAINNET_API_URL
         
-        self.info = Info(base_url=base_url, skip_ws=True)
+        # Info condiviso dal container, se passato
+        self.info = info or Info(base_url=base_url, skip_ws=True)
         
     def get_price(self, coin: str) -> float: 
         """Prezzo corrente di una coin"""
-        all_mids = self.info.all_mids()
+        with metrics.span("hyperliquid.all_mids", upstream="hyperliquid"):
+            all_mids = cassette.call("hyperliquid", "all_mids", None, self.info.all_mids)
         return float(all_mids.get(coin, 0)) 
     
     def get_all_prices(self) -> dict:
         """Tutti i prezzi"""
-        return {k: float(v) for k, v in self.info.all_mids().items()}  
+        with metrics.span("hyperliquid.all_mids", upstream="hyperliquid"):
+            all_mids = cassette.call("hyperliquid", "all_mids", None, self.info.all_mids)
+        return {k: float(v) for k, v in all_mids.items()}  
     
     def get_candles(self, coin: str, interval: str = "1h", limit: int = 100) -> list:
         """
@@ -32,40 +54,81 @@ class HyperliquidClient:
         interval: 1m, 5m, 15m, 1h, 4h, 1d
         """
         try:
-            interval_ms = {
-                "1m": 60 * 1000,
-                "5m": 5 * 60 * 1000,
-                "15m": 15 * 60 * 1000,
-                "1h": 60 * 60 * 1000,
-                "4h": 4 * 60 * 60 * 1000,
-                "1d": 24 * 60 * 60 * 1000,
-            }
-            
             now = int(time.time() * 1000)
-            start_time = now - (limit * interval_ms.get(interval, 60 * 60 * 1000))
+            start_time = now - (limit * INTERVAL_MS.get(interval, 60 * 60 * 1000))
             
             # Parametro corretto: name invece di coin
-            candles = self.info.candles_snapshot(
-                name=coin, 
-                interval=interval, 
-                startTime=start_time, 
-                endTime=now
-            )
+            # Con il circuito aperto fallisce subito: lo store serve le ultime candele buone
+            with metrics.span("hyperliquid.candles_snapshot", upstream="hyperliquid"):
+                candles = breakers.get("hyperliquid").call(
+                    lambda: cassette.call(
+                        "hyperliquid", "candles_snapshot", [coin, interval, limit],
+                        lambda: self.info.candles_snapshot(
+                            name=coin, 
+                            interval=interval, 
+                            startTime=start_time, 
+                            endTime=now
+                        )
+                    )
+                )
             return candles
         except Exception as e:
             print(f"Error getting candles: {e}")
             return []
     
+    def get_candles_range(self, coin: str, interval: str, start_ms: int, end_ms: int) -> list:
+        """
+        Candele OHLCV tra start_ms e end_ms (al massimo 5000 per richiesta), per il backfill.
+        Gli errori vengono rilanciati: chi fa backfill deve sapere cosa manca.
+        Circuito separato: gli errori di un backfill lungo non devono aprire
+        quello del trading live (e servirgli candele stale).
+        """
+        with metrics.span("hyperliquid.candles_snapshot", upstream="hyperliquid"):
+            return breakers.get("hyperliquid_backfill").call(
+                lambda: cassette.call(
+                    "hyperliquid", "candles_snapshot", [coin, interval, start_ms, end_ms],
+                    lambda: self.info.candles_snapshot(name=coin, interval=interval, startTime=start_ms, endTime=end_ms)
+                )
+            )
+    
     def get_orderbook(self, coin: str) -> dict:
         """Order book L2"""
-        return self.info.l2_snapshot(coin=coin)
+        with metrics.span("hyperliquid.l2_snapshot", upstream="hyperliquid"):
+            return cassette.call("hyperliquid", "l2_snapshot", coin, lambda: self.info.l2_snapshot(coin=coin))
+    
+    def get_asset_contexts(self) -> list:
+        """
+        Contesti di tutti i perp in una richiesta: funding, open interest,
+        volume 24h, mark/oracle/mid, premium e prezzo del giorno prima.
+        """
+        with metrics.span("hyperliquid.meta_and_asset_ctxs", upstream="hyperliquid"):
+            meta, ctxs = cassette.call("hyperliquid", "meta_and_asset_ctxs", None, self.info.meta_and_asset_ctxs)
+        
+        # I contesti sono allineati per indice con meta["universe"]
+        assets = []
+        for asset, ctx in zip(meta.get("universe", []), ctxs):
+            assets.append({
+                "coin": asset.get("name"),
+                "sz_decimals": asset.get("szDecimals", 0),
+                "max_leverage": asset.get("maxLeverage", 1),
+                "delisted": asset.get("isDelisted", False),
+                "funding": float(ctx.get("funding") or 0),
+                "open_interest": float(ctx.get("openInterest") or 0),
+                "day_volume_usd": float(ctx.get("dayNtlVlm") or 0),
+                "mark_price": float(ctx.get("markPx") or 0),
+                "oracle_price": float(ctx.get("oraclePx") or 0),
+                "mid_price": float(ctx.get("midPx") or 0),
+                "prev_day_price": float(ctx.get("prevDayPx") or 0),
+                "premium": float(ctx.get("premium") or 0),
+                "impact_prices": [float(px) for px in (ctx.get("impactPxs") or [])],
+            })
+        return assets
     
     def get_funding_rate(self, coin: str) -> float:
         """Funding rate corrente"""
-        meta = self.info.meta_and_asset_ctxs()
-        for asset in meta[1]:
-            if asset.get('name') == coin:
-                return float(asset.get('funding', 0))
+        for asset in self.get_asset_contexts():
+            if asset["coin"] == coin:
+                return asset["funding"]
         return 0.0
     
     
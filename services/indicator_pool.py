@@ -0,0 +1,171 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import atexit
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+from typing import Dict, Any, Callable, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from services.metrics import metrics
+
+
+def _run_shared(fn: Callable, shm_name: str, shape: Tuple[int, int], start: int, end: int,
+                coin: str, interval: str, extra: Any) -> Dict[str, Any]:
+    """
+    Eseguito nel worker: legge le colonne [start, end) del blocco condiviso
+    (niente DataFrame serializzati) e chiama fn(coin, interval, ohlcv, extra).
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+        # Copia locale: il blocco può essere rilasciato appena finito il batch
+        ohlcv = block[:, start:end].copy()
+        del block
+    finally:
+        shm.close()
+    return fn(coin, interval, ohlcv, extra)
+
+
+class IndicatorPool:
+    """
+    Pool di processi per il calcolo degli indicatori, una coin per task.
+
+    pandas/ta tengono il GIL: con molte coin (o più timeframe) il calcolo
+    su thread resta seriale. Qui le candele di tutte le coin vanno in un
+    solo blocco di shared memory e ogni worker legge solo le sue colonne.
+    I risultati si raccolgono con un timeout per batch: una coin lenta
+    diventa {"error": "timeout"} invece di bloccare il ciclo.
+
+    workers=0: calcolo nel processo corrente (default).
+    """
+
+    def __init__(self, workers: int = None, timeout_seconds: float = None):
+        workers = settings.trading.indicator_workers if workers is None else workers
+        # -1 = tutti i core
+        self.workers = (os.cpu_count() or 1) if workers < 0 else workers
+        self.timeout = settings.trading.indicator_timeout_seconds if timeout_seconds is None else timeout_seconds
+        self._executor = None
+        self._lock = threading.Lock()
+        atexit.register(self.shutdown)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def map(self, fn: Callable, jobs: Dict[str, Tuple[np.ndarray, Any]], interval: str) -> Dict[str, Dict[str, Any]]:
+        """
+        jobs: coin -> (ohlcv (5, n) float64, extra).
+        Ritorna coin -> fn(coin, interval, ohlcv, extra), o {"error": ...}.
+        """
+        if not jobs:
+            return {}
+
+        # Una sola coin non vale il costo di shared memory e IPC
+        if self.workers <= 0 or len(jobs) == 1:
+            return {coin: self._run_inline(fn, coin, interval, ohlcv, extra)
+                    for coin, (ohlcv, extra) in jobs.items()}
+
+        with metrics.span("indicators.pool", coins=len(jobs), interval=interval):
+            return self._map_shared(fn, jobs, interval)
+
+    def _run_inline(self, fn, coin, interval, ohlcv, extra) -> Dict[str, Any]:
+        try:
+            return fn(coin, interval, ohlcv, extra)
+        except Exception as e:
+            return {"error": f"Indicator computation failed: {e}"}
+
+    def _map_shared(self, fn, jobs, interval) -> Dict[str, Dict[str, Any]]:
+        total = sum(ohlcv.shape[1] for ohlcv, _ in jobs.values())
+        shape = (5, total)
+        shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 8, 1))
+        results = {}
+
+        try:
+            block = np.ndarray(shape, dtype=np.float64, buffer=shm.buf)
+            offsets = {}
+            start = 0
+            for coin, (ohlcv, _) in jobs.items():
+                end = start + ohlcv.shape[1]
+                block[:, start:end] = ohlcv
+                offsets[coin] = (start, end)
+                start = end
+            del block
+
+            executor = self._get_executor()
+            futures = {
+                executor.submit(_run_shared, fn, shm.name, shape, *offsets[coin], coin, interval, extra): coin
+                for coin, (_, extra) in jobs.items()
+            }
+            done, not_done = wait(futures, timeout=self.timeout)
+
+            broken = False
+            for future in done:
+                coin = futures[future]
+                try:
+                    results[coin] = future.result()
+                except BrokenProcessPool as e:
+                    broken = True
+                    results[coin] = {"error": f"Indicator worker died: {e}"}
+                except Exception as e:
+                    results[coin] = {"error": f"Indicator computation failed: {e}"}
+
+            for future in not_done:
+                coin = futures[future]
+                future.cancel()
+                metrics.inc("indicator_timeouts_total", coin=coin)
+                results[coin] = {"error": f"Indicator computation timed out after {self.timeout}s"}
+
+            if not_done or broken:
+                # Un worker bloccato (o morto) renderebbe inutilizzabile il pool nei cicli successivi
+                self._recycle()
+        finally:
+            shm.close()
+            shm.unlink()
+
+        return results
+
+    def _recycle(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is None:
+            return
+        # ProcessPoolExecutor non sa interrompere un task: termina i worker
+        for process in list((getattr(executor, "_processes", None) or {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Test
+if __name__ == "__main__":
+    import time
+    from services.technical_analysis import compute_indicators
+
+    rng = np.random.default_rng(0)
+    jobs = {}
+    for i in range(120):
+        close = 100 + np.cumsum(rng.normal(0, 1, 500))
+        jobs[f"COIN{i}"] = (np.vstack([close, close + 1, close - 1, close, rng.uniform(1, 10, 500)]), None)
+
+    for workers in (0, -1):
+        pool = IndicatorPool(workers=workers, timeout_seconds=30)
+        start = time.perf_counter()
+        results = pool.map(compute_indicators, jobs, "1h")
+        elapsed = time.perf_counter() - start
+        errors = sum(1 for r in results.values() if "error" in r)
+        print(f"workers={pool.workers}: {len(results)} coins in {elapsed:.2f}s ({errors} errors)")
+        pool.shutdown()
@@ -0,0 +1,169 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from config.settings import settings
+from services.candle_buffer import CandleBuffer
+from services.hyperliquid_client import HyperliquidClient, INTERVAL_MS
+from services.container import container
+from services.cassette import cassette
+
+
+class MarketDataStore:
+    """
+    Cache condivisa delle candele per (coin, interval) e dei contesti
+    di tutti gli asset (meta_and_asset_ctxs).
+
+    Più strategie (o più servizi) che chiedono le stesse candele nello
+    stesso ciclo fanno una sola richiesta: le altre leggono dalla cache.
+    Le candele stanno in un CandleBuffer per chiave, letto dagli indicatori
+    come viste NumPy (get_arrays) senza ricostruire liste di dict.
+    """
+
+    def __init__(self, client: HyperliquidClient = None, ttl_seconds: float = None):
+        self.client = client or container.hyperliquid_client()
+        self.ttl = settings.trading.candle_cache_ttl_seconds if ttl_seconds is None else ttl_seconds
+        # (coin, interval) -> {"buffer", "limit", "fetched_at"}; asset_ctxs -> {"data", ...}
+        self._data: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = defaultdict(threading.Lock)
+        self._locks_guard = threading.Lock()
+
+    def _lock_for(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks[key]
+
+    def get_candles(self, coin: str, interval: str = "1h", limit: int = 100) -> List[Dict[str, Any]]:
+        """Ultime `limit` candele come dict (t int, o/h/l/c/v float)"""
+        buffer = self._buffer(coin, interval, limit)
+        return buffer.to_candles(limit) if buffer is not None else []
+
+    def get_arrays(self, coin: str, interval: str = "1h", limit: int = 100) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ultime `limit` candele come viste sul buffer: t int64 (n,) e
+        ohlcv float64 (5, n). Il buffer non cambia più dopo la pubblicazione
+        (un refresh ne crea uno nuovo), quindi le viste sono stabili anche tra thread.
+        """
+        buffer = self._buffer(coin, interval, limit)
+        if buffer is None:
+            return np.empty(0, dtype=np.int64), np.empty((5, 0), dtype=np.float64)
+        return buffer.arrays(limit)
+
+    def _buffer(self, coin: str, interval: str, limit: int):
+        """Buffer della chiave, aggiornato se non abbastanza recente o profondo"""
+        key = (coin, interval)
+
+        entry = self._data.get(key)
+        if self._fresh(entry, limit):
+            return entry["buffer"]
+
+        # Un solo fetch per chiave anche con richieste concorrenti
+        with self._lock_for(key):
+            entry = self._data.get(key)
+            if self._fresh(entry, limit):
+                return entry["buffer"]
+
+            # Non si riduce mai la profondità già in cache
+            depth = max(limit, entry["limit"]) if entry else limit
+            current = entry["buffer"] if entry else None
+
+            # Copy-on-write: un buffer pubblicato non viene più modificato, il refresh
+            # ne crea uno nuovo e sostituisce il riferimento. Le viste già consegnate
+            # ad altri thread (approvazioni, algo, strategie) restano coerenti.
+            buffer = self._fetch(current, coin, interval, depth)
+            if buffer is not None:
+                self._data[key] = {"buffer": buffer, "limit": depth, "fetched_at": time.time()}
+                return buffer
+            # Upstream giù: ultime candele buone (il context segnala il degrado)
+            return current
+
+    def _fetch(self, current: Optional[CandleBuffer], coin: str, interval: str, limit: int) -> Optional[CandleBuffer]:
+        """
+        Nuovo buffer con le candele aggiornate. Con candele già in cache (anche
+        da checkpoint) scarica solo quelle mancanti più l'ultima, ancora aperta,
+        e le accoda a una copia; altrimenti tutto. None se l'upstream non risponde.
+        """
+        step = INTERVAL_MS.get(interval)
+        # Il delta dipende dall'orologio: record/replay usano sempre il fetch completo
+        if current is not None and len(current) >= limit and step and cassette.mode == "off":
+            last_t = current.last_t
+            missing = int(time.time() * 1000 - last_t) // step + 1
+            if missing < limit:
+                fresh = self.client.get_candles(coin, interval, missing + 1)
+                if not fresh:
+                    return None
+                # Niente buchi tra buffer e delta: altrimenti fetch completo
+                if int(fresh[0]["t"]) <= last_t + step:
+                    buffer = current.resized(current.capacity)
+                    buffer.extend(fresh)
+                    return buffer
+
+        candles = self.client.get_candles(coin, interval, limit)
+        if not candles:
+            return None
+        buffer = CandleBuffer(limit)
+        buffer.extend(candles)
+        return buffer
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        # I contesti degli asset invecchiano in fretta: si salvano solo le candele
+        return {"candles": {key: entry for key, entry in list(self._data.items()) if key[0] != "*"}}
+
+    def restore_checkpoint(self, state: Dict[str, Any]):
+        for key, entry in state["candles"].items():
+            self._data.setdefault(key, entry)
+
+    def _fresh(self, entry, limit: int) -> bool:
+        return (
+            entry is not None
+            and entry["limit"] >= limit
+            and time.time() - entry["fetched_at"] < self.ttl
+        )
+
+    def get_asset_contexts(self) -> List[Dict[str, Any]]:
+        """Contesti di tutti i perp (meta_and_asset_ctxs), una richiesta per TTL"""
+        key = ("*", "asset_ctxs")
+
+        entry = self._data.get(key)
+        if self._fresh(entry, 0):
+            return entry["data"]
+
+        with self._lock_for(key):
+            entry = self._data.get(key)
+            if self._fresh(entry, 0):
+                return entry["data"]
+
+            assets = self.client.get_asset_contexts()
+            if assets:
+                self._data[key] = {"data": assets, "limit": 0, "fetched_at": time.time()}
+            return assets
+
+    def prefetch(self, coins: List[str], interval: str = "1h", limit: int = 100):
+        """Scalda la cache per un insieme di coin (es. l'unione delle coin delle strategie)"""
+        for coin in coins:
+            self.get_candles(coin, interval, limit)
+
+    def invalidate(self):
+        self._data.clear()
+
+
+# Test
+if __name__ == "__main__":
+    store = MarketDataStore()
+
+    start = time.perf_counter()
+    store.get_candles("BTC", "1h", 100)
+    first = time.perf_counter() - start
+
+    start = time.perf_counter()
+    t, ohlcv = store.get_arrays("BTC", "1h", 50)
+    second = time.perf_counter() - start
+
+    print(f"Fetched {len(t)} candles: first {first * 1000:.0f} ms, cached {second * 1000:.3f} ms")
+    print(f"Last close {ohlcv[3, -1]}, zero-copy view: {ohlcv.base is not None}")
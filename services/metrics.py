@@ -0,0 +1,241 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import json
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, Optional, Tuple
+
+from config.settings import settings
+
+
+# Bucket (secondi) per gli istogrammi di latenza
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _NullSpan:
+    """Span vuoto usato quando le metriche sono disabilitate"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    def __init__(self, registry, name: str, upstream: Optional[str], histogram: Optional[str], attrs: Dict[str, Any]):
+        self.registry = registry
+        self.name = name
+        self.upstream = upstream
+        self.histogram = histogram
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        error = exc_type.__name__ if exc_type else None
+        self.registry._finish_span(self, elapsed, error, exc)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Counter, istogrammi e span di timing in memoria.
+    Con enabled=False ogni chiamata ritorna subito senza allocare nulla.
+    """
+
+    def __init__(self, enabled: bool = False, trace_file: str = ""):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, Tuple], float] = {}
+        self._histograms: Dict[Tuple[str, Tuple], list] = {}
+        self._trace = None
+        self._server = None
+
+        if enabled and trace_file:
+            self._trace = open(trace_file, "a", buffering=1, encoding="utf-8")
+
+    # ---------- primitive ----------
+
+    def inc(self, name: str, value: float = 1.0, **labels):
+        """Incrementa un counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Registra un valore in un istogramma"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        idx = bisect_left(DEFAULT_BUCKETS, value)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                # [conteggi per bucket (+Inf in coda), somma, totale]
+                hist = self._histograms[key] = [[0] * (len(DEFAULT_BUCKETS) + 1), 0.0, 0]
+            hist[0][idx] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    # ---------- span ----------
+
+    def span(self, name: str, upstream: Optional[str] = None, histogram: Optional[str] = None, **attrs):
+        """
+        Context manager che misura la durata di un blocco.
+
+        upstream: se valorizzato conta chiamate/errori/429 per quel servizio esterno
+        histogram: nome dell'istogramma (default: span_duration_seconds{span=name})
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, upstream, histogram, attrs)
+
+    def timed(self, name: str, upstream: Optional[str] = None, histogram: Optional[str] = None):
+        """Decoratore equivalente a span()"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with self.span(name, upstream=upstream, histogram=histogram):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish_span(self, span: _Span, elapsed: float, error: Optional[str], exc: Optional[BaseException]):
+        if span.histogram:
+            self.observe(span.histogram, elapsed, **span.attrs)
+        else:
+            self.observe("span_duration_seconds", elapsed, span=span.name)
+
+        if span.upstream:
+            self.inc("upstream_calls_total", upstream=span.upstream)
+            if error:
+                self.inc("upstream_errors_total", upstream=span.upstream)
+                if exc is not None and "429" in str(exc):
+                    self.inc("upstream_rate_limited_total", upstream=span.upstream)
+
+        if self._trace is not None:
+            record = {
+                "ts": span.wall_start,
+                "span": span.name,
+                "duration_ms": round(elapsed * 1000, 3),
+                "error": error,
+            }
+            if span.upstream:
+                record["upstream"] = span.upstream
+            record.update(span.attrs)
+            line = json.dumps(record, default=str)
+            with self._lock:
+                self._trace.write(line + "\n")
+
+    # ---------- export ----------
+
+    def render_prometheus(self) -> str:
+        """Formato testo di Prometheus"""
+        lines = []
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: [list(v[0]), v[1], v[2]] for k, v in self._histograms.items()}
+
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for (name, labels), (buckets, total, count) in sorted(histograms.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            cumulative = 0
+            for bound, bucket_count in zip(DEFAULT_BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, port: int):
+        """Avvia l'endpoint /metrics su localhost in un thread daemon"""
+        if not self.enabled or self._server is not None:
+            return
+
+        registry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = registry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        print(f"[OK] Metrics endpoint on http://127.0.0.1:{port}/metrics")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        if self._trace is not None:
+            self._trace.close()
+            self._trace = None
+
+
+def _format_labels(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{v}"' for k, v in labels)
+    return "{" + inner + "}"
+
+
+metrics = MetricsRegistry(
+    enabled=settings.metrics.enabled,
+    trace_file=settings.metrics.trace_file,
+)
+
+
+# Test
+if __name__ == "__main__":
+    registry = MetricsRegistry(enabled=True)
+
+    for _ in range(3):
+        with registry.span("test.sleep", upstream="local"):
+            time.sleep(0.01)
+
+    try:
+        with registry.span("test.error", upstream="local"):
+            raise RuntimeError("429 Too Many Requests")
+    except RuntimeError:
+        pass
+
+    print(registry.render_prometheus())
@@ -2,18 +2,50 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
+import hashlib
+import json
+import threading
+import time
 import requests
-from datetime import datetime, timezone
-from typing import Dict, Any, List
+from datetime import datetime, timezone, timedelta
+from typing import Dict, Any, List, Optional, Tuple
 from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+from services.circuit_breaker import breakers
+
+
+def _hash(text: str) -> str:
+    return hashlib.sha1(text.strip().lower().encode("utf-8")).hexdigest()
+
+
+def _parse_time(value: str) -> datetime:
+    """ISO 8601 di CryptoPanic -> datetime UTC naive (come il resto del DB)"""
+    if not value:
+        return datetime.utcnow()
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc).replace(tzinfo=None)
 
 
 class NewsService:
-    """Servizio per recuperare news crypto da CryptoPanic."""
+    """
+    Servizio per recuperare news crypto da CryptoPanic.
+    
+    Con NEWS_STORE_ENABLED le news vengono scaricate in modo incrementale
+    (al massimo ogni NEWS_POLL_SECONDS, fermandosi ai post già visti),
+    deduplicate per hash di URL e titolo e salvate con i tag per coin:
+    get_news_summary diventa una lettura indicizzata dal DB.
+    """
     
-    def __init__(self):
+    def __init__(self, use_store: bool = None):
         self.api_key = settings.cryptopanic_api_key
         self.base_url = "https://cryptopanic.com/api/developer/v2"
+        self.use_store = settings.news.store_enabled if use_store is None else use_store
+        self._last_poll = 0.0
+        self._watermark: Optional[datetime] = None
+        # Esito dell'ultimo ingest: con CryptoPanic giù le news dal DB sono stale
+        self._last_ingest_ok: Optional[float] = None
+        self._ingest_error: Optional[str] = None
+        self._lock = threading.Lock()
     
     def get_news(
         self,
@@ -29,46 +61,77 @@ class NewsService:
             filter_type: "rising", "hot", "bullish", "bearish", "important"
             limit: Numero massimo di news
         """
-        
+        return self._get_news(currencies, filter_type, limit)[0]
+    
+    def _get_news(
+        self,
+        currencies: List[str] = None,
+        filter_type: str = None,
+        limit: int = 10
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """News e, se servite dall'ultima risposta buona perché CryptoPanic non risponde, info di staleness"""
         if not self.api_key:
             print("[WARNING] No CryptoPanic API key configured")
-            return []
+            return [], None
+        
+        url = f"{self.base_url}/posts/"
+        params = {"auth_token": self.api_key}
+        
+        if currencies:
+            params["currencies"] = ",".join(currencies)
         
+        if filter_type:
+            params["filter"] = filter_type
+        
+        stale = None
         try:
-            url = f"{self.base_url}/posts/"
-            params = {"auth_token": self.api_key}
-            
-            if currencies:
-                params["currencies"] = ",".join(currencies)
-            
-            if filter_type:
-                params["filter"] = filter_type
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            news_list = []
-            
-            for item in data.get("results", [])[:limit]:
-                votes = item.get("votes", {})
-                
-                news_list.append({
-                    "title": item.get("title", ""),
-                    "source": item.get("source", {}).get("title", "Unknown"),
-                    "url": item.get("url", ""),
-                    "published_at": item.get("published_at", ""),
-                    "sentiment": self._get_sentiment(votes),
-                    "currencies": [c.get("code") for c in item.get("currencies", [])],
-                    "votes_positive": votes.get("positive", 0),
-                    "votes_negative": votes.get("negative", 0)
-                })
-            
-            return news_list
-            
+            data = self._fetch_posts(url, params)
+        except Exception as e:
+            cached = breakers.get("cryptopanic").last_good(self._request_key(params))
+            if cached is None:
+                print(f"[ERROR] Error fetching news: {e}")
+                return [], None
+            data = cached["value"]
+            stale = {"stale": True, "stale_seconds": cached["age_seconds"], "error": str(e)}
+        
+        try:
+            return [self._parse_item(item) for item in data.get("results", [])[:limit]], stale
         except Exception as e:
             print(f"[ERROR] Error fetching news: {e}")
-            return []
+            return [], None
+    
+    def _request_key(self, params: Dict[str, Any]) -> str:
+        # La chiave (cassette e cache del breaker) non include il token
+        return json.dumps({k: v for k, v in params.items() if k != "auth_token"}, sort_keys=True)
+    
+    def _fetch_posts(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """GET /posts/ attraverso il circuit breaker di CryptoPanic (fail fast se aperto)"""
+        request_key = {k: v for k, v in params.items() if k != "auth_token"}
+        with metrics.span("news.posts", upstream="cryptopanic"):
+            return breakers.get("cryptopanic").call(
+                lambda: cassette.call("cryptopanic", "posts", request_key, lambda: self._get_json(url, params)),
+                key=self._request_key(params)
+            )
+    
+    def _parse_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        votes = item.get("votes", {})
+        
+        return {
+            "id": item.get("id"),
+            "title": item.get("title", ""),
+            "source": item.get("source", {}).get("title", "Unknown"),
+            "url": item.get("url", ""),
+            "published_at": item.get("published_at", ""),
+            "sentiment": self._get_sentiment(votes),
+            "currencies": [c.get("code") for c in item.get("currencies", [])],
+            "votes_positive": votes.get("positive", 0),
+            "votes_negative": votes.get("negative", 0)
+        }
+    
+    def _get_json(self, url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        response = requests.get(url, params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()
     
     def _get_sentiment(self, votes: Dict) -> str:
         """Determina il sentiment della news"""
@@ -82,10 +145,229 @@ class NewsService:
         else:
             return "NEUTRAL"
     
+    def ingest(self, force: bool = False) -> int:
+        """
+        Scarica le news uscite dall'ultimo post salvato e le salva nel DB.
+        Le pagine si scaricano senza lock: il lock copre solo il watermark
+        e la scrittura, così le letture non aspettano le chiamate HTTP.
+        Ritorna il numero di post nuovi.
+        """
+        if not self.api_key:
+            return 0
+        
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_poll < settings.news.poll_seconds:
+                return 0
+            self._last_poll = now
+            watermark = self._watermark
+        
+        from sqlalchemy import func
+        from database.connection import SessionLocal
+        from database.models import NewsPost
+        
+        try:
+            if watermark is None:
+                db = SessionLocal()
+                try:
+                    watermark = db.query(func.max(NewsPost.published_at)).scalar()
+                finally:
+                    db.close()
+            
+            url = f"{self.base_url}/posts/"
+            items = []
+            for page in range(1, settings.news.max_pages + 1):
+                params = {"auth_token": self.api_key}
+                if page > 1:
+                    params["page"] = page
+                data = self._fetch_posts(url, params)
+                results = data.get("results", [])
+                items.extend(results)
+                
+                # Pagine ordinate dalla più recente: ci si ferma ai post già visti
+                if not results or not data.get("next"):
+                    break
+                if watermark and _parse_time(results[-1].get("published_at")) <= watermark:
+                    break
+            
+            # Sessione aperta solo per la scrittura: nessuna connessione tenuta durante l'HTTP
+            with self._lock:
+                if self._watermark is None or (watermark and watermark > self._watermark):
+                    self._watermark = watermark
+                db = SessionLocal()
+                try:
+                    inserted = self._store(db, items)
+                except Exception:
+                    db.rollback()
+                    raise
+                finally:
+                    db.close()
+                self._last_ingest_ok = time.time()
+                self._ingest_error = None
+            metrics.inc("news_posts_ingested_total", value=inserted)
+            return inserted
+        
+        except Exception as e:
+            with self._lock:
+                # Con il circuito aperto l'errore è immediato: lo si segnala una volta sola
+                if self._ingest_error is None:
+                    print(f"[ERROR] Error ingesting news: {e}")
+                self._ingest_error = str(e)
+            return 0
+    
+    def _store(self, db, items: List[Dict[str, Any]]) -> int:
+        """Inserisce i post nuovi; per quelli già salvati aggiorna solo voti e sentiment"""
+        from database.models import NewsPost, NewsTag
+        
+        batch = {}
+        titles = set()
+        for item in items:
+            news = self._parse_item(item)
+            if not news["title"]:
+                continue
+            url_hash = _hash(news["url"] or news["title"])
+            title_hash = _hash(news["title"])
+            # Stessa notizia ripubblicata con un altro URL
+            if url_hash in batch or title_hash in titles:
+                continue
+            titles.add(title_hash)
+            batch[url_hash] = (title_hash, news)
+        
+        if not batch:
+            return 0
+        
+        existing = {
+            post.url_hash: post
+            for post in db.query(NewsPost).filter(NewsPost.url_hash.in_(list(batch))).all()
+        }
+        known_titles = {
+            row[0] for row in db.query(NewsPost.title_hash)
+            .filter(NewsPost.title_hash.in_([title_hash for title_hash, _ in batch.values()])).all()
+        }
+        
+        inserted = 0
+        for url_hash, (title_hash, news) in batch.items():
+            post = existing.get(url_hash)
+            if post is not None:
+                if (post.votes_positive, post.votes_negative) != (news["votes_positive"], news["votes_negative"]):
+                    post.votes_positive = news["votes_positive"]
+                    post.votes_negative = news["votes_negative"]
+                    post.sentiment = news["sentiment"]
+                    for tag in post.tags:
+                        tag.sentiment = news["sentiment"]
+                continue
+            if title_hash in known_titles:
+                continue
+            
+            published_at = _parse_time(news["published_at"])
+            db.add(NewsPost(
+                external_id=str(news["id"]) if news["id"] is not None else None,
+                url_hash=url_hash,
+                title_hash=title_hash,
+                title=news["title"][:500],
+                source=news["source"][:100],
+                url=news["url"][:1000] if news["url"] else None,
+                published_at=published_at,
+                sentiment=news["sentiment"],
+                votes_positive=news["votes_positive"],
+                votes_negative=news["votes_negative"],
+                tags=[
+                    NewsTag(coin=coin, published_at=published_at, sentiment=news["sentiment"])
+                    for coin in dict.fromkeys(c for c in news["currencies"] if c)
+                ]
+            ))
+            inserted += 1
+            if self._watermark is None or published_at > self._watermark:
+                self._watermark = published_at
+        
+        db.commit()
+        return inserted
+    
+    def get_sentiment_by_coin(self, currencies: List[str], hours: float = None) -> Dict[str, Dict[str, Any]]:
+        """Conteggi BULLISH/BEARISH/NEUTRAL per coin nella finestra (una query GROUP BY)"""
+        from sqlalchemy import func
+        from database.connection import SessionLocal
+        from database.models import NewsTag
+        
+        since = datetime.utcnow() - timedelta(hours=hours or settings.news.window_hours)
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(NewsTag.coin, NewsTag.sentiment, func.count(NewsTag.id))
+                .filter(NewsTag.coin.in_(currencies), NewsTag.published_at >= since)
+                .group_by(NewsTag.coin, NewsTag.sentiment)
+                .all()
+            )
+        finally:
+            db.close()
+        
+        by_coin = {coin: {"bullish": 0, "bearish": 0, "neutral": 0} for coin in currencies}
+        for coin, sentiment, count in rows:
+            by_coin[coin][sentiment.lower()] = count
+        for counts in by_coin.values():
+            total = counts["bullish"] + counts["bearish"] + counts["neutral"]
+            counts["total"] = total
+            counts["score"] = round((counts["bullish"] - counts["bearish"]) / total, 2) if total else 0.0
+        return by_coin
+    
+    def _get_stored_news(self, currencies: List[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """Ultime news della finestra dal DB (per coin tramite l'indice dei tag)"""
+        from database.connection import SessionLocal
+        from database.models import NewsPost, NewsTag
+        
+        since = datetime.utcnow() - timedelta(hours=settings.news.window_hours)
+        db = SessionLocal()
+        try:
+            query = db.query(NewsPost).filter(NewsPost.published_at >= since)
+            if currencies:
+                tagged = db.query(NewsTag.post_id).filter(
+                    NewsTag.coin.in_(currencies), NewsTag.published_at >= since
+                )
+                query = query.filter(NewsPost.id.in_(tagged))
+            posts = query.order_by(NewsPost.published_at.desc()).limit(limit).all()
+            
+            return [
+                {
+                    "title": post.title,
+                    "source": post.source,
+                    "url": post.url or "",
+                    "published_at": post.published_at.isoformat(),
+                    "sentiment": post.sentiment,
+                    "currencies": [tag.coin for tag in post.tags],
+                    "votes_positive": post.votes_positive,
+                    "votes_negative": post.votes_negative
+                }
+                for post in posts
+            ]
+        finally:
+            db.close()
+    
     def get_news_summary(self, currencies: List[str] = None) -> Dict[str, Any]:
         """Riassunto news per il trading bot."""
-        news = self.get_news(currencies=currencies, limit=10)
+        if self.use_store:
+            try:
+                self.ingest()
+                with metrics.span("news.store_read"):
+                    summary = self._summarize(self._get_stored_news(currencies, limit=10))
+                    if currencies:
+                        summary["by_coin"] = self.get_sentiment_by_coin(currencies)
+                if self._ingest_error:
+                    summary.update({
+                        "stale": True,
+                        "stale_seconds": round(time.time() - self._last_ingest_ok) if self._last_ingest_ok else None,
+                        "error": self._ingest_error
+                    })
+                return summary
+            except Exception as e:
+                print(f"[ERROR] News store unavailable, fetching live: {e}")
         
+        news, stale = self._get_news(currencies=currencies, limit=10)
+        summary = self._summarize(news)
+        if stale:
+            summary.update(stale)
+        return summary
+    
+    def _summarize(self, news: List[Dict[str, Any]]) -> Dict[str, Any]:
         if not news:
             return {
                 "total_news": 0,
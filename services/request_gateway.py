@@ -0,0 +1,246 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+import json
+import threading
+import time
+from typing import Dict, Any, Callable, Optional
+
+from config.settings import settings
+from services.metrics import metrics
+
+
+# Priorità: più basso = più importante
+ORDER = 0
+ACCOUNT = 1
+MARKET = 2
+PRIORITY_NAMES = {ORDER: "order", ACCOUNT: "account", MARKET: "market"}
+
+# Frazione del budget che una priorità non può consumare: resta alle più importanti
+RESERVED_FRACTION = {ORDER: 0.0, ACCOUNT: 0.05, MARKET: 0.15}
+
+# Pesi /info secondo i limiti REST di Hyperliquid (per IP, per minuto)
+INFO_WEIGHTS = {
+    "allMids": 2,
+    "l2Book": 2,
+    "clearinghouseState": 2,
+    "spotClearinghouseState": 2,
+    "orderStatus": 2,
+    "exchangeStatus": 2,
+    "userRole": 60,
+}
+DEFAULT_INFO_WEIGHT = 20
+# candleSnapshot e simili: peso extra ogni 60 elementi restituiti
+ITEMS_PER_EXTRA_WEIGHT = 60
+VARIABLE_WEIGHT_TYPES = {"candleSnapshot", "userFills", "userFillsByTime", "userFunding", "fundingHistory"}
+
+ACCOUNT_TYPES = {
+    "clearinghouseState", "spotClearinghouseState", "openOrders", "frontendOpenOrders",
+    "orderStatus", "userFills", "userFillsByTime", "userFunding", "historicalOrders", "userRateLimit",
+}
+
+# Servite da una cache brevissima: N lookup di prezzo nello stesso istante = un solo allMids
+CACHED_TYPES = {"allMids"}
+
+
+class _Flight:
+    """Richiesta in corso condivisa da tutti i chiamanti con la stessa chiave"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class RequestGateway:
+    """
+    Punto di passaggio unico per le chiamate REST a Hyperliquid.
+
+    Si aggancia al metodo `post` di Info, Exchange e API costruiti dal
+    container, quindi vale per ogni chiamata del processo:
+    - singleflight: richieste /info identiche in corso vengono fatte una volta
+      sola e il risultato è condiviso
+    - allMids servito da una cache di GATEWAY_CACHE_SECONDS, così i prezzi
+      chiesti coin per coin diventano un'unica richiesta
+    - token bucket sul peso delle richieste (GATEWAY_WEIGHT_PER_MINUTE, sotto
+      il limite di 1200 di Hyperliquid) con priorità ordini > stato account >
+      dati di mercato: le priorità basse lasciano una riserva e aspettano se
+      una più alta è in coda
+    - su 429 il bucket viene svuotato e la richiesta ritentata
+    """
+
+    def __init__(self, weight_per_minute: float = None, cache_seconds: float = None, max_retries: int = None):
+        self.capacity = float(settings.gateway.weight_per_minute if weight_per_minute is None else weight_per_minute)
+        self.cache_seconds = settings.gateway.cache_seconds if cache_seconds is None else cache_seconds
+        self.max_retries = settings.gateway.max_retries if max_retries is None else max_retries
+        self.refill_per_second = self.capacity / 60
+
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._waiting = {ORDER: 0, ACCOUNT: 0, MARKET: 0}
+        self._cond = threading.Condition()
+
+        self._inflight: Dict[Any, _Flight] = {}
+        self._cache: Dict[Any, Any] = {}
+        self._lock = threading.Lock()
+
+    # ---------- aggancio ai client ----------
+
+    def wrap(self, api):
+        """Instrada api.post (Info, Exchange, API) attraverso il gateway"""
+        if getattr(api, "_gateway", None) is self:
+            return api
+        post = api.post
+        base_url = api.base_url
+        api.post = lambda url_path, payload=None: self.request(base_url, url_path, payload, post)
+        api._gateway = self
+        return api
+
+    def request(self, base_url: str, url_path: str, payload: Any, post: Callable[[str, Any], Any]):
+        payload = payload or {}
+        if url_path != "/info":
+            return self._send(post, url_path, payload, self._exchange_weight(payload), ORDER)
+
+        request_type = payload.get("type")
+        weight = INFO_WEIGHTS.get(request_type, DEFAULT_INFO_WEIGHT)
+        priority = ACCOUNT if request_type in ACCOUNT_TYPES else MARKET
+        key = (base_url, json.dumps(payload, sort_keys=True))
+
+        if request_type in CACHED_TYPES:
+            with self._lock:
+                cached = self._cache.get(key)
+            if cached is not None and time.monotonic() - cached[0] <= self.cache_seconds:
+                metrics.inc("gateway_cache_hits_total", type=request_type)
+                return cached[1]
+
+        result = self._singleflight(key, request_type, lambda: self._send(post, url_path, payload, weight, priority))
+
+        if request_type in CACHED_TYPES:
+            with self._lock:
+                self._cache[key] = (time.monotonic(), result)
+        elif request_type in VARIABLE_WEIGHT_TYPES and isinstance(result, list):
+            # Peso extra noto solo dalla risposta: addebitato dopo
+            self._debit(len(result) // ITEMS_PER_EXTRA_WEIGHT)
+        return result
+
+    def _exchange_weight(self, payload: Dict[str, Any]) -> int:
+        """Azioni /exchange: 1 + 1 ogni 40 ordini o cancel del batch"""
+        action = payload.get("action", {}) if isinstance(payload, dict) else {}
+        batch = action.get("orders") or action.get("cancels") or []
+        return 1 + len(batch) // 40
+
+    # ---------- singleflight ----------
+
+    def _singleflight(self, key, request_type: str, call: Callable[[], Any]):
+        with self._lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+
+        if not leader:
+            metrics.inc("gateway_coalesced_total", type=request_type)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = call()
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.done.set()
+
+    # ---------- token bucket ----------
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def acquire(self, weight: float, priority: int = MARKET):
+        """Blocca finché il budget permette la richiesta e nessuna priorità più alta è in attesa"""
+        start = time.monotonic()
+        floor = self.capacity * RESERVED_FRACTION[priority]
+        # Una richiesta più pesante del budget passa comunque, a bucket pieno
+        weight = min(weight, self.capacity - floor)
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while True:
+                    self._refill()
+                    blocked = any(self._waiting[p] for p in self._waiting if p < priority)
+                    if not blocked and self._tokens - weight >= floor:
+                        self._tokens -= weight
+                        break
+                    deficit = max(weight + floor - self._tokens, 1)
+                    self._cond.wait(timeout=deficit / self.refill_per_second)
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            metrics.observe("gateway_wait_seconds", waited, priority=PRIORITY_NAMES[priority])
+
+    def _debit(self, weight: float):
+        if weight <= 0:
+            return
+        with self._cond:
+            self._refill()
+            self._tokens -= weight
+
+    def _penalize(self):
+        """429: il server ci vede oltre il limite, si riparte da bucket vuoto"""
+        with self._cond:
+            self._refill()
+            self._tokens = min(self._tokens, 0.0)
+
+    def _send(self, post, url_path: str, payload: Any, weight: float, priority: int):
+        for attempt in range(self.max_retries + 1):
+            self.acquire(weight, priority)
+            try:
+                return post(url_path, payload)
+            except Exception as e:
+                if getattr(e, "status_code", None) != 429 or attempt == self.max_retries:
+                    raise
+                metrics.inc("gateway_throttled_total", priority=PRIORITY_NAMES[priority])
+                self._penalize()
+
+    @property
+    def available(self) -> float:
+        with self._cond:
+            self._refill()
+            return self._tokens
+
+
+# Test
+if __name__ == "__main__":
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+
+    def fake_post(url_path, payload):
+        calls.append(payload["type"])
+        time.sleep(0.05)
+        return {"BTC": "100000", "ETH": "3000"}
+
+    gateway = RequestGateway(weight_per_minute=600, cache_seconds=0.5, max_retries=0)
+    with ThreadPoolExecutor(max_workers=10) as pool:
+        prices = list(pool.map(
+            lambda coin: float(gateway.request("local", "/info", {"type": "allMids"}, fake_post)[coin]),
+            ["BTC", "ETH"] * 5
+        ))
+    print(f"10 price lookups -> {len(calls)} allMids request(s): {prices[:2]}")
+
+    start = time.perf_counter()
+    for _ in range(55):
+        gateway.acquire(10, MARKET)
+    print(f"55 x weight 10 at 600/min took {time.perf_counter() - start:.1f}s, "
+          f"{gateway.available:.0f} tokens left")
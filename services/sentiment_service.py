@@ -2,18 +2,44 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
+import threading
+import time
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Union
+
 import requests
-from typing import Dict, Any
+
+from config.settings import settings
+from services.metrics import metrics
+from services.cassette import cassette
+from services.circuit_breaker import breakers
+
+
+FEAR_GREED = "fear_greed"
 
 
 class SentimentService:
     """
     Servizio per il sentiment macro del mercato crypto.
     Attualmente usa il Fear & Greed Index.
+
+    Con SENTIMENT_STORE_ENABLED la serie storica è salvata nel DB
+    (sentiment_history): backfill completo con una sola richiesta
+    (?limit=0), poi aggiornamenti incrementali al massimo ogni
+    SENTIMENT_POLL_SECONDS. as_of() e join_candles() leggono solo
+    dallo storico locale, senza chiamate API.
     """
 
-    def __init__(self):
+    def __init__(self, use_store: bool = None):
         self.fear_greed_url = "https://api.alternative.me/fng/"
+        self.use_store = settings.sentiment.store_enabled if use_store is None else use_store
+        # Serie in memoria ordinata per timestamp (epoch secondi)
+        self._times: List[int] = []
+        self._points: List[Dict[str, Any]] = []
+        self._loaded = False
+        self._last_poll = 0.0
+        self._lock = threading.Lock()
 
     def get_fear_greed_index(self) -> Dict[str, Any]:
         """
@@ -21,20 +47,35 @@ class SentimentService:
         per uso in trading / AI agent.
         """
         try:
-            response = requests.get(self.fear_greed_url, timeout=10)
-            response.raise_for_status()
+            point = None
+            stale_error = None
+            if self.use_store:
+                try:
+                    self.update()
+                except Exception as e:
+                    # Upstream giù: resta valido l'ultimo punto dello storico, marcato stale
+                    stale_error = str(e)
+                point = self._points[-1] if self._points else None
 
-            fg = response.json()["data"][0]
-            value = int(fg["value"])
+            if point is None:
+                try:
+                    data = self._fetch(None)
+                except Exception as e:
+                    cached = breakers.get("alternative_me").last_good(("fng", None))
+                    if cached is None:
+                        raise
+                    data = cached["value"]
+                    stale_error = str(e)
+                point = self._parse_point(data["data"][0])
 
-            return {
-                "value": value,
-                "classification": fg["value_classification"],
-                "signal": self._fg_signal(value),
-                "score": self._fg_score(value),
-                "bias": self._trading_bias(value),
-                "timestamp": int(fg["timestamp"]),
-            }
+            result = self._format(point)
+            if stale_error:
+                result.update({
+                    "stale": True,
+                    "stale_seconds": round(time.time() - point["timestamp"]),
+                    "error": stale_error,
+                })
+            return result
 
         except Exception as e:
             # Fallback sicuro: il bot non deve mai crashare
@@ -47,6 +88,151 @@ class SentimentService:
                 "error": str(e),
             }
 
+    def _format(self, point: Dict[str, Any]) -> Dict[str, Any]:
+        value = point["value"]
+        return {
+            "value": value,
+            "classification": point["classification"],
+            "signal": self._fg_signal(value),
+            "score": self._fg_score(value),
+            "bias": self._trading_bias(value),
+            "timestamp": point["timestamp"],
+        }
+
+    def _parse_point(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "value": int(item["value"]),
+            "classification": item["value_classification"],
+            "timestamp": int(item["timestamp"]),
+        }
+
+    def _fetch(self, limit: Optional[int]) -> Dict[str, Any]:
+        """limit=None: ultimo valore, limit=0: tutta la serie (fail fast se il circuito è aperto)"""
+        with metrics.span("sentiment.fear_greed", upstream="alternative_me"):
+            return breakers.get("alternative_me").call(
+                lambda: cassette.call("alternative_me", "fng", limit, lambda: self._fetch_fear_greed(limit)),
+                key=("fng", limit)
+            )
+
+    def _fetch_fear_greed(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        params = {"limit": limit} if limit is not None else None
+        response = requests.get(self.fear_greed_url, params=params, timeout=10)
+        response.raise_for_status()
+        return response.json()
+
+    # ---------- storico ----------
+
+    def _load(self):
+        """Carica dal DB la serie salvata (una query all'avvio)"""
+        from database.connection import SessionLocal
+        from database.models import SentimentPoint
+
+        db = SessionLocal()
+        try:
+            rows = (
+                db.query(SentimentPoint)
+                .filter(SentimentPoint.source == FEAR_GREED)
+                .order_by(SentimentPoint.timestamp)
+                .all()
+            )
+        finally:
+            db.close()
+
+        self._points = [
+            {
+                "value": row.value,
+                "classification": row.classification,
+                "timestamp": int((row.timestamp - datetime(1970, 1, 1)).total_seconds()),
+            }
+            for row in rows
+        ]
+        self._times = [p["timestamp"] for p in self._points]
+        self._loaded = True
+
+    def update(self, force: bool = False) -> int:
+        """
+        Backfill completo se lo storico è vuoto, altrimenti solo i giorni mancanti.
+        Ritorna il numero di punti nuovi.
+        """
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+            now = time.time()
+            if not force and self._points and now - self._last_poll < settings.sentiment.poll_seconds:
+                return 0
+            self._last_poll = now
+
+            if self._times:
+                limit = int((now - self._times[-1]) // 86400) + 1
+            else:
+                limit = 0
+
+            data = self._fetch(limit)
+            last = self._times[-1] if self._times else -1
+            new_points = sorted(
+                (p for p in (self._parse_point(item) for item in data.get("data", [])) if p["timestamp"] > last),
+                key=lambda p: p["timestamp"]
+            )
+            if not new_points:
+                return 0
+
+            self._save(new_points)
+            self._points.extend(new_points)
+            self._times.extend(p["timestamp"] for p in new_points)
+            return len(new_points)
+
+    def _save(self, points: List[Dict[str, Any]]):
+        from database.connection import SessionLocal
+        from database.models import SentimentPoint
+
+        db = SessionLocal()
+        try:
+            db.bulk_insert_mappings(SentimentPoint, [
+                {
+                    "source": FEAR_GREED,
+                    "timestamp": datetime.utcfromtimestamp(p["timestamp"]),
+                    "value": p["value"],
+                    "classification": p["classification"],
+                }
+                for p in points
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _ensure_history(self):
+        with self._lock:
+            if not self._loaded:
+                self._load()
+
+    def as_of(self, when: Union[int, float, datetime], lag_seconds: float = 0) -> Optional[Dict[str, Any]]:
+        """
+        Valore in vigore a `when` (epoch secondi o datetime UTC): l'ultimo
+        pubblicato non dopo when - lag_seconds. Nessun look-ahead.
+        """
+        self._ensure_history()
+        if isinstance(when, datetime):
+            when = (when.replace(tzinfo=None) - datetime(1970, 1, 1)).total_seconds()
+        i = bisect_right(self._times, when - lag_seconds) - 1
+        return self._format(self._points[i]) if i >= 0 else None
+
+    def join_candles(self, candles: List[Dict[str, Any]], lag_seconds: float = 0) -> List[Dict[str, Any]]:
+        """
+        As-of join candele / Fear & Greed per backtest e replay:
+        ogni candela (t in ms, formato Hyperliquid) riceve il valore in vigore
+        alla sua apertura in "fear_greed" (None prima dell'inizio della serie).
+        """
+        self._ensure_history()
+        joined = []
+        for candle in candles:
+            i = bisect_right(self._times, int(candle["t"]) / 1000 - lag_seconds) - 1
+            joined.append({**candle, "fear_greed": self._points[i]["value"] if i >= 0 else None})
+        return joined
+
     def _fg_signal(self, value: int) -> str:
         """
         Converte il valore numerico (0–100)
@@ -115,3 +301,12 @@ if __name__ == "__main__":
     print(f"Signal            : {fg['signal']}")
     print(f"Score             : {fg['score']}")
     print(f"Trading Bias      : {fg['bias']}")
+
+    if service.use_store:
+        from services.market_data import MarketDataStore
+
+        candles = service.join_candles(MarketDataStore().get_candles("BTC", "1d", 7))
+        print("\n--- BTC daily candles with point-in-time F&G ---")
+        for candle in candles:
+            day = datetime.utcfromtimestamp(candle["t"] / 1000).strftime("%Y-%m-%d")
+            print(f"{day}  close {float(candle['c']):>10,.2f}  F&G {candle['fear_greed']}")
@@ -2,174 +2,388 @@ import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
+import numpy as np
 import pandas as pd
 import ta
-from typing import Dict, Any
-from services.hyperliquid_client import HyperliquidClient
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+from services.market_data import MarketDataStore
+from services.candle_buffer import OHLCV_FIELDS, resample_ohlcv
+from services.indicator_pool import IndicatorPool
+from services.hyperliquid_client import INTERVAL_MS
+from config.settings import settings
+from services.container import container
+
+
+# Massimo di candele restituite da candles_snapshot
+MAX_CANDLES = 5000
+
+# Serie di candele come viste sul buffer: (t int64 (n,), ohlcv float64 (5, n))
+Series = Tuple[np.ndarray, np.ndarray]
+
+
+def daily_hlc(daily: Optional[Series]) -> Optional[Tuple[float, float, float]]:
+    """High, low, close di ieri per i pivot (o None senza candele daily)"""
+    if daily is None or not len(daily[0]):
+        return None
+    yesterday = -2 if len(daily[0]) > 1 else -1
+    ohlcv = daily[1]
+    return float(ohlcv[1, yesterday]), float(ohlcv[2, yesterday]), float(ohlcv[3, yesterday])
+
+
+@lru_cache(maxsize=None)
+def valid_timeframes(timeframes: Tuple[str, ...]) -> Tuple[str, ...]:
+    """
+    Timeframe utilizzabili insieme, dal più corto: noti all'exchange e multipli
+    del più corto (il resampling richiede bucket allineati). Gli altri vengono
+    scartati con un warning, una volta sola per configurazione.
+    """
+    known = []
+    for tf in dict.fromkeys(timeframes):
+        if tf in INTERVAL_MS:
+            known.append(tf)
+        else:
+            print(f"[WARNING] Unknown timeframe {tf!r} skipped (valid: {', '.join(INTERVAL_MS)})")
+    if not known:
+        return ()
+    
+    known.sort(key=lambda tf: INTERVAL_MS[tf])
+    base = known[0]
+    valid = []
+    for tf in known:
+        if INTERVAL_MS[tf] % INTERVAL_MS[base] == 0:
+            valid.append(tf)
+        else:
+            print(f"[WARNING] Timeframe {tf} is not a multiple of {base}, skipped")
+    return tuple(valid)
+
+
+def timeframe_alignment(results: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Riassunto della confluenza dei trend tra timeframe (dal più corto al più lungo)"""
+    trends = {
+        interval: data["trend"]
+        for interval, data in sorted(results.items(), key=lambda item: INTERVAL_MS[item[0]])
+        if "error" not in data
+    }
+    bullish = sum(1 for trend in trends.values() if trend == "BULLISH")
+    bearish = sum(1 for trend in trends.values() if trend == "BEARISH")
+    
+    if trends and bullish == len(trends):
+        alignment = "ALIGNED_BULLISH"
+    elif trends and bearish == len(trends):
+        alignment = "ALIGNED_BEARISH"
+    elif bullish > bearish:
+        alignment = "MOSTLY_BULLISH"
+    elif bearish > bullish:
+        alignment = "MOSTLY_BEARISH"
+    else:
+        alignment = "MIXED"
+    
+    return {
+        "trends": trends,
+        "rsi": {interval: results[interval]["indicators"]["rsi"]["value"] for interval in trends},
+        "bullish": bullish,
+        "bearish": bearish,
+        "alignment": alignment,
+        "higher_timeframe_trend": list(trends.values())[-1] if trends else None
+    }
 
 
 class TechnicalAnalysisService:
-    def __init__(self):
-        self.client = HyperliquidClient(use_mainnet_for_data=True)
+    def __init__(self, market_data: MarketDataStore = None, pool: IndicatorPool = None):
+        # Store condiviso: più strategie non riscaricano le stesse candele
+        self.market_data = market_data or container.market_data()
+        self.client = self.market_data.client
+        # Calcolo su più processi (INDICATOR_WORKERS=0: tutto nel processo corrente)
+        self.pool = pool or container.indicator_pool()
+        # (coin, interval, limit) -> (impronta ultima candela, risultato)
+        self._cache: Dict[tuple, tuple] = {}
     
     def get_indicators(self, coin: str, interval: str = "1h", limit: int = 100) -> Dict[str, Any]:
         """Calcola tutti gli indicatori tecnici per una coin"""
+        return self.get_indicators_many([coin], interval, limit)[coin]
+    
+    def get_indicators_many(self, coins: List[str], interval: str = "1h", limit: int = 100) -> Dict[str, Dict[str, Any]]:
+        """
+        Indicatori per più coin: le candele si scaricano qui, il calcolo
+        viene distribuito sul pool di processi (una coin per task).
+        """
+        series = {}
+        daily = {}
+        for coin in coins:
+            series[coin] = self.market_data.get_arrays(coin, interval, limit)
+            if len(series[coin][0]):
+                daily[coin] = self.market_data.get_arrays(coin, "1d", 2)
         
-        # Prendi candele
-        candles = self.client.get_candles(coin, interval, limit)
-        
-        if not candles:
-            return {"error": "No candles data"}
-        
-        # Converti in DataFrame
-        df = pd.DataFrame(candles)
-        df['o'] = df['o'].astype(float)
-        df['h'] = df['h'].astype(float)
-        df['l'] = df['l'].astype(float)
-        df['c'] = df['c'].astype(float)
-        df['v'] = df['v'].astype(float)
-        
-        # Calcola indicatori
-        result = {
-            "coin": coin,
-            "interval": interval,
-            "price": float(df['c'].iloc[-1]),
-            "indicators": {}
-        }
+        return self._compute(series, daily, interval, limit)
+    
+    def get_market_indicators(self, coins: List[str], interval: str = "1h", limit: int = 100) -> Dict[str, Dict[str, Any]]:
+        """
+        Indicatori per il context: quelli di `interval` e, se MTF_TIMEFRAMES
+        è impostato, la confluenza tra timeframe nella chiave "timeframes".
+        """
+        timeframes = settings.trading.mtf_timeframes
+        if not timeframes:
+            return self.get_indicators_many(coins, interval, limit)
         
-        # RSI (14)
-        rsi = ta.momentum.RSIIndicator(df['c'], window=14)
-        rsi_value = rsi.rsi().iloc[-1]
-        result["indicators"]["rsi"] = {
-            "value": round(rsi_value, 2),
-            "signal": self._rsi_signal(rsi_value)
-        }
+        # Se il timeframe principale viene scartato si torna agli indicatori semplici
+        timeframes = list(valid_timeframes(tuple(timeframes + [interval])))
+        if interval not in timeframes:
+            return self.get_indicators_many(coins, interval, limit)
         
-        # MACD
-        macd = ta.trend.MACD(df['c'])
-        macd_line = macd.macd().iloc[-1]
-        signal_line = macd.macd_signal().iloc[-1]
-        result["indicators"]["macd"] = {
-            "macd": round(macd_line, 2),
-            "signal": round(signal_line, 2),
-            "histogram": round(macd_line - signal_line, 2),
-            "trend": "BULLISH" if macd_line > signal_line else "BEARISH"
-        }
+        results = {}
+        for coin, data in self.get_multi_timeframe(coins, timeframes, limit).items():
+            primary = data["timeframes"][interval]
+            results[coin] = primary if "error" in primary else {**primary, "timeframes": data["alignment"]}
+        return results
+    
+    def get_multi_timeframe(self, coins: List[str], timeframes: List[str], limit: int = 100) -> Dict[str, Dict[str, Any]]:
+        """
+        Indicatori su più timeframe per coin, con una sola richiesta di candele
+        (il timeframe più fine): gli altri si ottengono per resampling in memoria.
+        Ritorna coin -> {"timeframes": {interval: indicatori}, "alignment": {...}}.
         
-        # Bollinger Bands
-        bb = ta.volatility.BollingerBands(df['c'], window=20, window_dev=2)
-        bb_upper = bb.bollinger_hband().iloc[-1]
-        bb_lower = bb.bollinger_lband().iloc[-1]
-        bb_middle = bb.bollinger_mavg().iloc[-1]
-        price = float(df['c'].iloc[-1])
+        Un timeframe che richiederebbe più di MAX_CANDLES candele base
+        viene scaricato a parte (sempre tramite lo store condiviso).
+        """
+        timeframes = list(valid_timeframes(tuple(timeframes)))
+        if not timeframes:
+            return {coin: {"timeframes": {}, "alignment": timeframe_alignment({})} for coin in coins}
+        base = timeframes[0]
         
-        # Posizione nel canale (0 = lower, 1 = upper)
-        bb_position = (price - bb_lower) / (bb_upper - bb_lower) if (bb_upper - bb_lower) > 0 else 0.5
+        # Candele base necessarie per `limit` barre complete di ogni timeframe (+1 in corso)
+        needed = {tf: (limit + 1) * INTERVAL_MS[tf] // INTERVAL_MS[base] for tf in timeframes}
+        resampled = [tf for tf in timeframes if needed[tf] <= MAX_CANDLES]
+        base_limit = max([limit] + [needed[tf] for tf in resampled])
         
-        result["indicators"]["bollinger"] = {
-            "upper": round(bb_upper, 2),
-            "middle": round(bb_middle, 2),
-            "lower": round(bb_lower, 2),
-            "position": round(bb_position, 2)
-        }
+        series = {tf: {} for tf in timeframes}
+        daily = {}
+        for coin in coins:
+            t, ohlcv = self.market_data.get_arrays(coin, base, base_limit)
+            
+            for tf in timeframes:
+                if tf == base:
+                    series[tf][coin] = (t[-limit:], ohlcv[:, -limit:])
+                elif tf in resampled:
+                    bar_t, bars = resample_ohlcv(t, ohlcv, INTERVAL_MS[base], INTERVAL_MS[tf])
+                    series[tf][coin] = (bar_t[-limit:], bars[:, -limit:])
+                else:
+                    series[tf][coin] = self.market_data.get_arrays(coin, tf, limit)
+            
+            # Pivot dal daily già disponibile, altrimenti come get_indicators
+            if "1d" in series and len(series["1d"][coin][0]):
+                daily_t, daily_ohlcv = series["1d"][coin]
+                daily[coin] = (daily_t[-2:], daily_ohlcv[:, -2:])
+            elif len(t):
+                daily[coin] = self.market_data.get_arrays(coin, "1d", 2)
         
-        # EMA
-        ema_20 = ta.trend.EMAIndicator(df['c'], window=20).ema_indicator().iloc[-1]
-        ema_50 = ta.trend.EMAIndicator(df['c'], window=50).ema_indicator().iloc[-1]
-        result["indicators"]["ema"] = {
-            "ema_20": round(ema_20, 2),
-            "ema_50": round(ema_50, 2),
-            "trend": "BULLISH" if price > ema_20 > ema_50 else "BEARISH" if price < ema_20 < ema_50 else "NEUTRAL"
-        }
+        by_timeframe = {tf: self._compute(series[tf], daily, tf, limit) for tf in timeframes}
         
-        # ATR (volatilità)
-        atr = ta.volatility.AverageTrueRange(df['h'], df['l'], df['c'], window=14)
-        atr_value = atr.average_true_range().iloc[-1]
-        atr_pct = (atr_value / price) * 100
-        result["indicators"]["atr"] = {
-            "value": round(atr_value, 2),
-            "percent": round(atr_pct, 2),
-            "volatility": "HIGH" if atr_pct > 3 else "MEDIUM" if atr_pct > 1.5 else "LOW"
-        }
+        results = {}
+        for coin in coins:
+            per_coin = {tf: by_timeframe[tf][coin] for tf in timeframes}
+            results[coin] = {"timeframes": per_coin, "alignment": timeframe_alignment(per_coin)}
+        return results
+    
+    def _compute(self, series: Dict[str, Series], daily: Dict[str, Series],
+                 interval: str, limit: int) -> Dict[str, Dict[str, Any]]:
+        """Calcola (sul pool) gli indicatori delle coin le cui candele non sono già in cache"""
+        results = {}
+        jobs = {}
         
-        # Pivot Points (dal daily)
-        daily_candles = self.client.get_candles(coin, "1d", 2)
-        if daily_candles:
-            yesterday = daily_candles[-2] if len(daily_candles) > 1 else daily_candles[-1]
-            h = float(yesterday['h'])
-            l = float(yesterday['l'])
-            c = float(yesterday['c'])
+        for coin, (t, ohlcv) in series.items():
+            if not len(t):
+                results[coin] = {"error": "No candles data"}
+                continue
             
-            pivot = (h + l + c) / 3
-            r1 = 2 * pivot - l
-            s1 = 2 * pivot - h
-            r2 = pivot + (h - l)
-            s2 = pivot - (h - l)
+            # Stesse candele già analizzate (es. da un'altra strategia): riusa il risultato
+            daily_series = daily.get(coin)
+            fingerprint = (
+                int(t[-1]), float(ohlcv[3, -1]), float(ohlcv[4, -1]), len(t),
+                int(daily_series[0][-1]) if daily_series is not None and len(daily_series[0]) else None
+            )
+            cached = self._cache.get((coin, interval, limit))
+            if cached and cached[0] == fingerprint:
+                results[coin] = cached[1]
+                continue
             
-            result["indicators"]["pivots"] = {
-                "pivot": round(pivot, 2),
-                "r1": round(r1, 2),
-                "r2": round(r2, 2),
-                "s1": round(s1, 2),
-                "s2": round(s2, 2),
-                "position": self._pivot_position(price, pivot, r1, s1)
-            }
+            # Vista sul buffer: il pool la copia in shared memory, inline si usa così com'è
+            jobs[coin] = (fingerprint, ohlcv, daily_hlc(daily_series))
         
-        # Trend complessivo
-        result["trend"] = self._calculate_trend(result["indicators"])
+        if jobs:
+            computed = self.pool.map(
+                compute_indicators,
+                {coin: (ohlcv, daily_data) for coin, (_, ohlcv, daily_data) in jobs.items()},
+                interval
+            )
+            for coin, result in computed.items():
+                results[coin] = result
+                if "error" not in result:
+                    self._cache[(coin, interval, limit)] = (jobs[coin][0], result)
         
-        return result
-    
-    def _rsi_signal(self, rsi: float) -> str:
-        if rsi >= 70:
-            return "OVERBOUGHT"
-        elif rsi <= 30:
-            return "OVERSOLD"
-        elif rsi >= 60:
-            return "BULLISH"
-        elif rsi <= 40:
-            return "BEARISH"
-        return "NEUTRAL"
-    
-    def _pivot_position(self, price: float, pivot: float, r1: float, s1: float) -> str:
-        if price > r1:
-            return "ABOVE_R1"
-        elif price > pivot:
-            return "BETWEEN_P_R1"
-        elif price > s1:
-            return "BETWEEN_S1_P"
-        else:
-            return "BELOW_S1"
+        return {coin: results[coin] for coin in series}
     
-    def _calculate_trend(self, indicators: dict) -> str:
-        bullish = 0
-        bearish = 0
-        
-        # RSI
-        rsi_signal = indicators.get("rsi", {}).get("signal", "")
-        if rsi_signal in ["BULLISH", "OVERSOLD"]:
-            bullish += 1
-        elif rsi_signal in ["BEARISH", "OVERBOUGHT"]:
-            bearish += 1
-        
-        # MACD
-        if indicators.get("macd", {}).get("trend") == "BULLISH":
-            bullish += 1
-        else:
-            bearish += 1
+    def checkpoint_state(self) -> Dict[str, Any]:
+        return {"cache": dict(self._cache)}
+    
+    def restore_checkpoint(self, state: Dict[str, Any]):
+        for key, value in state["cache"].items():
+            self._cache.setdefault(key, value)
+
+
+def compute_indicators(
+    coin: str,
+    interval: str,
+    ohlcv: np.ndarray,
+    daily: Optional[Tuple[float, float, float]] = None
+) -> Dict[str, Any]:
+    """
+    Calcolo puro degli indicatori da un array (5, n) o, h, l, c, v.
+    Nessun I/O: può girare in un processo worker del pool.
+    """
+    # Una Series per campo sopra le righe dell'array, senza copie (niente DataFrame)
+    df = {field: pd.Series(ohlcv[row], copy=False) for row, field in enumerate(OHLCV_FIELDS)}
+    
+    # Calcola indicatori
+    result = {
+        "coin": coin,
+        "interval": interval,
+        "price": float(df['c'].iloc[-1]),
+        "indicators": {}
+    }
+    
+    # RSI (14)
+    rsi = ta.momentum.RSIIndicator(df['c'], window=14)
+    rsi_value = rsi.rsi().iloc[-1]
+    result["indicators"]["rsi"] = {
+        "value": round(rsi_value, 2),
+        "signal": _rsi_signal(rsi_value)
+    }
+    
+    # MACD
+    macd = ta.trend.MACD(df['c'])
+    macd_line = macd.macd().iloc[-1]
+    signal_line = macd.macd_signal().iloc[-1]
+    result["indicators"]["macd"] = {
+        "macd": round(macd_line, 2),
+        "signal": round(signal_line, 2),
+        "histogram": round(macd_line - signal_line, 2),
+        "trend": "BULLISH" if macd_line > signal_line else "BEARISH"
+    }
+    
+    # Bollinger Bands
+    bb = ta.volatility.BollingerBands(df['c'], window=20, window_dev=2)
+    bb_upper = bb.bollinger_hband().iloc[-1]
+    bb_lower = bb.bollinger_lband().iloc[-1]
+    bb_middle = bb.bollinger_mavg().iloc[-1]
+    price = float(df['c'].iloc[-1])
+    
+    # Posizione nel canale (0 = lower, 1 = upper)
+    bb_position = (price - bb_lower) / (bb_upper - bb_lower) if (bb_upper - bb_lower) > 0 else 0.5
+    
+    result["indicators"]["bollinger"] = {
+        "upper": round(bb_upper, 2),
+        "middle": round(bb_middle, 2),
+        "lower": round(bb_lower, 2),
+        "position": round(bb_position, 2)
+    }
+    
+    # EMA
+    ema_20 = ta.trend.EMAIndicator(df['c'], window=20).ema_indicator().iloc[-1]
+    ema_50 = ta.trend.EMAIndicator(df['c'], window=50).ema_indicator().iloc[-1]
+    result["indicators"]["ema"] = {
+        "ema_20": round(ema_20, 2),
+        "ema_50": round(ema_50, 2),
+        "trend": "BULLISH" if price > ema_20 > ema_50 else "BEARISH" if price < ema_20 < ema_50 else "NEUTRAL"
+    }
+    
+    # ATR (volatilità)
+    atr = ta.volatility.AverageTrueRange(df['h'], df['l'], df['c'], window=14)
+    atr_value = atr.average_true_range().iloc[-1]
+    atr_pct = (atr_value / price) * 100
+    result["indicators"]["atr"] = {
+        "value": round(atr_value, 2),
+        "percent": round(atr_pct, 2),
+        "volatility": "HIGH" if atr_pct > 3 else "MEDIUM" if atr_pct > 1.5 else "LOW"
+    }
+    
+    # Pivot Points (dal daily)
+    if daily:
+        h, l, c = daily
         
-        # EMA
-        ema_trend = indicators.get("ema", {}).get("trend", "")
-        if ema_trend == "BULLISH":
-            bullish += 1
-        elif ema_trend == "BEARISH":
-            bearish += 1
+        pivot = (h + l + c) / 3
+        r1 = 2 * pivot - l
+        s1 = 2 * pivot - h
+        r2 = pivot + (h - l)
+        s2 = pivot - (h - l)
         
-        if bullish > bearish:
-            return "BULLISH"
-        elif bearish > bullish:
-            return "BEARISH"
-        return "NEUTRAL"
+        result["indicators"]["pivots"] = {
+            "pivot": round(pivot, 2),
+            "r1": round(r1, 2),
+            "r2": round(r2, 2),
+            "s1": round(s1, 2),
+            "s2": round(s2, 2),
+            "position": _pivot_position(price, pivot, r1, s1)
+        }
+    
+    # Trend complessivo
+    result["trend"] = _calculate_trend(result["indicators"])
+    
+    return result
+
+
+def _rsi_signal(rsi: float) -> str:
+    if rsi >= 70:
+        return "OVERBOUGHT"
+    elif rsi <= 30:
+        return "OVERSOLD"
+    elif rsi >= 60:
+        return "BULLISH"
+    elif rsi <= 40:
+        return "BEARISH"
+    return "NEUTRAL"
+
+
+def _pivot_position(price: float, pivot: float, r1: float, s1: float) -> str:
+    if price > r1:
+        return "ABOVE_R1"
+    elif price > pivot:
+        return "BETWEEN_P_R1"
+    elif price > s1:
+        return "BETWEEN_S1_P"
+    else:
+        return "BELOW_S1"
+
+
+def _calculate_trend(indicators: dict) -> str:
+    bullish = 0
+    bearish = 0
+    
+    # RSI
+    rsi_signal = indicators.get("rsi", {}).get("signal", "")
+    if rsi_signal in ["BULLISH", "OVERSOLD"]:
+        bullish += 1
+    elif rsi_signal in ["BEARISH", "OVERBOUGHT"]:
+        bearish += 1
+    
+    # MACD
+    if indicators.get("macd", {}).get("trend") == "BULLISH":
+        bullish += 1
+    else:
+        bearish += 1
+    
+    # EMA
+    ema_trend = indicators.get("ema", {}).get("trend", "")
+    if ema_trend == "BULLISH":
+        bullish += 1
+    elif ema_trend == "BEARISH":
+        bearish += 1
+    
+    if bullish > bearish:
+        return "BULLISH"
+    elif bearish > bullish:
+        return "BEARISH"
+    return "NEUTRAL"
 
 
 # Test
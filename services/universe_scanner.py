@@ -0,0 +1,174 @@
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from collections import deque
+from typing import Dict, Any, List, Iterable
+
+import numpy as np
+
+from config.settings import settings
+from services.market_data import MarketDataStore
+from services.metrics import metrics
+from services.container import container
+
+
+# Peso di ogni componente nello score finale
+WEIGHTS = {
+    "momentum": 0.35,
+    "volatility": 0.25,
+    "funding": 0.20,
+    "liquidity": 0.20,
+}
+
+
+def _zscore(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    if std == 0 or not np.isfinite(std):
+        return np.zeros_like(values)
+    return (values - values.mean()) / std
+
+
+class UniverseScanner:
+    """
+    Selezione delle coin da analizzare tra tutti i perp di Hyperliquid.
+
+    Una sola richiesta (meta_and_asset_ctxs, condivisa tramite lo store)
+    e score vettoriali con NumPy su tutto l'universo:
+    - momentum: |z| del rendimento 24h
+    - volatilità: deviazione dei rendimenti tra le ultime scansioni
+      (|rendimento 24h| finché lo storico è corto)
+    - funding: |z| del funding, gli estremi segnalano posizionamento affollato
+    - liquidità: z del log volume 24h, sopra le soglie minime di volume,
+      open interest e spread d'impatto
+    """
+
+    def __init__(self, market_data: MarketDataStore = None, top_k: int = None):
+        self.market_data = market_data or container.market_data()
+        self.top_k = settings.universe.top_k if top_k is None else top_k
+        # Mark price delle ultime scansioni: (coin, prezzi)
+        self._history = deque(maxlen=settings.universe.history_size)
+        self._last_assets = None
+        self.last_scan: List[Dict[str, Any]] = []
+
+    @metrics.timed("universe.scan")
+    def scan(self) -> List[Dict[str, Any]]:
+        """Tutte le coin idonee ordinate per score decrescente"""
+        assets = self.market_data.get_asset_contexts()
+        if not assets:
+            return []
+
+        coins = np.array([a["coin"] for a in assets])
+        mark = np.array([a["mark_price"] for a in assets])
+        prev = np.array([a["prev_day_price"] for a in assets])
+        funding = np.array([a["funding"] for a in assets])
+        volume = np.array([a["day_volume_usd"] for a in assets])
+        oi_usd = np.array([a["open_interest"] for a in assets]) * mark
+        delisted = np.array([bool(a["delisted"]) for a in assets])
+        impact_spread = np.array([
+            (a["impact_prices"][1] - a["impact_prices"][0]) / a["mark_price"] * 100
+            if len(a["impact_prices"]) == 2 and a["mark_price"] > 0 else 0.0
+            for a in assets
+        ])
+
+        # Stesso snapshot dello store (es. più bot nello stesso ciclo): non è un nuovo campione
+        if assets is not self._last_assets:
+            self._history.append((tuple(coins), mark.copy()))
+            self._last_assets = assets
+
+        eligible = (
+            ~delisted
+            & (mark > 0)
+            & (prev > 0)
+            & (volume >= settings.universe.min_volume_usd)
+            & (oi_usd >= settings.universe.min_open_interest_usd)
+            & (impact_spread <= settings.universe.max_impact_spread_pct)
+        )
+        if not eligible.any():
+            return []
+
+        index = np.flatnonzero(eligible)
+        returns = mark[index] / prev[index] - 1
+        volatility = self._volatility(coins, index, returns)
+
+        components = {
+            "momentum": np.abs(_zscore(returns)),
+            "volatility": _zscore(volatility),
+            "funding": np.abs(_zscore(funding[index])),
+            "liquidity": _zscore(np.log1p(volume[index])),
+        }
+        score = sum(WEIGHTS[name] * values for name, values in components.items())
+
+        ranked = []
+        for rank in np.argsort(-score):
+            i = index[rank]
+            ranked.append({
+                "coin": str(coins[i]),
+                "score": round(float(score[rank]), 3),
+                "return_24h_pct": round(float(returns[rank]) * 100, 2),
+                "funding": float(funding[i]),
+                "volume_usd": round(float(volume[i]), 0),
+                "open_interest_usd": round(float(oi_usd[i]), 0),
+                "components": {name: round(float(values[rank]), 3) for name, values in components.items()},
+            })
+
+        self.last_scan = ranked
+        return ranked
+
+    def checkpoint_state(self) -> Dict[str, Any]:
+        return {"history": list(self._history)}
+
+    def restore_checkpoint(self, state: Dict[str, Any]):
+        self._history.extend(state["history"])
+
+    def _volatility(self, coins: np.ndarray, index: np.ndarray, returns: np.ndarray) -> np.ndarray:
+        """Deviazione standard dei log-rendimenti tra le scansioni salvate"""
+        if len(self._history) < 3:
+            return np.abs(returns)
+
+        current = tuple(coins)
+        if all(names == current for names, _ in self._history):
+            prices = np.vstack([p for _, p in self._history])[:, index]
+        else:
+            # L'universo è cambiato (nuovi listing): riallinea per nome
+            wanted = coins[index]
+            prices = np.vstack([
+                np.array([lookup.get(coin, np.nan) for coin in wanted])
+                for lookup in (dict(zip(names, p)) for names, p in self._history)
+            ])
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            log_returns = np.diff(np.log(prices), axis=0)
+        volatility = np.nanstd(log_returns, axis=0)
+        return np.where(np.isfinite(volatility), volatility, np.abs(returns))
+
+    def select(self, pinned: Iterable[str] = ()) -> List[str]:
+        """
+        Coin per l'analisi del ciclo: le pinned (es. posizioni aperte) più
+        le prime top_k dello scan. Se lo scan fallisce usa TRADING_COINS.
+        """
+        pinned = list(dict.fromkeys(pinned))
+        ranked = self.scan()
+        if not ranked:
+            return list(dict.fromkeys(pinned + settings.trading.trading_coins))
+
+        selected = [item["coin"] for item in ranked if item["coin"] not in pinned][:self.top_k]
+        return pinned + selected
+
+
+# Test
+if __name__ == "__main__":
+    import time
+
+    scanner = UniverseScanner()
+
+    start = time.perf_counter()
+    ranked = scanner.scan()
+    elapsed = time.perf_counter() - start
+
+    print(f"=== Universe Scan: {len(ranked)} eligible perps in {elapsed * 1000:.0f} ms ===\n")
+    for item in ranked[:10]:
+        print(f"{item['coin']:>8}  score {item['score']:>6}  24h {item['return_24h_pct']:>6}%  "
+              f"funding {item['funding']:.6f}  vol ${item['volume_usd']:,.0f}")
+
+    print("\nSelected:", scanner.select(pinned=["BTC"]))
@@ -0,0 +1,206 @@
+import os
+import json
+import time
+from typing import Dict, Any, List
+
+from config.settings import settings
+from execution.executor import TradingExecutor
+from execution.risk_engine import RiskEngine
+from services.context_builder import ContextBuilder
+from services.container import container
+from services.metrics import metrics
+from services.cassette import cassette
+from main import TradingBot
+
+
+RISK_KEYS = ("max_position_size_pct", "max_total_exposure_pct", "max_daily_loss_pct", "default_leverage")
+
+
+def load_strategies(path: str = None) -> List[Dict[str, Any]]:
+    """
+    Legge le strategie da un file JSON, ad esempio:
+
+    [
+      {
+        "name": "majors",
+        "account_address": "0x...",
+        "private_key_env": "HL_PRIVATE_KEY_MAJORS",
+        "vault_address": null,
+        "coins": ["BTC", "ETH"],
+        "auto_execute": false,
+        "risk": {"max_position_size_pct": 10, "max_total_exposure_pct": 30, "max_daily_loss_pct": 3, "default_leverage": 2}
+      }
+    ]
+
+    La chiave privata non sta nel file: private_key_env è il nome della variabile d'ambiente.
+    """
+    path = path or settings.trading.strategies_file
+    with open(path, encoding="utf-8") as f:
+        strategies = json.load(f)
+
+    names = set()
+    accounts = set()
+    for strategy in strategies:
+        name = strategy.get("name")
+        if not name or name in names:
+            raise ValueError(f"Strategy name missing or duplicated: {name}")
+        names.add(name)
+
+        # Isolamento: due strategie sullo stesso account si contenderebbero posizioni e SL/TP
+        account = (strategy.get("vault_address") or strategy.get("account_address") or "").lower()
+        if not account or account in accounts:
+            raise ValueError(f"Strategy '{name}' needs its own account_address or vault_address")
+        accounts.add(account)
+
+        unknown = set(strategy.get("risk", {})) - set(RISK_KEYS)
+        if unknown:
+            raise ValueError(f"Strategy '{name}' has unknown risk params: {sorted(unknown)}")
+
+    return strategies
+
+
+class StrategyRunner:
+    """
+    Esegue N strategie nello stesso processo.
+
+    Dati di mercato, indicatori, sentiment e news sono condivisi (una sola
+    richiesta per coin/intervallo per ciclo, qualunque sia il numero di
+    strategie). Account, executor, risk engine, logger e monitor sono
+    invece separati per strategia, e l'errore di una non ferma le altre.
+    """
+
+    def __init__(self, strategies: List[Dict[str, Any]]):
+        print(f"🧭 Initializing {len(strategies)} strategies on a shared market-data plane...")
+
+        # Piano dati condiviso (dal container del processo)
+        self.market_data = container.market_data()
+        self.ta_service = container.ta_service()
+        self.sentiment_service = container.sentiment_service()
+        self.news_service = container.news_service()
+        self.derivatives = container.derivatives()
+        # Strategie senza coin nel file: top-K dello scanner (una scansione condivisa)
+        self.scanner = container.universe_scanner() if settings.universe.enabled else None
+
+        self.strategies = strategies
+        self.bots: Dict[str, TradingBot] = {}
+        for strategy in strategies:
+            self.bots[strategy["name"]] = self._build_bot(strategy)
+
+        self.running = False
+
+        if settings.metrics.enabled:
+            metrics.start_server(settings.metrics.port)
+
+    def _build_bot(self, strategy: Dict[str, Any]) -> TradingBot:
+        risk_params = {
+            "max_position_size_pct": settings.trading.max_position_size_pct,
+            "max_total_exposure_pct": settings.trading.max_total_exposure_pct,
+            "max_daily_loss_pct": settings.trading.max_daily_loss_pct,
+            "default_leverage": settings.trading.default_leverage,
+        }
+        risk_params.update(strategy.get("risk", {}))
+
+        risk = RiskEngine(
+            max_position_pct=risk_params["max_position_size_pct"],
+            max_exposure_pct=risk_params["max_total_exposure_pct"],
+            max_daily_loss_pct=risk_params["max_daily_loss_pct"],
+        )
+
+        key_env = strategy.get("private_key_env")
+        executor = TradingExecutor(
+            account_address=strategy["account_address"],
+            private_key=os.getenv(key_env, "") if key_env else "",
+            vault_address=strategy.get("vault_address"),
+            risk=risk,
+            default_leverage=int(risk_params["default_leverage"]),
+        )
+
+        context_builder = ContextBuilder(
+            account_state=executor.account_state,
+            ta_service=self.ta_service,
+            sentiment_service=self.sentiment_service,
+            news_service=self.news_service,
+            risk_params=risk_params,
+            derivatives=self.derivatives,
+        )
+
+        coins = strategy.get("coins")
+        return TradingBot(
+            executor=executor,
+            context_builder=context_builder,
+            coins=coins or settings.trading.trading_coins,
+            name=strategy["name"],
+            scanner=self.scanner if not coins else None,
+        )
+
+    def run_cycle(self):
+        """Un ciclo per tutte le strategie, con il piano dati scaldato una volta sola"""
+        try:
+            all_coins = {coin for bot in self.bots.values() if not bot.scanner for coin in bot.coins}
+            if self.scanner:
+                all_coins.update(self.scanner.select())
+            all_coins = sorted(all_coins)
+            # Candele e indicatori per l'unione delle coin: le strategie leggono dalla cache
+            with metrics.span("runner.prefetch"):
+                self.ta_service.get_market_indicators(all_coins, "1h", 100)
+        except Exception as e:
+            # Senza prefetch ogni strategia scarica da sé: il ciclo prosegue
+            metrics.inc("runner_prefetch_errors_total")
+            print(f"\n❌ Prefetch failed: {e}")
+
+        for strategy in self.strategies:
+            bot = self.bots[strategy["name"]]
+            try:
+                with metrics.span("runner.strategy", strategy=strategy["name"]):
+                    bot.run_once(auto_execute=strategy.get("auto_execute", False), interactive=False)
+            except Exception as e:
+                metrics.inc("runner_strategy_errors_total", strategy=strategy["name"])
+                print(f"\n❌ Strategy [{strategy['name']}] failed: {e}")
+
+    def run_loop(self, interval_minutes: int = 60):
+        print("\n" + "=" * 50)
+        print(f"🔄 STARTING MULTI-STRATEGY LOOP ({len(self.bots)} strategies)")
+        print(f"   Interval: {interval_minutes} minutes")
+        print("   Press Ctrl+C to stop")
+        print("=" * 50)
+
+        self.running = True
+        checkpoint = container.checkpoint()
+        for name, bot in self.bots.items():
+            checkpoint.register(f"bot:{name}", bot)
+
+        if settings.monitor.enabled:
+            for bot in self.bots.values():
+                bot.monitor.start()
+
+        while self.running:
+            try:
+                try:
+                    self.run_cycle()
+                    checkpoint.maybe_save()
+                except Exception as e:
+                    # Un errore del ciclo non ferma monitor e algo: si riprova al prossimo intervallo
+                    metrics.inc("runner_cycle_errors_total")
+                    print(f"\n❌ Cycle failed: {e}")
+
+                print(f"\n⏳ Next cycle in {interval_minutes} minutes...")
+                cassette.sleep(interval_minutes * 60)
+
+            except KeyboardInterrupt:
+                print("\n\n🛑 Stopping runner...")
+                self.running = False
+
+        for bot in self.bots.values():
+            bot.monitor.stop()
+            bot.executor.algos.shutdown()
+            bot.logger.close()
+        container.shutdown()
+        metrics.close()
+        cassette.close()
+        print("👋 Runner stopped")
+
+
+if __name__ == "__main__":
+    runner = StrategyRunner(load_strategies())
+    interval = input("Interval in minutes (default 60): ").strip()
+    runner.run_loop(interval_minutes=int(interval) if interval else 60)